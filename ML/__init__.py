@@ -1 +1,12 @@
-from .main import get_all_articles
+from .jobs import (
+    JobPool,
+    JobQueueFullError,
+    default_num_workers,
+    init_job_worker,
+    job_worker_initargs,
+)
+from .main import YT2T, find_cached_articles, get_all_articles
+from .metrics import start_metrics_server
+from .video_info import VideoInfo, get_video_info
+from .workspace import Workspace
+from .yt2t import Segment, Transcript
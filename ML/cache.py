@@ -0,0 +1,240 @@
+import hashlib
+import logging
+import os
+import pickle
+import shutil
+import tempfile
+import time
+
+logger = logging.getLogger(__name__)
+
+# При превышении max_bytes записи удаляются до этой доли max_bytes, чтобы
+# следующие записи не вызывали обход кэша каждая
+EVICT_LOW_WATER = 0.9
+
+
+class ResultCache:
+    """
+    Дисковый кэш результатов конвейера (транскрипты, переписанные параграфы,
+    готовые docx файлы).
+
+    Записи адресуются хэшем от частей ключа (id видео, модели, ограничения).
+    Записи старше ttl секунд удаляются, при превышении max_bytes удаляются
+    давно не использованные записи (LRU по времени последнего обращения).
+
+    Каталог кэша обходится не при каждой записи: размер кэша учитывается
+    счётчиком, обход выполняется, когда счётчик превышает max_bytes или
+    с прошлого обхода прошло больше evict_interval секунд.
+    """
+
+    def __init__(
+        self,
+        root: str = None,
+        max_bytes: int = None,
+        ttl: int = None,
+        evict_interval: int = None,
+    ):
+        if root is None:
+            root = os.environ.get("CACHE_DIR", os.path.join("data", "cache"))
+        if max_bytes is None:
+            max_bytes = int(os.environ.get("CACHE_MAX_BYTES", 2 * 1024**3))
+        if ttl is None:
+            ttl = int(os.environ.get("CACHE_TTL", 7 * 24 * 60 * 60))
+        if evict_interval is None:
+            evict_interval = int(os.environ.get("CACHE_EVICT_INTERVAL", 10 * 60))
+
+        self.root = root
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.evict_interval = evict_interval
+        # Размер кэша по последнему обходу и записям процесса после него,
+        # None - кэш ещё не обходился. Записи других процессов учитываются
+        # при следующем обходе
+        self._size = None
+        self._evicted_at = 0.0
+
+    @staticmethod
+    def make_key(*parts) -> str:
+        """
+        Ключ записи: sha256 от частей ключа
+        """
+        return hashlib.sha256(repr(parts).encode("utf-8")).hexdigest()
+
+    def get(self, namespace: str, key: str, ttl: int = None):
+        """
+        Получение объекта из кэша, None при промахе
+        """
+        path = self.__entrypath(namespace, key) + ".pkl"
+        if not self.__isfresh(path, ttl):
+            return None
+        try:
+            with open(path, "rb") as f:
+                value = pickle.load(f)
+        except (OSError, pickle.UnpicklingError, EOFError):
+            return None
+        self.__touch(path)
+        return value
+
+    def put(self, namespace: str, key: str, value):
+        """
+        Сохранение объекта в кэш
+        """
+        path = self.__entrypath(namespace, key) + ".pkl"
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmppath = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+        with os.fdopen(fd, "wb") as f:
+            pickle.dump(value, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmppath, path)
+        self.__added(os.path.getsize(path))
+
+    def get_file(self, namespace: str, key: str, dest_dir: str, ttl: int = None):
+        """
+        Копия закэшированного файла в каталоге dest_dir, None при промахе.
+
+        Возвращается копия (жёсткая ссылка, если каталоги на одном диске),
+        а не файл кэша: запись может быть удалена другим процессом до того,
+        как файл будет прочитан.
+        """
+        entrypath = self.__entrypath(namespace, key)
+        if not self.__isfresh(entrypath, ttl):
+            return None
+        try:
+            files = os.listdir(entrypath)
+            if len(files) != 1:
+                return None
+            cachedpath = os.path.join(entrypath, files[0])
+            path = os.path.join(dest_dir, files[0])
+            try:
+                os.link(cachedpath, path)
+            except OSError:
+                shutil.copyfile(cachedpath, path)
+        except FileNotFoundError:
+            # запись удалена во время чтения
+            return None
+        self.__touch(entrypath)
+        return path
+
+    def put_file(self, namespace: str, key: str, path: str) -> str:
+        """
+        Копирование файла в кэш с сохранением имени файла.
+        Возвращает путь к копии в кэше.
+        """
+        entrypath = self.__entrypath(namespace, key)
+        cachedpath = os.path.join(entrypath, os.path.basename(path))
+        os.makedirs(os.path.dirname(entrypath), exist_ok=True)
+        tmpdir = tempfile.mkdtemp(dir=os.path.dirname(entrypath), suffix=".tmp")
+        shutil.copyfile(path, os.path.join(tmpdir, os.path.basename(path)))
+        if os.path.exists(entrypath):
+            shutil.rmtree(entrypath, ignore_errors=True)
+        try:
+            os.replace(tmpdir, entrypath)
+        except OSError:
+            # Запись уже создана параллельным заданием
+            shutil.rmtree(tmpdir, ignore_errors=True)
+        self.__added(os.path.getsize(path))
+        return cachedpath
+
+    def evict(self):
+        """
+        Удаление устаревших записей и записей сверх max_bytes
+        """
+        now = time.time()
+        entries = []
+        total_size = 0
+        for entrypath in self.__entries():
+            try:
+                stat = os.stat(entrypath)
+            except FileNotFoundError:
+                continue
+            if now - stat.st_mtime > self.ttl:
+                self.__remove(entrypath)
+                continue
+            size = self.__size(entrypath)
+            entries.append((stat.st_atime, size, entrypath))
+            total_size += size
+
+        entries.sort()
+        if total_size > self.max_bytes:
+            for _, size, entrypath in entries:
+                if total_size <= self.max_bytes * EVICT_LOW_WATER:
+                    break
+                self.__remove(entrypath)
+                total_size -= size
+
+        self._size = total_size
+        self._evicted_at = now
+
+    def __added(self, size):
+        """
+        Учёт новой записи size байт, при необходимости - обход кэша
+        """
+        if self._size is not None:
+            self._size += size
+        if (
+            self._size is None
+            or self._size > self.max_bytes
+            or time.time() - self._evicted_at > self.evict_interval
+        ):
+            self.evict()
+
+    def __entrypath(self, namespace, key):
+        return os.path.join(self.root, namespace, key)
+
+    def __entries(self):
+        if not os.path.isdir(self.root):
+            return
+        for namespace in os.scandir(self.root):
+            if not namespace.is_dir():
+                continue
+            for entry in os.scandir(namespace.path):
+                if not entry.name.endswith(".tmp"):
+                    yield entry.path
+
+    def __isfresh(self, path, ttl):
+        if ttl is None:
+            ttl = self.ttl
+        try:
+            return time.time() - os.stat(path).st_mtime <= ttl
+        except FileNotFoundError:
+            return False
+
+    def __touch(self, path):
+        """
+        Обновление времени последнего обращения (mtime - время создания записи)
+        """
+        try:
+            os.utime(path, (time.time(), os.stat(path).st_mtime))
+        except FileNotFoundError:
+            pass
+
+    def __size(self, path):
+        if os.path.isdir(path):
+            return sum(
+                os.path.getsize(os.path.join(dirpath, filename))
+                for dirpath, _, filenames in os.walk(path)
+                for filename in filenames
+            )
+        return os.path.getsize(path)
+
+    def __remove(self, path):
+        logger.info(f"Cache entry evicted: {path}")
+        if os.path.isdir(path):
+            shutil.rmtree(path, ignore_errors=True)
+        else:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+
+_cache = None
+
+
+def get_cache() -> ResultCache:
+    """
+    Общий для процесса экземпляр кэша
+    """
+    global _cache
+    if _cache is None:
+        _cache = ResultCache()
+    return _cache
@@ -0,0 +1,172 @@
+import json
+import logging
+import os
+import re
+import urllib.request
+
+import dotenv
+
+from .yt2t import Transcript, parse_time
+
+dotenv.load_dotenv(".env")
+logger = logging.getLogger(__name__)
+
+# manual - только субтитры, загруженные автором видео;
+# auto - авторские, иначе автоматические (a.xx);
+# whisper - всегда распознавание речи
+CAPTIONS_POLICY = os.environ.get("CAPTIONS_POLICY", "manual")
+CAPTIONS_POLICIES = ("manual", "auto", "whisper")
+# Предельная длина строки транскрипта из субтитров без знаков конца предложения
+CAPTION_ROW_MAX_MS = int(os.environ.get("CAPTION_ROW_MAX_MS", "30000"))
+# Время ожидания ответа при загрузке субтитров в секундах
+CAPTION_FETCH_TIMEOUT = float(os.environ.get("CAPTION_FETCH_TIMEOUT", "30"))
+
+SRT_TIME = re.compile(r"(\d{2}:\d{2}:\d{2},\d{3})\s*-->\s*(\d{2}:\d{2}:\d{2},\d{3})")
+SENTENCE_END = re.compile(r"[.?!…]$")
+
+
+def parse_subtitles(subtitles_string) -> Transcript:
+    """
+    Транскрипт из субтитров в формате srt. Блоки без времени пропускаются.
+    """
+    blocks = subtitles_string.replace("\r\n", "\n").strip().split("\n\n")
+    transcript = Transcript()
+
+    for block in blocks:
+        parts = block.split("\n")
+        time_index = next(
+            (i for i, part in enumerate(parts[:2]) if SRT_TIME.search(part)), None
+        )
+        if time_index is None:
+            continue
+        time_match = SRT_TIME.search(parts[time_index])
+        start_time = time_match.group(1)
+        end_time = time_match.group(2)
+
+        text = " ".join(part.strip() for part in parts[time_index + 1 :]).strip()
+        if not text:
+            continue
+
+        transcript.append(text, parse_time(start_time), parse_time(end_time))
+
+    return transcript
+
+
+def parse_json3(data: dict) -> Transcript:
+    """
+    Транскрипт из субтитров YouTube в формате json3. События без текста
+    (переводы строк автоматических субтитров) пропускаются.
+    """
+    transcript = Transcript()
+    for event in data.get("events") or ():
+        text = "".join(seg.get("utf8", "") for seg in event.get("segs") or ())
+        text = " ".join(text.split())
+        if not text:
+            continue
+        start = int(event.get("tStartMs", 0))
+        transcript.append(text, start, start + int(event.get("dDurationMs", 0)))
+    return transcript
+
+
+def merge_caption_lines(transcript: Transcript, max_ms: int = None) -> Transcript:
+    """
+    Объединение строк субтитров в предложения: строка продолжается, пока
+    не закончится знаком конца предложения или не станет длиннее max_ms.
+    Так строки субтитров получают тот же вид, что и строки Whisper.
+    """
+    if max_ms is None:
+        max_ms = CAPTION_ROW_MAX_MS
+
+    merged = Transcript()
+    texts = []
+    start = None
+    for segment in transcript:
+        if not texts:
+            start = segment.start
+        texts.append(segment.text)
+        if SENTENCE_END.search(segment.text) or segment.end - start >= max_ms:
+            merged.append(" ".join(texts), start, segment.end)
+            texts = []
+    if texts:
+        merged.append(" ".join(texts), start, segment.end)
+    return merged
+
+
+def _captions_by_code(captions) -> dict:
+    # dict (VideoInfo.captions) перебирает коды языков, список - субтитры
+    result = {}
+    for item in captions or ():
+        caption = captions[item] if isinstance(item, str) else item
+        result[caption.code] = caption
+    return result
+
+
+def _language(code: str) -> str:
+    # "en-US", "en", "a.en" -> "en"
+    if code.startswith("a."):
+        code = code[2:]
+    return code.lower().split("-")[0]
+
+
+def select_caption(captions, lang: str = None, policy: str = None, original_lang=None):
+    """
+    Субтитры на языке видео, допустимые политикой CAPTIONS_POLICY, или None,
+    если видео нужно распознавать.
+
+    Язык видео - указанный автором original_lang, иначе определённый lang
+    ("ru-RU", "en-US"), иначе язык автоматических субтитров (они создаются
+    на языке речи). Если язык неизвестен, субтитры не выбираются: субтитры
+    на другом языке хуже распознавания речи.
+    """
+    if policy is None:
+        policy = CAPTIONS_POLICY
+    if policy not in CAPTIONS_POLICIES:
+        logger.warning(f"Unknown CAPTIONS_POLICY {policy}, falling back to whisper")
+        return None
+    if policy == "whisper":
+        return None
+
+    by_code = _captions_by_code(captions)
+    language = original_lang or lang
+    if not language:
+        spoken = {_language(code) for code in by_code if code.startswith("a.")}
+        if len(spoken) != 1:
+            logger.info("Video language is unknown, captions are not used")
+            return None
+        language = spoken.pop()
+    language = _language(language)
+
+    manual = [
+        code
+        for code in by_code
+        if not code.startswith("a.") and _language(code) == language
+    ]
+    if manual:
+        return by_code[sorted(manual, key=len)[0]]
+
+    if policy == "auto":
+        automatic = [
+            code
+            for code in by_code
+            if code.startswith("a.") and _language(code) == language
+        ]
+        if automatic:
+            return by_code[sorted(automatic, key=len)[0]]
+    return None
+
+
+def fetch_caption(url: str, timeout: float = None) -> dict:
+    """
+    Загрузка субтитров в формате json3
+    """
+    if timeout is None:
+        timeout = CAPTION_FETCH_TIMEOUT
+    with urllib.request.urlopen(url, timeout=timeout) as response:
+        return json.load(response)
+
+
+def caption_transcript(caption) -> Transcript:
+    """
+    Транскрипт из субтитров (CaptionTrack) в том же виде, что и после Whisper
+    """
+    return merge_caption_lines(parse_json3(fetch_caption(caption.url)))
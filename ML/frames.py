@@ -0,0 +1,301 @@
+import collections
+import io
+import logging
+import os
+import re
+import subprocess
+import threading
+
+import dotenv
+from PIL import Image
+
+from .metrics import FRAMES_EXTRACTED, span
+
+dotenv.load_dotenv(".env")
+logger = logging.getLogger(__name__)
+
+# Уровни качества изображений документа: наибольшая ширина в пикселях
+# (изображение занимает 6 дюймов) и качество jpeg ffmpeg (-q:v, 2 - лучшее)
+IMAGE_TIERS = {
+    "small": (640, 10),
+    "medium": (960, 7),
+    "large": (1280, 4),
+}
+DOC_IMAGE_TIER = os.environ.get("DOC_IMAGE_TIER", "medium")
+# Наибольшее число изображений в документе
+DOC_MAX_IMAGES = int(os.environ.get("DOC_MAX_IMAGES", "40"))
+# Порог оценки смены сцены ffmpeg (0 - кадры одинаковы, 1 - полностью различны)
+DOC_SCENE_THRESHOLD = float(os.environ.get("DOC_SCENE_THRESHOLD", "0.3"))
+# Кадры, dHash которых (256 бит) отличается не более чем на столько бит,
+# считаются одинаковыми
+DOC_HASH_DISTANCE = int(os.environ.get("DOC_HASH_DISTANCE", "20"))
+# Частота кадров, по которым оценивается смена сцены
+SCENE_SAMPLE_FPS = 2
+# Сторона dHash: HASH_SIZE * HASH_SIZE бит. При 8x8 слайды одного шаблона
+# с разным текстом неотличимы
+HASH_SIZE = 16
+
+JPEG_START = b"\xff\xd8"
+JPEG_END = b"\xff\xd9"
+# metadata=print тоже печатает pts_time, время кадра берётся из строк showinfo
+SHOWINFO_PTS_TIME = re.compile(r"Parsed_showinfo.*?\bpts_time:\s*(-?[\d.]+)")
+SCENE_SCORE = re.compile(r"\blavfi\.scene_score=([\d.]+)")
+# Размер блока чтения изображений из ffmpeg
+READ_SIZE = 1 << 16
+# Последние строки лога ffmpeg для сообщения об ошибке
+STDERR_TAIL_LINES = 30
+
+
+def image_tier(tier: str = None) -> tuple:
+    """
+    Наибольшая ширина и качество jpeg для уровня качества tier
+    """
+    if tier is None:
+        tier = DOC_IMAGE_TIER
+    if tier not in IMAGE_TIERS:
+        logger.warning(f"Unknown DOC_IMAGE_TIER {tier}, falling back to medium")
+        tier = "medium"
+    return IMAGE_TIERS[tier]
+
+
+class _FfmpegLog(threading.Thread):
+    """
+    Чтение stderr ffmpeg: время и оценка смены сцены каждого выбранного
+    кадра (в порядке кадров) и последние строки для сообщения об ошибке
+    """
+
+    def __init__(self, stream):
+        super().__init__(name="ffmpeg-log", daemon=True)
+        self.stream = stream
+        self.times = []
+        self.scores = []
+        self.tail = collections.deque(maxlen=STDERR_TAIL_LINES)
+        self.finished = False
+        self.condition = threading.Condition()
+
+    def run(self):
+        try:
+            for raw_line in self.stream:
+                line = raw_line.decode("utf-8", "ignore").rstrip()
+                self.tail.append(line)
+                score = SCENE_SCORE.search(line)
+                frame_time = SHOWINFO_PTS_TIME.search(line)
+                with self.condition:
+                    if score is not None:
+                        self.scores.append(float(score.group(1)))
+                    if frame_time is not None:
+                        self.times.append(float(frame_time.group(1)))
+                        self.condition.notify_all()
+        finally:
+            with self.condition:
+                self.finished = True
+                self.condition.notify_all()
+
+    def frame(self, index: int):
+        """
+        Время и оценка сцены кадра index, None, если ffmpeg их не вывел.
+        showinfo печатает кадр раньше, чем он сжимается в jpeg, поэтому
+        ожидание короткое.
+        """
+        with self.condition:
+            self.condition.wait_for(lambda: len(self.times) > index or self.finished)
+            if len(self.times) <= index:
+                return None
+            score = self.scores[index] if index < len(self.scores) else 0.0
+            return self.times[index], score
+
+
+def _read_jpegs(stream):
+    """
+    Изображения потока ffmpeg image2pipe (mjpeg) по мере чтения.
+    Внутри сжатых данных 0xff всегда экранируется, поэтому маркер конца
+    изображения встречается только в конце.
+    """
+    buffer = bytearray()
+    # начало поиска маркера конца: просмотренные байты не просматриваются снова
+    scanned = len(JPEG_START)
+    while True:
+        block = stream.read(READ_SIZE)
+        if not block:
+            break
+        buffer.extend(block)
+        while True:
+            end = buffer.find(JPEG_END, scanned)
+            if end == -1:
+                scanned = max(len(buffer) - 1, len(JPEG_START))
+                break
+            end += len(JPEG_END)
+            yield bytes(buffer[:end])
+            del buffer[:end]
+            scanned = len(JPEG_START)
+    if buffer:
+        logger.warning(
+            f"ffmpeg output ends with {len(buffer)} bytes of a partial image"
+        )
+
+
+def iter_keyframes(video_url: str, threshold: float = None, tier: str = None):
+    """
+    Кадры смены сцены за один проход ffmpeg по видеопотоку: первый кадр и
+    кадры, у которых оценка смены сцены (scene) выше threshold. Для оценки
+    берутся SCENE_SAMPLE_FPS кадров в секунду. Кадры уменьшаются и сжимаются
+    в jpeg самим ffmpeg по уровню качества tier (DOC_IMAGE_TIER).
+
+    Кадры выдаются по мере чтения из ffmpeg: (время в секундах, оценка
+    сцены, jpeg изображение). Если ffmpeg завершился с ошибкой, её лог
+    записывается и выбрасывается subprocess.CalledProcessError.
+    """
+    if threshold is None:
+        threshold = DOC_SCENE_THRESHOLD
+    max_width, quality = image_tier(tier)
+
+    ffmpeg_command = [
+        "ffmpeg",
+        "-hide_banner",
+        "-nostats",
+        "-i",
+        video_url,
+        "-an",
+        "-vf",
+        f"fps={SCENE_SAMPLE_FPS},select='eq(n,0)+gt(scene,{threshold})',"
+        "metadata=print:key=lavfi.scene_score,"
+        f"scale='min(iw,{max_width})':-2,showinfo",
+        "-vsync",
+        "vfr",
+        "-f",
+        "image2pipe",
+        "-c:v",
+        "mjpeg",
+        "-pix_fmt",
+        "yuvj420p",
+        "-q:v",
+        str(quality),
+        "pipe:1",
+    ]
+    process = subprocess.Popen(
+        ffmpeg_command, stdout=subprocess.PIPE, stderr=subprocess.PIPE
+    )
+    log = _FfmpegLog(process.stderr)
+    log.start()
+    count = 0
+    try:
+        for image in _read_jpegs(process.stdout):
+            frame = log.frame(count)
+            if frame is None:
+                logger.warning(f"ffmpeg printed no time for image {count}, skipped")
+                continue
+            count += 1
+            FRAMES_EXTRACTED.inc()
+            yield frame[0], frame[1], image
+        returncode = process.wait()
+    finally:
+        # потребитель мог прекратить чтение раньше конца видео
+        if process.poll() is None:
+            process.kill()
+            process.wait()
+        process.stdout.close()
+        log.join()
+        process.stderr.close()
+
+    if returncode != 0:
+        stderr = "\n".join(log.tail)
+        logger.error(
+            f"ffmpeg frame extraction failed with code {returncode}:\n{stderr}"
+        )
+        raise subprocess.CalledProcessError(returncode, ffmpeg_command, stderr=stderr)
+    logger.info(f"Extracted {count} scene change frames")
+
+
+def extract_keyframes(
+    video_url: str,
+    threshold: float = None,
+    tier: str = None,
+    max_images: int = None,
+    distance: int = None,
+) -> list:
+    """
+    Кадры для документа: кадры смены сцены (iter_keyframes), отобранные
+    select_keyframes по мере извлечения. В памяти держатся только
+    отобранные кадры.
+
+    Возвращает список (время в секундах, изображение) по возрастанию времени.
+    """
+    if threshold is None:
+        threshold = DOC_SCENE_THRESHOLD
+    with span("extract_frames", threshold=threshold):
+        return select_keyframes(
+            iter_keyframes(video_url, threshold, tier), max_images, distance
+        )
+
+
+def dhash(image: bytes) -> int:
+    """
+    Разностный хэш изображения (dHash, HASH_SIZE * HASH_SIZE бит): похожие
+    изображения отличаются в немногих битах
+    """
+    img = Image.open(io.BytesIO(image))
+    # jpeg декодируется сразу в уменьшенном виде
+    img.draft("L", (HASH_SIZE * 8, HASH_SIZE * 8))
+    pixels = list(
+        img.convert("L").resize((HASH_SIZE + 1, HASH_SIZE), Image.BILINEAR).getdata()
+    )
+    bits = 0
+    for row in range(HASH_SIZE):
+        for col in range(HASH_SIZE):
+            left = pixels[row * (HASH_SIZE + 1) + col]
+            right = pixels[row * (HASH_SIZE + 1) + col + 1]
+            bits = (bits << 1) | (left > right)
+    return bits
+
+
+def hamming_distance(a: int, b: int) -> int:
+    return bin(a ^ b).count("1")
+
+
+def select_keyframes(
+    frames: list, max_images: int = None, distance: int = None
+) -> list:
+    """
+    Кадры для документа из кадров (время, оценка сцены, jpeg), например
+    iter_keyframes, за один проход по ним: кадр пропускается,
+    если его dHash отличается от хэша последнего оставленного кадра не
+    более чем на distance бит. Из оставшихся, если их больше max_images,
+    остаются первый кадр и кадры с наибольшей оценкой смены сцены.
+
+    Возвращает список (время в секундах, изображение) по возрастанию времени.
+    """
+    if max_images is None:
+        max_images = DOC_MAX_IMAGES
+    if distance is None:
+        distance = DOC_HASH_DISTANCE
+    if max_images <= 0:
+        return []
+
+    kept = []
+    last_hash = None
+    total = 0
+    for t, score, image in frames:
+        total += 1
+        try:
+            image_hash = dhash(image)
+        except OSError as e:
+            logger.warning(f"Frame at {t:.3f} s is not an image: {e}")
+            continue
+        if (
+            last_hash is not None
+            and hamming_distance(image_hash, last_hash) <= distance
+        ):
+            continue
+        kept.append((t, score, image))
+        last_hash = image_hash
+
+    if len(kept) > max_images:
+        first, rest = kept[0], kept[1:]
+        rest = sorted(rest, key=lambda frame: frame[1], reverse=True)[: max_images - 1]
+        kept = [first] + sorted(rest, key=lambda frame: frame[0])
+
+    logger.info(
+        f"Kept {len(kept)} of {total} frames "
+        f"(hash distance > {distance}, at most {max_images})"
+    )
+    return [(t, image) for t, _, image in kept]
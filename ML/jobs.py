@@ -0,0 +1,262 @@
+import asyncio
+import functools
+import logging
+import os
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from multiprocessing import get_context
+
+from . import metrics
+
+logger = logging.getLogger(__name__)
+
+
+class JobQueueFullError(Exception):
+    """
+    Очередь заданий заполнена, новое задание не принято
+    """
+
+
+def default_num_workers() -> int:
+    """
+    Количество процессов-исполнителей: JOB_WORKERS или 2, не больше числа ядер.
+
+    Каждый процесс держит свою модель Whisper (1.5-5 ГБ для medium) и
+    распознаёт на своей доле ядер, поэтому процессов немного. Ядра
+    делятся между процессами пула, вложенные пулы распознавания не
+    создаются (ML.yt2t.parallel).
+    """
+    cpu_count = os.cpu_count() or 1
+    num_workers = int(os.environ.get("JOB_WORKERS", "0"))
+    if num_workers <= 0:
+        num_workers = 2
+    return max(min(num_workers, cpu_count), 1)
+
+
+def _noop():
+    pass
+
+
+def _run_job(job_id, video_id, fn, args, kwargs):
+    """
+    Выполнение задания в процессе пула. Вместе с результатом (или
+    исключением) возвращаются метрики, накопленные за время задания.
+    """
+    with metrics.job_context(job_id, video_id):
+        try:
+            result, error = fn(*args, **kwargs), None
+        except Exception as e:
+            result, error = None, e
+    return result, error, metrics.REGISTRY.drain()
+
+
+def job_worker_initargs(num_workers: int, rate_limit_state=None) -> tuple:
+    """
+    Аргументы init_job_worker для пула из num_workers процессов:
+    очередь непересекающихся срезов ядер, по одному на процесс, и общее
+    для процессов состояние ограничителя запросов OpenAI (новое, если
+    rate_limit_state не передано).
+
+    Процессы пула забирают срезы из очереди, поэтому для каждого
+    нового пула нужна новая очередь.
+    """
+    from .llm import shared_rate_limit_state
+    from .yt2t.parallel import available_cores, split_cores
+
+    context = get_context("spawn")
+    core_queue = context.Queue()
+    for cores in split_cores(available_cores(), num_workers):
+        core_queue.put(cores)
+    if rate_limit_state is None:
+        rate_limit_state = shared_rate_limit_state(context)
+    return (core_queue, rate_limit_state)
+
+
+def init_job_worker(core_queue, rate_limit_state):
+    """
+    Инициализация процесса пула: процесс закрепляется за своим срезом ядер,
+    потоки torch ограничиваются размером среза, чтобы задания вместе не
+    занимали больше потоков, чем ядер. Модель Whisper загружается при
+    первом распознавании: задания с субтитрами и из кэша её не используют.
+    С WHISPER_WARM_UP=1 модель загружается в фоне сразу после запуска.
+    Лимиты OPENAI_RPM и OPENAI_TPM не делятся: все процессы списывают
+    запросы из одних вёдер rate_limit_state.
+    """
+    from .llm import use_rate_limit_state
+    from .yt2t.models import WHISPER_WARM_UP, warm_up_whisper
+    from .yt2t.parallel import pin_to_cores
+
+    cores = core_queue.get()
+    pin_to_cores(cores)
+    logger.info(f"Job worker {os.getpid()} pinned to cores {cores}")
+
+    use_rate_limit_state(rate_limit_state)
+    if WHISPER_WARM_UP:
+        # после pin_to_cores: torch создаёт потоки по размеру среза
+        warm_up_whisper()
+
+
+class JobPool:
+    """
+    Пул процессов для тяжёлых заданий (скачивание, Whisper, генерация статей),
+    чтобы они не блокировали цикл событий бота.
+
+    Задания сверх числа процессов ждут в очереди пула; длина очереди
+    ограничена max_pending, лишние задания отклоняются JobQueueFullError.
+
+    initargs - аргументы initializer или функция, возвращающая их при
+    каждом запуске процессов. Если процесс пула аварийно завершился
+    (например, убит при нехватке памяти), выполнявшиеся задания
+    завершаются BrokenProcessPool, а пул запускается заново со
+    следующим заданием.
+    """
+
+    def __init__(
+        self,
+        max_workers: int = None,
+        max_pending: int = None,
+        initializer=None,
+        initargs=(),
+    ):
+        if max_workers is None:
+            max_workers = default_num_workers()
+        if max_pending is None:
+            max_pending = int(os.environ.get("JOB_QUEUE_SIZE", "0"))
+            if max_pending <= 0:
+                max_pending = max_workers * 4
+
+        self.max_workers = max_workers
+        self.max_pending = max_pending
+        self.initializer = initializer
+        self.initargs = initargs
+        self._executor = None
+        self._pending = 0
+        # key -> (параметры задания, asyncio.Task) для выполняющихся заданий
+        self._inflight = {}
+
+    @property
+    def pending(self) -> int:
+        """
+        Количество принятых и ещё не завершённых заданий
+        """
+        return self._pending
+
+    def is_full(self) -> bool:
+        return self._pending >= self.max_pending
+
+    def start(self):
+        """
+        Запуск процессов пула. initializer выполняется в каждом процессе
+        сразу после запуска, до первого задания.
+        """
+        if self._executor is None:
+            initargs = self.initargs() if callable(self.initargs) else self.initargs
+            # spawn: процесс бота многопоточный и держит цикл событий,
+            # fork в таком состоянии небезопасен
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.max_workers,
+                mp_context=get_context("spawn"),
+                initializer=self.initializer,
+                initargs=initargs,
+            )
+            # Процессы создаются по мере поступления заданий, пустые задания
+            # запускают их все заранее
+            for _ in range(self.max_workers):
+                self._executor.submit(_noop)
+            logger.info(f"Job pool started with {self.max_workers} workers")
+
+    async def run(self, fn, *args, **kwargs):
+        """
+        Выполнение fn(*args, **kwargs) в процессе пула.
+        Корутина завершается, когда готов результат задания.
+        """
+        return await self.__submit(None, fn, args, kwargs)
+
+    async def __submit(self, video_id, fn, args, kwargs):
+        if self.is_full():
+            metrics.JOBS.inc(status="rejected")
+            raise JobQueueFullError(
+                f"Job queue is full: {self._pending} of {self.max_pending}"
+            )
+        self.start()
+
+        job_id = uuid.uuid4().hex[:12]
+        logger.info(f"Job {job_id} accepted, video_id={video_id}")
+        start = time.perf_counter()
+        job = functools.partial(_run_job, job_id, video_id, fn, args, kwargs)
+        self._pending += 1
+        try:
+            try:
+                executor = self._executor
+                future = executor.submit(job)
+            except BrokenProcessPool:
+                # пул сломался после завершения предыдущих заданий
+                self.__drop_executor(executor)
+                self.start()
+                executor = self._executor
+                future = executor.submit(job)
+            try:
+                result, error, snapshot = await asyncio.wrap_future(future)
+            except BrokenProcessPool:
+                logger.error(f"Job {job_id} failed: a job worker died")
+                self.__drop_executor(executor)
+                raise
+        except Exception:
+            metrics.JOBS.inc(status="error")
+            raise
+        finally:
+            self._pending -= 1
+            metrics.JOB_SECONDS.observe(time.perf_counter() - start)
+
+        metrics.REGISTRY.merge(snapshot)
+        metrics.JOBS.inc(status="ok" if error is None else "error")
+        if error is not None:
+            raise error
+        return result
+
+    def __drop_executor(self, executor):
+        """
+        Сломанный пул больше не используется, следующее задание запускает
+        новые процессы
+        """
+        if self._executor is executor:
+            self._executor = None
+            executor.shutdown(wait=False, cancel_futures=True)
+            logger.warning("Job pool is broken, restarting workers")
+
+    async def run_coalesced(self, key: str, fn, *args, **kwargs):
+        """
+        Выполнение задания с объединением одновременных запросов по ключу
+        (id видео).
+
+        Запрос с теми же параметрами, что и выполняющееся задание,
+        присоединяется к нему и получает тот же результат. Запрос с другими
+        параметрами для того же ключа ждёт завершения текущего задания,
+        чтобы задания одного видео не писали одни и те же файлы одновременно.
+        """
+        params = (fn, args, tuple(sorted(kwargs.items())))
+        while key in self._inflight:
+            inflight_params, task = self._inflight[key]
+            if inflight_params == params:
+                return await asyncio.shield(task)
+            try:
+                await asyncio.shield(task)
+            except Exception:
+                pass
+
+        task = asyncio.ensure_future(self.__submit(key, fn, args, kwargs))
+        self._inflight[key] = (params, task)
+
+        def release(finished_task):
+            if self._inflight.get(key, (None, None))[1] is finished_task:
+                del self._inflight[key]
+
+        task.add_done_callback(release)
+        return await asyncio.shield(task)
+
+    def shutdown(self, wait: bool = True):
+        if self._executor is not None:
+            self._executor.shutdown(wait=wait, cancel_futures=not wait)
+            self._executor = None
@@ -0,0 +1,306 @@
+import asyncio
+import logging
+import os
+import random
+import re
+import threading
+import time
+
+import dotenv
+import openai
+import tiktoken
+
+from .cache import get_cache
+from .metrics import (
+    LLM_REQUESTS,
+    LLM_RETRIES,
+    LLM_RETRY_SLEEP_SECONDS,
+    LLM_TOKENS,
+    span,
+)
+
+dotenv.load_dotenv(".env")
+openai.api_key = os.environ.get("API_KEY")
+GPT_MODEL = os.environ.get("GPT_MODEL", "gpt-3.5-turbo")
+# Размер контекста модели в токенах
+CONTEXT_TOKENS = int(os.environ.get("GPT_CONTEXT_TOKENS", "4096"))
+
+encoding = tiktoken.get_encoding("cl100k_base")
+logger = logging.getLogger(__name__)
+
+
+class RateLimiter:
+    """
+    Ограничение частоты запросов к API: два ведра токенов, на число запросов
+    в минуту и на число токенов в минуту.
+
+    Состояние вёдер (запросы, токены, время пополнения) хранится в state:
+    по умолчанию в памяти процесса, для пула заданий - в общей памяти
+    (shared_rate_limit_state), тогда один ограничитель с полными лимитами
+    обслуживает все задания всех процессов. Не привязан к циклу событий.
+    """
+
+    def __init__(
+        self, requests_per_minute: float, tokens_per_minute: float, state=None
+    ):
+        self.requests_per_minute = requests_per_minute
+        self.tokens_per_minute = tokens_per_minute
+        if state is None:
+            self._state = [requests_per_minute, tokens_per_minute, time.monotonic()]
+            self._lock = threading.Lock()
+        else:
+            self._state = state
+            # блокировка общей памяти действует и между потоками процесса
+            self._lock = state.get_lock()
+
+    def _reserve(self, tokens: int) -> float:
+        """
+        Списание запроса и tokens токенов из вёдер.
+        Возвращает 0 при успехе, иначе время ожидания до пополнения в секундах.
+        """
+        tokens = min(tokens, self.tokens_per_minute)
+        with self._lock:
+            state = self._state
+            # time.monotonic общее для процессов одной машины
+            now = time.monotonic()
+            elapsed = max(now - state[2], 0)
+            state[2] = now
+            state[0] = min(
+                self.requests_per_minute,
+                state[0] + elapsed * self.requests_per_minute / 60,
+            )
+            state[1] = min(
+                self.tokens_per_minute,
+                state[1] + elapsed * self.tokens_per_minute / 60,
+            )
+
+            if state[0] >= 1 and state[1] >= tokens:
+                state[0] -= 1
+                state[1] -= tokens
+                return 0
+
+            wait_requests = (1 - state[0]) * 60 / self.requests_per_minute
+            wait_tokens = (tokens - state[1]) * 60 / self.tokens_per_minute
+            return max(wait_requests, wait_tokens, 0.01)
+
+    async def acquire(self, tokens: int = 0):
+        """
+        Ожидание возможности отправить запрос на tokens токенов
+        """
+        while True:
+            wait = self._reserve(tokens)
+            if wait == 0:
+                return
+            await asyncio.sleep(wait)
+
+
+_rate_limiter = None
+_rate_limit_state = None
+
+
+def _rate_limits() -> tuple:
+    return (
+        float(os.environ.get("OPENAI_RPM", "3500")),
+        float(os.environ.get("OPENAI_TPM", "90000")),
+    )
+
+
+def shared_rate_limit_state(context):
+    """
+    Состояние ограничителя в общей памяти для процессов, созданных context.
+    Создаётся в процессе бота и передаётся в процессы пула через initargs.
+    """
+    requests_per_minute, tokens_per_minute = _rate_limits()
+    return context.Array(
+        "d", [requests_per_minute, tokens_per_minute, time.monotonic()]
+    )
+
+
+def use_rate_limit_state(state):
+    """
+    Ограничитель процесса работает с общим состоянием state
+    (вызывается в каждом процессе пула заданий)
+    """
+    global _rate_limit_state, _rate_limiter
+    _rate_limit_state = state
+    _rate_limiter = None
+
+
+def get_rate_limiter() -> RateLimiter:
+    """
+    Общий для процесса ограничитель запросов, в пуле заданий - общий
+    для всех процессов пула
+    """
+    global _rate_limiter
+    if _rate_limiter is None:
+        _rate_limiter = RateLimiter(*_rate_limits(), state=_rate_limit_state)
+    return _rate_limiter
+
+
+def count_tokens(text: str) -> int:
+    return len(encoding.encode(text))
+
+
+class ContextLengthError(Exception):
+    """
+    Запрос не помещается в контекст модели даже без ответа
+    """
+
+
+class LLMStats:
+    """
+    Счётчики запросов к модели одного задания
+    """
+
+    def __init__(self):
+        self.requests = 0
+        self.cached = 0
+        self.retries = 0
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self.latency = 0.0
+
+    def as_dict(self) -> dict:
+        return {
+            "requests": self.requests,
+            "cached": self.cached,
+            "retries": self.retries,
+            "prompt_tokens": self.prompt_tokens,
+            "completion_tokens": self.completion_tokens,
+            "latency": round(self.latency, 3),
+        }
+
+    def __str__(self):
+        return ", ".join(f"{name}={value}" for name, value in self.as_dict().items())
+
+
+# "This model's maximum context length is 4097 tokens. However, you requested
+# 4500 tokens (3000 in the messages, 1500 in the completion)"
+CONTEXT_LENGTH_MESSAGE = re.compile(
+    r"maximum context length is (\d+) tokens.*?(\d+) in the messages", re.S
+)
+
+
+class LLMClient:
+    """
+    Клиент ChatCompletion для всех обращений к модели.
+
+    - ограничение частоты запросов общим для процесса (в пуле заданий -
+      для всех процессов пула) RateLimiter;
+    - экспоненциальная задержка со случайной составляющей между повторами
+      при ограничении частоты и временных ошибках API, не более
+      LLM_MAX_ATTEMPTS попыток;
+    - при превышении длины контекста max_tokens уменьшается до остатка
+      контекста;
+    - ответы сохраняются в дисковом кэше по хэшу (модель, запрос, параметры),
+      одинаковый запрос не отправляется повторно;
+    - счётчики токенов и времени ответа в stats.
+    """
+
+    backoff_base = 1.0
+    backoff_cap = 60.0
+
+    def __init__(self, model: str = GPT_MODEL, cache=None, max_attempts: int = None):
+        if cache is None:
+            cache = get_cache()
+        if max_attempts is None:
+            max_attempts = int(os.environ.get("LLM_MAX_ATTEMPTS", "6"))
+
+        self.model = model
+        self.cache = cache
+        self.max_attempts = max_attempts
+        self.stats = LLMStats()
+
+    async def complete(self, message: str, max_tokens: int, temperature: float = 0):
+        """
+        Ответ модели на сообщение пользователя
+        """
+        cache_key = self.cache.make_key(self.model, message, max_tokens, temperature)
+        content = self.cache.get("llm", cache_key)
+        if content is not None:
+            self.stats.cached += 1
+            LLM_REQUESTS.inc(result="cached")
+            return content
+
+        limiter = get_rate_limiter()
+        prompt_tokens = count_tokens(message)
+        attempt = 0
+        while True:
+            await limiter.acquire(prompt_tokens + max_tokens)
+            start = time.monotonic()
+            try:
+                response = await openai.ChatCompletion.acreate(
+                    model=self.model,
+                    temperature=temperature,
+                    max_tokens=max_tokens,
+                    messages=[{"role": "user", "content": f"{message}"}],
+                )
+            except openai.error.InvalidRequestError as e:
+                max_tokens = self.__fit_max_tokens(e, max_tokens)
+                continue
+            except (
+                openai.error.RateLimitError,
+                openai.error.APIError,
+                openai.error.APIConnectionError,
+                openai.error.Timeout,
+                openai.error.ServiceUnavailableError,
+                openai.error.TryAgain,
+            ) as e:
+                if "quota" in str(e):
+                    LLM_REQUESTS.inc(result="error")
+                    raise
+                attempt += 1
+                if attempt >= self.max_attempts:
+                    LLM_REQUESTS.inc(result="error")
+                    raise
+                self.stats.retries += 1
+                LLM_RETRIES.inc(error=type(e).__name__)
+                delay = random.uniform(
+                    0, min(self.backoff_cap, self.backoff_base * 2**attempt)
+                )
+                logger.warning(
+                    f"OpenAI request failed: {e}. Retry {attempt} in {delay:.1f} s"
+                )
+                LLM_RETRY_SLEEP_SECONDS.inc(delay)
+                with span("llm_retry_sleep", attempt=attempt):
+                    await asyncio.sleep(delay)
+                continue
+            finally:
+                self.stats.latency += time.monotonic() - start
+
+            self.stats.requests += 1
+            usage = response.get("usage", {})
+            self.stats.prompt_tokens += usage.get("prompt_tokens", 0)
+            self.stats.completion_tokens += usage.get("completion_tokens", 0)
+            LLM_REQUESTS.inc(result="ok")
+            LLM_TOKENS.inc(usage.get("prompt_tokens", 0), kind="prompt")
+            LLM_TOKENS.inc(usage.get("completion_tokens", 0), kind="completion")
+
+            choices = response.get("choices") or []
+            if not choices or choices[0]["message"].get("content") is None:
+                raise openai.error.APIError(f"Empty response: {response}")
+            content = choices[0]["message"]["content"]
+            self.cache.put("llm", cache_key, content)
+            return content
+
+    def __fit_max_tokens(self, error, max_tokens):
+        """
+        max_tokens, помещающийся в контекст модели, по тексту ошибки
+        превышения контекста. Прочие ошибки запроса пробрасываются.
+        """
+        if getattr(error, "code", None) != "context_length_exceeded" and (
+            "maximum context length" not in str(error)
+        ):
+            raise error
+
+        match = CONTEXT_LENGTH_MESSAGE.search(str(error))
+        if match is not None:
+            context_length, message_tokens = map(int, match.groups())
+            fitted = context_length - message_tokens - 1
+        else:
+            fitted = max_tokens - 150
+        fitted = min(fitted, max_tokens - 1)
+        if fitted <= 0:
+            raise ContextLengthError(str(error)) from error
+        logger.info(f"Context length exceeded, max_tokens {max_tokens} -> {fitted}")
+        return fitted
@@ -1,7 +1,10 @@
 import asyncio
+import bisect
+import io
+import logging
 import os
-import re
-import subprocess
+import shutil
+import tempfile
 import time
 from urllib.parse import parse_qs, urlparse
 
@@ -10,20 +13,43 @@ import docx.opc.constants
 import docx.oxml
 import dotenv
 import openai
-import pandas as pd
 import tiktoken
-import yt_dlp as youtube_dl
 from docx import Document
 from docx.shared import Inches
 from langdetect import detect
-from PIL import Image
-from pytube import YouTube
 
-from .yt2t import YT2T
+from .cache import get_cache
+from .captions import CAPTIONS_POLICY, caption_transcript, select_caption
+from .frames import (
+    DOC_HASH_DISTANCE,
+    DOC_IMAGE_TIER,
+    DOC_MAX_IMAGES,
+    DOC_SCENE_THRESHOLD,
+)
+from .llm import CONTEXT_TOKENS, GPT_MODEL, LLMClient, count_tokens
+from .media import MediaContext
+from .metrics import TRANSCRIPTS, job_context, job_id_var, span
+from .normalize import concatenate_texts, has_letters_or_digits, normalize_texts
+from .video_info import VideoInfo, get_video_info
+from .workspace import Workspace
+from .yt2t import WHISPER_MODEL_NAME, YT2T, Transcript
 
 dotenv.load_dotenv(".env")
 openai.api_key = os.environ.get("API_KEY")
 encoding = tiktoken.get_encoding("cl100k_base")
+logger = logging.getLogger(__name__)
+
+# Длина ответа для пересказа одного окна при иерархической аннотации
+PARTIAL_SUMMARY_TOKENS = int(os.environ.get("PARTIAL_SUMMARY_TOKENS", "400"))
+# Запас на служебные токены сообщения чата
+CONTEXT_MARGIN_TOKENS = 50
+# Размер параграфа для переписывания моделью в токенах
+PARAGRAPH_TOKEN_BUDGET = int(os.environ.get("PARAGRAPH_TOKEN_BUDGET", "1000"))
+# Наибольшее число одновременных запросов к модели в одном задании
+LLM_CONCURRENCY = int(os.environ.get("LLM_CONCURRENCY", "8"))
+# Каталог готовых документов, ожидающих отправки ботом, и время их хранения
+OUTPUT_DIR = os.environ.get("OUTPUT_DIR", os.path.join("data", "outputs"))
+OUTPUT_TTL = int(os.environ.get("OUTPUT_TTL", "3600"))
 
 
 # a.ru - автоматически сгенерированные английские
@@ -43,16 +69,21 @@ def detect_language(text):
     lang = detect(text)
     if lang == "ru":
         return "ru-RU"
-    elif lang == "eng":
+    elif lang == "en":
         return "en-US"
     else:
         return None
 
 
-def generate_subtitles(lang, yt=None, url=None):
-    converter = YT2T()
-    df = converter.url2text(urlpath=url, audioformat="flac", yt=yt, lang=lang)
-    return df
+def generate_subtitles(
+    lang, info: VideoInfo = None, url=None, workspace: Workspace = None
+) -> Transcript:
+    if workspace is None:
+        # файлы распознавания удаляются вместе с временным каталогом
+        with Workspace("yt2t") as workspace:
+            return generate_subtitles(lang, info, url, workspace)
+    converter = YT2T(workspace=workspace)
+    return converter.url2text(urlpath=url, audioformat="flac", info=info, lang=lang)
 
 
 def detect_lang_for_vid(dict_of_lang_subtitles, title):
@@ -63,208 +94,150 @@ def detect_lang_for_vid(dict_of_lang_subtitles, title):
     return detect_language(title)
 
 
-def set_capital_and_remove_punctuation_marks(df: pd.DataFrame):
-    prev_text = "##"
-    for index, row in df.iterrows():
-        text: str = row["text"]
-        if len(prev_text) == 1:
-            prev_text = text
-            prev_text = text
-            continue
-        text = text.strip()
-        if (
-            prev_text == "##"
-            or prev_text[-1] in [".", "?", "!"]
-            and prev_text[-2] not in [".", "?", "!", ","]
-        ):
-            text = text.capitalize()
-
-        prev_word = "##"
-        df.at[index, "text"] = ""
-        for word in text.split(" "):
-            word = word.strip()
-            word = word.strip()
-            if len(prev_word) == 1:
-                if prev_word != "##":
-                    df.at[index, "text"] += " "
-                if word[-1] == "." and word[-2] in ["?", "!"]:
-                    word = word[:-1]
-                df.at[index, "text"] += word
-                prev_word = word
-                continue
-            if prev_word[-1] in [".", "?", "!"] and prev_word[-2] not in [
-                ".",
-                "?",
-                "!",
-                ",",
-            ]:
-                word = word.capitalize()
-
-            if prev_word != "##":
-                df.at[index, "text"] += " "
+def set_capital_and_remove_punctuation_marks(transcript: Transcript) -> Transcript:
+    return transcript.with_texts(normalize_texts(transcript.texts))
 
-            if word[-1] == "." and word[-2] in ["?", "!"]:
-                word = word[:-1]
-            df.at[index, "text"] += word
 
-            prev_word = word
-        prev_text = df.at[index, "text"]
-    return df
+def concatenate_text(transcript: Transcript) -> str:
+    # Объединение текста всех строк без ".."
+    return concatenate_texts(transcript.texts)
 
 
-def concatenate_text(df):
-    concatenated_text = ""
+def remove_rows_without_letters_and_numbers(transcript: Transcript) -> Transcript:
+    # Остаются строки, содержащие буквы, цифры или символы кириллицы
+    return transcript.select(has_letters_or_digits(transcript.texts))
 
-    # Проходимся по каждой строке датафрейма
-    for index, row in df.iterrows():
-        text = row["text"]
 
-        # Удаляем все вхождения ".." из текста
-        cleaned_text = text.replace("..", "")
+def annotation_message(text: str) -> str:
+    return (
+        f"Напиши аннотацию по данному тексту: {text}. В ответе верни только аннотацию."
+    )
 
-        # Объединяем очищенный текст с предыдущими объединенными строками
-        concatenated_text += cleaned_text
 
-    # Возвращаем объединенный текст в виде строки
-    return concatenated_text
+def partial_summary_message(text: str) -> str:
+    return f"Кратко перескажи данный фрагмент текста: {text}. В ответе верни только пересказ."
 
 
-def remove_rows_without_letters_and_numbers(df):
-    # Создаем пустой список для хранения индексов строк, которые нужно удалить
-    rows_to_remove = []
+def split_tokens_into_windows(tokens: list, window_tokens: int) -> list:
+    """
+    Разбиение текста (в токенах) на окна не длиннее window_tokens
+    примерно одинаковой длины
+    """
+    num_of_windows = -(-len(tokens) // window_tokens)
+    size = -(-len(tokens) // num_of_windows)
+    return [
+        encoding.decode(tokens[start : start + size])
+        for start in range(0, len(tokens), size)
+    ]
 
-    # Проходимся по каждой строке датафрейма
-    for index, row in df.iterrows():
-        text = row["text"]
 
-        # Проверяем, содержит ли поле "text" буквы, цифры или символы кириллицы
-        if not re.search("[a-zA-Zа-яА-Я0-9]", text):
-            rows_to_remove.append(index)
+async def summarize_map_reduce(text: str, limit_tokens: int, client: LLMClient) -> str:
+    """
+    Иерархическая аннотация текста длиннее контекста модели.
 
-    # Удаляем строки из датафрейма по полученным индексам
-    df = df.drop(rows_to_remove)
+    Текст делится на окна, помещающиеся в контекст вместе с ответом,
+    окна пересказываются параллельно, пересказы объединяются, и так далее,
+    пока текст не поместится в один запрос аннотации. Каждый уровень
+    сокращает текст примерно в window / partial_tokens раз.
+    """
+    semaphore = asyncio.Semaphore(LLM_CONCURRENCY)
+    partial_tokens = min(limit_tokens, PARTIAL_SUMMARY_TOKENS)
+    overhead = count_tokens(partial_summary_message("")) + CONTEXT_MARGIN_TOKENS
+    window_tokens = CONTEXT_TOKENS - partial_tokens - overhead
+
+    async def summarize(fragment):
+        async with semaphore:
+            return await client.complete(
+                partial_summary_message(fragment), partial_tokens
+            )
 
-    return df
+    level = 0
+    while True:
+        tokens = encoding.encode(text)
+        if len(tokens) + limit_tokens + overhead <= CONTEXT_TOKENS:
+            return await client.complete(annotation_message(text), limit_tokens)
 
+        windows = split_tokens_into_windows(tokens, window_tokens)
+        level += 1
+        logger.debug(
+            f"Annotation level {level}: {len(tokens)} tokens, {len(windows)} windows"
+        )
+        partials = await asyncio.gather(*(summarize(window) for window in windows))
+        text = "\n".join(partials)
 
-def create_annotation(str, limit_word):
 
+def create_annotation(str, limit_word, client: LLMClient = None):
     # 2.8 - среднее увеличение количества токенов по сравнение с количеством слов
-
-    # Rate limit reached - error limit num of message
-    # This model's maximum context length is 4097 tokens. - error extend len of message
     limit_tokens = round(limit_word * 2.8)
     if limit_tokens > 2600:
         limit_tokens = 2600
 
-    encoding = tiktoken.encoding_for_model("gpt-3.5-turbo")
-    tokens = encoding.encode(str)
-    comp_str = encoding.decode(tokens)[:min(len(tokens), 4096 - limit_tokens)]
+    if client is None:
+        client = LLMClient()
 
-    message = f"Напиши аннотацию по данному тексту: {comp_str}. В ответе верни только аннотацию."
-    response = None
-    len_ext_error = "This model's maximum context length"
-    lim_num_mes_error = "Rate limit reached"
-    done = False
-    while not done and limit_tokens > 0:
-        try:
-            response = openai.ChatCompletion.create(
-                model="gpt-3.5-turbo",
-                temperature=0,
-                max_tokens=limit_tokens,
-                messages=[{"role": "user", "content": f"{message}"}],
-            )
-            done = True
-        except openai.InvalidRequestError as e:
-            if len_ext_error in e._message:
-                limit_tokens -= 150
-            if lim_num_mes_error in e._message:
-                time.sleep(21)
-            done = False
-    # print response
-    content_value = response["choices"][0]["message"]["content"]
-    return content_value
+    # Текст, не помещающийся в контекст, аннотируется по частям
+    return asyncio.run(summarize_map_reduce(str, limit_tokens, client))
 
 
 def get_title(url):
-    return YouTube(url).title
+    return get_video_info(url).title
 
 
-def get_subtitles_for_yt(link: str):
+def get_subtitles_for_yt(link: str, workspace: Workspace = None):
     """
     Получение субтитров для yt видео
     """
 
+    cache = get_cache()
+    cache_key = cache.make_key(
+        get_yt_vid_id(link), WHISPER_MODEL_NAME, CAPTIONS_POLICY, "Transcript"
+    )
+    transcript = cache.get("transcripts", cache_key)
+    if transcript is not None:
+        return transcript
+
     try:
-        yt = YouTube(link)
-        dict_of_lang_subtitles = yt.captions
-        title = yt.title
+        info = get_video_info(link)
+        dict_of_lang_subtitles = info.captions
+        title = info.title
         lang_for_vid = detect_lang_for_vid(dict_of_lang_subtitles, title)
 
-        # langs = ["ru", "en"]
-        # for lang in langs:
-        #     if lang in dict_of_lang_subtitles:
-        #         subtitles = yt.captions[lang].generate_srt_captions()
-        #         df = parse_subtitles(subtitles)
-        #         break
-        #
-        # else:
-        #     if lang_for_vid is not None:
-        #         df = generate_subtitles(lang=lang_for_vid, yt=yt)
+        # Субтитры, допустимые CAPTIONS_POLICY, заменяют скачивание аудио и Whisper
+        transcript = None
+        caption = select_caption(
+            dict_of_lang_subtitles, lang_for_vid, original_lang=info.language
+        )
+        if caption is not None:
+            try:
+                with span("captions", code=caption.code):
+                    transcript = caption_transcript(caption)
+            except Exception as e:
+                logger.warning(f"Failed to fetch captions {caption.code}: {e}")
+            if transcript is not None and len(transcript) > 0:
+                source = "auto" if caption.code.startswith("a.") else "manual"
+            else:
+                transcript = None
 
-        df = generate_subtitles(lang=lang_for_vid, yt=yt)
+        if transcript is None:
+            with span("transcription", lang=lang_for_vid):
+                transcript = generate_subtitles(
+                    lang=lang_for_vid, info=info, workspace=workspace
+                )
+            source = "whisper"
+        TRANSCRIPTS.inc(source=source)
 
-        df = remove_rows_without_letters_and_numbers(df)
+        with span("normalize", segments=len(transcript)):
+            transcript = remove_rows_without_letters_and_numbers(transcript)
 
-        df = set_capital_and_remove_punctuation_marks(df)
+            transcript = set_capital_and_remove_punctuation_marks(transcript)
 
-        return df
+        cache.put("transcripts", cache_key, transcript)
+        return transcript
 
     except Exception as e:
         print("Произошла ошибка:", e)
 
 
-def parse_subtitles(subtitles_string):
-    lines = subtitles_string.strip().split("\n\n")
-    data = []
-
-    for line in lines:
-        parts = line.split("\n")
-        index = parts[0]
-
-        time_regex = re.compile(
-            r"(\d{2}:\d{2}:\d{2},\d{3})\s*-->\s*(\d{2}:\d{2}:\d{2},\d{3})"
-        )
-        time_match = time_regex.search(parts[1])
-        start_time = time_match.group(1)
-        end_time = time_match.group(2)
-
-        text = " ".join(parts[2:])
-
-        data.append((text, start_time, end_time))
-
-    df = pd.DataFrame(data, columns=["text", "start_time", "end_time"])
-    return df
-
-
-def extract_picture_from_yt_video(
-    url: str, start_time: str = "00:00:00.000", nm_pct_with_ext: str = "output.jpg"
-):
-    ydl_opts = {
-        "quiet": True,  # Отключение вывода информации от youtube_dl
-    }
-    with youtube_dl.YoutubeDL(ydl_opts) as ydl:
-        info_dict = ydl.extract_info(url, download=False)
-        formats = info_dict.get("formats", [])
-        mp4_formats = [format for format in formats if format.get("ext") == "mp4"]
-        max_quality = max(mp4_formats, key=lambda x: x["quality"])
-        video_url = max_quality["url"]
-
-    if video_url:
-        ffmpeg_command = f'ffmpeg -ss {start_time} -i "{video_url}" -frames:v 1 -update 1 -y {nm_pct_with_ext}'
-        subprocess.run(ffmpeg_command, shell=True)
-
-
 def add_hyperlink(paragraph, url, text, color, underline):
     """
     A function that places a hyperlink within a paragraph object.
@@ -316,15 +289,6 @@ def add_hyperlink(paragraph, url, text, color, underline):
     return hyperlink
 
 
-def get_seconds(time_str) -> int:
-    # Разделение строки на составляющие
-    hours, minutes, seconds = time_str.split(":")
-    # Извлечение значения секунд и преобразование в целое число
-    seconds = int(seconds.split(".")[0])
-
-    return seconds
-
-
 def delete_file(path: str) -> bool:
     if os.path.exists(path):
         os.remove(path)
@@ -344,211 +308,368 @@ def get_yt_vid_id(url: str) -> str:
 
 
 def create_doc(
-    df: pd.DataFrame,
+    transcript: Transcript,
     url: str,
     word_limit_annotation: int = 1000,
     add_annonation: bool = True,
     add_name: str = "",
+    media: MediaContext = None,
+    client: LLMClient = None,
+    workspace: Workspace = None,
 ):
     # Создание нового документа
+    if media is None:
+        media = MediaContext(url)
     video_id = get_yt_vid_id(url)
-    name_of_doc_file = "data/docx_file/" + video_id + add_name + ".docx"
-    image_path = "data/images/" + video_id + add_name + "_image.png"
-    temp_image_path = "data/images/" + video_id + add_name + "_temp_image.png"
+    if workspace is not None:
+        name_of_doc_file = workspace.file("docx_file", video_id + add_name + ".docx")
+    else:
+        name_of_doc_file = "data/docx_file/" + video_id + add_name + ".docx"
 
-    title = get_title(url)
+    title = media.title
 
     doc = Document()
     # Добавление текстового содержимого из датафрейма в документ
     doc.add_heading(f"{title}", level=1)
     if add_annonation is True:
-        annonation = create_annotation(concatenate_text(df), word_limit_annotation)
+        with span("annotation"):
+            annonation = create_annotation(
+                concatenate_text(transcript), word_limit_annotation, client=client
+            )
         doc.add_paragraph(annonation)
         doc.add_page_break()
+    # Кадры смены сцены выбираются один раз на задание, изображение кадра
+    # следует за строкой, на время которой приходится кадр
+    with span("frames") as stage:
+        keyframes = media.get_keyframes()
+        stage.attributes["keyframes"] = len(keyframes)
+    keyframe_times = [t for t, _ in keyframes]
+
     num_of_paragraph = 0
-    for index, row in df.iterrows():
-        if row["text"].strip()[0].isupper():
+    for i, segment in enumerate(transcript):
+        if segment.text.strip()[0].isupper():
             num_of_paragraph += 1
             doc.add_heading(f"Параграф {num_of_paragraph}", level=2)
 
         p = doc.add_paragraph("")
 
-        time_code = get_seconds(row["start_time"])
+        time_code = segment.start // 1000
         link = url + f"&t={time_code}"
 
-        add_hyperlink(p, link, row["start_time"], "FF8822", True)
+        add_hyperlink(p, link, segment.start_time, "FF8822", True)
 
-        doc.add_paragraph(row["text"])
-        # Добавление изображений в документ
-
-        extract_picture_from_yt_video(
-            url, start_time=row["start_time"], nm_pct_with_ext=image_path
+        doc.add_paragraph(segment.text)
+        # Добавление изображений в документ: кадры от начала строки до начала
+        # следующей, кадры до первой строки - после первой
+        first = (
+            0 if i == 0 else bisect.bisect_left(keyframe_times, segment.start / 1000)
         )
-
-        img = Image.open(image_path)
-
-        # Определение размеров изображения в дюймах (пропорционально)
-        img_width, img_height = img.size
-        aspect_ratio = img_width / img_height
-        desired_width = Inches(6)
-        desired_height = desired_width / aspect_ratio
-
-        # Масштабирование изображения с сохранением пропорций
-        img.thumbnail((desired_width, desired_height))
-
-        # Сохранение временной копии масштабированного изображения в формате JPEG
-
-        img.save(temp_image_path, "JPEG")
-        # Добавление изображения в документ
-        doc.add_picture(temp_image_path, width=desired_width, height=desired_height)
+        last = (
+            bisect.bisect_left(keyframe_times, transcript.starts[i + 1] / 1000)
+            if i + 1 < len(transcript)
+            else len(keyframes)
+        )
+        for _, frame in keyframes[first:last]:
+            # Кадр уже уменьшен и сжат в jpeg при извлечении, высота
+            # вычисляется по пропорциям изображения
+            doc.add_picture(io.BytesIO(frame), width=Inches(6))
 
         # Разделитель между разделами документа
         # doc.add_page_break()
 
-    delete_file(image_path)
-    delete_file(temp_image_path)
     # Сохранение документа
-    doc.save(name_of_doc_file)
+    with span("doc_save", path=name_of_doc_file):
+        doc.save(name_of_doc_file)
     if add_annonation is True:
         return name_of_doc_file, annonation
     else:
         return name_of_doc_file
 
 
-def get_doc_from_url(url: str, word_limit_annotation: int = 1000):
+def get_doc_from_url(
+    url: str,
+    word_limit_annotation: int = 1000,
+    media: MediaContext = None,
+    client: LLMClient = None,
+    workspace: Workspace = None,
+):
     try:
-        df = get_subtitles_for_yt(url)
+        transcript = get_subtitles_for_yt(url, workspace=workspace)
         # video_id = get_yt_vid_id(url)
         # path = "data/subtitle/" + video_id + ".csv"
         # df.to_csv(path)
-        name_of_doc_file, annonation = create_doc(df, url, word_limit_annotation)
-        return name_of_doc_file, annonation, df
+        name_of_doc_file, annonation = create_doc(
+            transcript,
+            url,
+            word_limit_annotation,
+            media=media,
+            client=client,
+            workspace=workspace,
+        )
+        return name_of_doc_file, annonation, transcript
     except Exception as e:
         print("Произошла ошибка:", e)
         return None, None, None
 
 
-def form_paragraph_for_gen(df: pd.DataFrame):
-    df["text"].iloc[-1] = df["text"].iloc[-1].replace("..", "").replace(",.", "")
-    paragraph_df = pd.DataFrame({"text": [], "start_time": [], "end_time": []})
-    limit_symbols = 150
-    union_row = ""
-    union_start_time = None
-    union_by_len_row = ""
+def form_paragraph_for_gen(
+    transcript: Transcript, token_budget: int = None
+) -> Transcript:
+    """
+    Объединение строк транскрипта в параграфы для переписывания моделью.
 
-    for index, row in df.iterrows():
-        if ".." in row["text"] or ",." in row["text"]:
-            if union_row == "":
-                union_row = row["text"]
-                union_start_time = row["start_time"]
-            else:
-                union_row += " " + row["text"]
-            union_end_time = row["end_time"]
-        else:
-            if union_row != "":
-                union_row += " " + row["text"]
-                union_end_time = row["end_time"]
-                if union_by_len_row != "":
-                    union_by_len_row += " "
-                union_by_len_row += union_row
-                union_by_len_start_time = union_start_time
-                union_by_len_end_time = union_end_time
-                union_row = ""
-                union_start_time = None
-                union_end_time = None
-
-            if union_by_len_row == "":
-                union_by_len_row = row["text"]
-                union_by_len_start_time = row["start_time"]
-                union_by_len_end_time = row["end_time"]
-            if len(union_by_len_row) >= limit_symbols:
-                new_row = pd.DataFrame(
-                    {
-                        "text": [union_by_len_row],
-                        "start_time": [union_by_len_start_time],
-                        "end_time": [union_by_len_end_time],
-                    }
-                )
-                paragraph_df = pd.concat([paragraph_df, new_row], ignore_index=True)
-                union_by_len_row = ""
-                union_by_len_start_time = None
-                union_by_len_end_time = None
-    if union_by_len_row != "":
-        new_row = pd.DataFrame(
-            {
-                "text": [union_by_len_row],
-                "start_time": [union_by_len_start_time],
-                "end_time": [union_by_len_end_time],
-            }
-        )
-        paragraph_df = pd.concat([paragraph_df, new_row], ignore_index=True)
+    Строки с ".." или ",." продолжаются следующей строкой и вместе с ней
+    образуют предложение. Предложения набираются в параграф, пока он
+    укладывается в token_budget токенов; предложение не разрывается,
+    время начала и конца параграфа берётся из его первой и последней строк.
+    """
+    if token_budget is None:
+        token_budget = PARAGRAPH_TOKEN_BUDGET
+
+    texts = list(transcript.texts)
+    if texts:
+        texts[-1] = texts[-1].replace("..", "").replace(",.", "")
+
+    paragraphs = Transcript()
+    sentence = []
+    sentence_start_time = None
+    paragraph = []
+    paragraph_tokens = 0
+    paragraph_start_time = paragraph_end_time = None
+
+    def add_paragraph():
+        paragraphs.append(" ".join(paragraph), paragraph_start_time, paragraph_end_time)
+
+    for text, start_time, end_time in zip(texts, transcript.starts, transcript.ends):
+        if not sentence:
+            sentence_start_time = start_time
+        sentence.append(text)
+
+        if ".." in text or ",." in text:
+            continue
+
+        # Предложение закончено
+        sentence_text = " ".join(sentence)
+        sentence = []
+        sentence_tokens = count_tokens(sentence_text)
+        if paragraph and paragraph_tokens + sentence_tokens > token_budget:
+            add_paragraph()
+            paragraph = []
+            paragraph_tokens = 0
+
+        if not paragraph:
+            paragraph_start_time = sentence_start_time
+        paragraph.append(sentence_text)
+        paragraph_end_time = end_time
+        paragraph_tokens += sentence_tokens
+
+        if paragraph_tokens >= token_budget:
+            add_paragraph()
+            paragraph = []
+            paragraph_tokens = 0
+
+    if paragraph:
+        add_paragraph()
 
-    return paragraph_df
+    return paragraphs
+
+
+def rewrite_message(text: str) -> str:
+    return f"Cформируй связный красивый текст из данного текста: {text}. В ответе верни только сам текст."
+
+
+async def rewrite_paragraphs(
+    texts: list, limit_tokens: int, client: LLMClient = None
+) -> list:
+    """
+    Переписывание параграфов моделью, одновременно не более LLM_CONCURRENCY
+    запросов. Результаты возвращаются в порядке параграфов.
+    """
+    if client is None:
+        client = LLMClient()
+    semaphore = asyncio.Semaphore(LLM_CONCURRENCY)
+
+    # Параграф обрезается по токенам, чтобы запрос и ответ поместились в контекст
+    overhead = count_tokens(rewrite_message("")) + CONTEXT_MARGIN_TOKENS
+    max_prompt_tokens = CONTEXT_TOKENS - limit_tokens - overhead
+
+    async def rewrite(text):
+        comp_str = encoding.decode(encoding.encode(text)[:max_prompt_tokens])
+        message = rewrite_message(comp_str)
+        async with semaphore:
+            return await client.complete(message, limit_tokens)
+
+    return await asyncio.gather(*(rewrite(text) for text in texts))
 
 
 def gen_text_based_on_paragraph(
-    df_subtitle: pd.DataFrame, limit_article_length: int, url: str
+    transcript: Transcript,
+    limit_article_length: int,
+    url: str,
+    media: MediaContext = None,
+    client: LLMClient = None,
+    workspace: Workspace = None,
 ):
-    df_form_paragraph = form_paragraph_for_gen(df_subtitle)
-    num_of_paragraph = df_form_paragraph.shape[0]
+    with span("paragraphs", segments=len(transcript)):
+        paragraphs = form_paragraph_for_gen(transcript)
+    num_of_paragraph = len(paragraphs)
     len_of_one_paragraph = round(limit_article_length / num_of_paragraph)
     # 2.8 - среднее увеличение количества токенов по сравнение с количеством слов
 
-    # Rate limit reached - error limit num of message
-    # This model's maximum context length is 4097 tokens. - error extend len of message
     limit_tokens = round(len_of_one_paragraph * 2.8)
     if limit_tokens > 2500:
         limit_tokens = 2500
-    response = None
-    len_ext_error = "This model's maximum context length"
-    lim_num_mes_error = "Rate limit reached"
-
-    for index, row in df_form_paragraph.iterrows():
-        response = None
-        limit_tokens_row = limit_tokens
-
-        encoding = tiktoken.encoding_for_model("gpt-3.5-turbo")
-        tokens = encoding.encode(row['text'])
-        comp_str = encoding.decode(tokens)[:min(len(tokens), 4096 - limit_tokens_row)]
-
-        message = f"Cформируй связный красивый текст из данного текста: {comp_str}. В ответе верни только сам текст."
-        done = False
-        while not done and limit_tokens_row > 0:
-            time.sleep(2)
-            try:
-                response = openai.ChatCompletion.create(
-                    model="gpt-3.5-turbo",
-                    temperature=0,
-                    max_tokens=limit_tokens_row,
-                    messages=[{"role": "user", "content": f"{message}"}],
-                )
-                done = True
-            except openai.InvalidRequestError as e:
-                if len_ext_error in e._message:
-                    limit_tokens_row -= 150
-                if lim_num_mes_error in e._message:
-                    time.sleep(21)
-                done = False
-            except Exception as e:
-                done = False
-                time.sleep(21)
-        # print response
-        content_value = response["choices"][0]["message"]["content"]
-        row["text"] = content_value
+    # Ответ должен поместиться в контекст вместе с параграфом
+    limit_tokens = min(
+        limit_tokens,
+        CONTEXT_TOKENS - PARAGRAPH_TOKEN_BUDGET - 2 * CONTEXT_MARGIN_TOKENS,
+    )
+
+    cache = get_cache()
+    cache_key = cache.make_key(
+        get_yt_vid_id(url),
+        WHISPER_MODEL_NAME,
+        GPT_MODEL,
+        limit_article_length,
+        PARAGRAPH_TOKEN_BUDGET,
+    )
+    gen_texts = cache.get("paragraphs", cache_key)
+    if gen_texts is not None:
+        return create_doc(
+            paragraphs.with_texts(gen_texts),
+            url,
+            0,
+            False,
+            add_name="_gen_vers_",
+            media=media,
+            workspace=workspace,
+        )
 
+    # Параграфы переписываются параллельно, с общим для заданий ограничением
+    # частоты запросов
+    with span("rewrite", paragraphs=num_of_paragraph, limit_tokens=limit_tokens):
+        gen_texts = asyncio.run(
+            rewrite_paragraphs(paragraphs.texts, limit_tokens, client)
+        )
+
+    cache.put("paragraphs", cache_key, gen_texts)
     name_of_doc_file = create_doc(
-        df_form_paragraph, url, 0, False, add_name="_gen_vers_"
+        paragraphs.with_texts(gen_texts),
+        url,
+        0,
+        False,
+        add_name="_gen_vers_",
+        media=media,
+        workspace=workspace,
     )
     return name_of_doc_file
 
 
-def get_all_articles(url, word_limit_annotation=1000, limit_article_length=100000):
-    name_of_doc_file, annonation, df_subtitle = get_doc_from_url(
-        url, word_limit_annotation=word_limit_annotation
-    )
-    name_of_doc_gen_file = gen_text_based_on_paragraph(
-        df_subtitle, limit_article_length, url
+def output_dir() -> str:
+    """
+    Новый каталог для документов, передаваемых боту.
+
+    Каталоги старше OUTPUT_TTL секунд удаляются. Бот отправляет документы
+    сразу после завершения задания, запросы, присоединившиеся к заданию,
+    получают те же файлы, поэтому каталоги не удаляются после отправки.
+    """
+    os.makedirs(OUTPUT_DIR, exist_ok=True)
+    now = time.time()
+    for entry in os.scandir(OUTPUT_DIR):
+        try:
+            if entry.is_dir() and now - entry.stat().st_mtime > OUTPUT_TTL:
+                shutil.rmtree(entry.path, ignore_errors=True)
+        except FileNotFoundError:
+            pass
+    return tempfile.mkdtemp(dir=OUTPUT_DIR)
+
+
+def _articles_cache_key(url, word_limit_annotation, limit_article_length) -> str:
+    return get_cache().make_key(
+        get_yt_vid_id(url),
+        WHISPER_MODEL_NAME,
+        GPT_MODEL,
+        word_limit_annotation,
+        limit_article_length,
+        # настройки выбора и сжатия изображений документов
+        DOC_IMAGE_TIER,
+        DOC_MAX_IMAGES,
+        DOC_SCENE_THRESHOLD,
+        DOC_HASH_DISTANCE,
     )
+
+
+def find_cached_articles(url, word_limit_annotation=1000, limit_article_length=100000):
+    """
+    Документы и аннотация из кэша результатов, None при промахе.
+
+    Бот проверяет кэш сам, до постановки задания в пул: ответ из кэша не
+    ждёт в очереди за заданиями распознавания. Документы копируются из
+    кэша в output_dir(), запись кэша может быть удалена до их отправки.
+    """
+    cache = get_cache()
+    cache_key = _articles_cache_key(url, word_limit_annotation, limit_article_length)
+    annonation = cache.get("articles", cache_key)
+    if annonation is None:
+        return None
+
+    output = output_dir()
+    name_of_doc_file = cache.get_file("docx", cache_key + "_doc", output)
+    name_of_doc_gen_file = cache.get_file("docx", cache_key + "_gen", output)
+    if name_of_doc_file is None or name_of_doc_gen_file is None:
+        shutil.rmtree(output, ignore_errors=True)
+        return None
+    return name_of_doc_file, name_of_doc_gen_file, annonation
+
+
+def get_all_articles(url, word_limit_annotation=1000, limit_article_length=100000):
+    # Этапы задания помечаются id видео и в процессе бота, и в процессе пула
+    with job_context(job_id_var.get(), get_yt_vid_id(url)):
+        with span("get_all_articles"):
+            return _get_all_articles(url, word_limit_annotation, limit_article_length)
+
+
+def _get_all_articles(url, word_limit_annotation, limit_article_length):
+    # кэш мог заполниться, пока задание ждало в очереди
+    cached = find_cached_articles(url, word_limit_annotation, limit_article_length)
+    if cached is not None:
+        return cached
+
+    cache = get_cache()
+    cache_key = _articles_cache_key(url, word_limit_annotation, limit_article_length)
+    # Название и кадры видео общие для обоих документов
+    media = MediaContext(url)
+    # Один клиент модели на задание: общий кэш ответов и счётчики запросов
+    client = LLMClient()
+    # Временные файлы задания удаляются после копирования документов в кэш
+    # и в каталог для отправки
+    with Workspace(get_yt_vid_id(url)) as workspace:
+        with span("document"):
+            name_of_doc_file, annonation, transcript = get_doc_from_url(
+                url,
+                word_limit_annotation=word_limit_annotation,
+                media=media,
+                client=client,
+                workspace=workspace,
+            )
+        with span("article"):
+            name_of_doc_gen_file = gen_text_based_on_paragraph(
+                transcript,
+                limit_article_length,
+                url,
+                media=media,
+                client=client,
+                workspace=workspace,
+            )
+        # запросы, токены и повторы также учитываются метриками LLM_*
+        logger.info(f"LLM requests for {url}: {client.stats}")
+
+        cache.put_file("docx", cache_key + "_doc", name_of_doc_file)
+        cache.put_file("docx", cache_key + "_gen", name_of_doc_gen_file)
+        output = output_dir()
+        name_of_doc_file = shutil.copy(name_of_doc_file, output)
+        name_of_doc_gen_file = shutil.copy(name_of_doc_gen_file, output)
+    cache.put("articles", cache_key, annonation)
     return name_of_doc_file, name_of_doc_gen_file, annonation
 
 
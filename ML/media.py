@@ -0,0 +1,53 @@
+import logging
+import subprocess
+
+from .frames import extract_keyframes
+from .video_info import VideoInfo, get_video_info
+
+logger = logging.getLogger(__name__)
+
+
+class MediaContext:
+    """
+    Данные видео, общие для всех документов одного задания: название,
+    url видеопотока и кадры для документов.
+
+    Кадры выбираются один раз на задание: кадры смены сцены без
+    повторяющихся изображений, не больше DOC_MAX_IMAGES.
+    """
+
+    def __init__(self, url: str):
+        self.url = url
+        self._info = None
+        self._keyframes = None
+
+    @property
+    def info(self) -> VideoInfo:
+        if self._info is None:
+            self._info = get_video_info(self.url)
+        return self._info
+
+    @property
+    def title(self) -> str:
+        return self.info.title
+
+    @property
+    def video_url(self) -> str:
+        return self.info.video_url
+
+    def get_keyframes(self) -> list:
+        """
+        Кадры для документов: список (время в секундах, изображение)
+        по возрастанию времени
+        """
+        if self._keyframes is None:
+            if self.video_url is None:
+                self._keyframes = []
+            else:
+                try:
+                    self._keyframes = extract_keyframes(self.video_url)
+                except subprocess.CalledProcessError:
+                    # ошибка ffmpeg записана в лог, документы создаются без кадров
+                    logger.warning(f"No document images for {self.url}")
+                    self._keyframes = []
+        return self._keyframes
@@ -0,0 +1,306 @@
+import bisect
+import contextlib
+import contextvars
+import logging
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+logger = logging.getLogger(__name__)
+
+# Атрибуты задания, которым принадлежат этапы текущего потока или задачи
+job_id_var = contextvars.ContextVar("job_id", default=None)
+video_id_var = contextvars.ContextVar("video_id", default=None)
+span_var = contextvars.ContextVar("span", default=None)
+
+DEFAULT_BUCKETS = (0.1, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600, 1800, 3600)
+
+
+class Registry:
+    """
+    Набор метрик процесса.
+
+    Процессы пула заданий отдают накопленные значения (drain) вместе с
+    результатом задания, основной процесс прибавляет их к своим (merge)
+    и отдаёт по HTTP в текстовом формате Prometheus.
+    """
+
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def register(self, metric):
+        with self._lock:
+            self._metrics[metric.name] = metric
+        return metric
+
+    def drain(self) -> dict:
+        """
+        Значения всех метрик с обнулением
+        """
+        with self._lock:
+            return {
+                name: metric.drain()
+                for name, metric in self._metrics.items()
+                if metric.values
+            }
+
+    def merge(self, snapshot: dict):
+        with self._lock:
+            for name, values in snapshot.items():
+                metric = self._metrics.get(name)
+                if metric is None:
+                    logger.warning(f"Unknown metric in snapshot: {name}")
+                    continue
+                metric.merge(values)
+
+    def exposition(self) -> str:
+        with self._lock:
+            metrics = list(self._metrics.values())
+        return "".join(metric.exposition() for metric in metrics)
+
+
+REGISTRY = Registry()
+
+
+def _format_labels(labelnames, labelvalues, extra=()) -> str:
+    pairs = list(zip(labelnames, labelvalues)) + list(extra)
+    if not pairs:
+        return ""
+    escaped = (
+        (name, str(value).replace("\\", "\\\\").replace('"', '\\"'))
+        for name, value in pairs
+    )
+    return "{" + ",".join(f'{name}="{value}"' for name, value in escaped) + "}"
+
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name, documentation, labelnames=(), registry=REGISTRY):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        # значения метки -> значение метрики
+        self.values = {}
+        self._lock = threading.Lock()
+        registry.register(self)
+
+    def _key(self, labels) -> tuple:
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name} expects labels {self.labelnames}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def drain(self) -> dict:
+        with self._lock:
+            values, self.values = self.values, {}
+        return values
+
+    def exposition(self) -> str:
+        lines = [
+            f"# HELP {self.name} {self.documentation}\n",
+            f"# TYPE {self.name} {self.kind}\n",
+        ]
+        with self._lock:
+            values = sorted(self.values.items())
+        for labelvalues, value in values:
+            lines.extend(self._samples(labelvalues, value))
+        return "".join(lines)
+
+
+class Counter(_Metric):
+    """
+    Монотонно растущий счётчик
+    """
+
+    kind = "counter"
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def merge(self, values: dict):
+        with self._lock:
+            for key, value in values.items():
+                self.values[key] = self.values.get(key, 0) + value
+
+    def _samples(self, labelvalues, value):
+        yield f"{self.name}{_format_labels(self.labelnames, labelvalues)} {value}\n"
+
+
+class Histogram(_Metric):
+    """
+    Распределение значений по корзинам (верхние границы buckets)
+    """
+
+    kind = "histogram"
+
+    def __init__(
+        self,
+        name,
+        documentation,
+        labelnames=(),
+        buckets=DEFAULT_BUCKETS,
+        registry=REGISTRY,
+    ):
+        self.buckets = tuple(sorted(buckets))
+        super().__init__(name, documentation, labelnames, registry)
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            counts, total = self.values.get(key, ([0] * (len(self.buckets) + 1), 0.0))
+            # последняя корзина - +Inf
+            counts[bisect.bisect_left(self.buckets, value)] += 1
+            self.values[key] = (counts, total + value)
+
+    def merge(self, values: dict):
+        with self._lock:
+            for key, (counts, total) in values.items():
+                own_counts, own_total = self.values.get(
+                    key, ([0] * (len(self.buckets) + 1), 0.0)
+                )
+                self.values[key] = (
+                    [a + b for a, b in zip(own_counts, counts)],
+                    own_total + total,
+                )
+
+    def _samples(self, labelvalues, value):
+        counts, total = value
+        cumulative = 0
+        for bound, count in zip(self.buckets + ("+Inf",), counts):
+            cumulative += count
+            labels = _format_labels(self.labelnames, labelvalues, [("le", bound)])
+            yield f"{self.name}_bucket{labels} {cumulative}\n"
+        labels = _format_labels(self.labelnames, labelvalues)
+        yield f"{self.name}_sum{labels} {total}\n"
+        yield f"{self.name}_count{labels} {cumulative}\n"
+
+
+STAGE_SECONDS = Histogram(
+    "yt2a_stage_seconds", "Duration of pipeline stages", ["stage"]
+)
+STAGE_ERRORS = Counter(
+    "yt2a_stage_errors_total", "Pipeline stages finished with an error", ["stage"]
+)
+TRANSCRIPTS = Counter(
+    "yt2a_transcripts_total",
+    "Transcripts by source (manual, auto, whisper)",
+    ["source"],
+)
+AUDIO_SECONDS = Counter("yt2a_audio_seconds_total", "Seconds of audio transcribed")
+REALTIME_FACTOR = Histogram(
+    "yt2a_whisper_realtime_factor",
+    "Whisper transcription time divided by audio duration",
+    buckets=(0.05, 0.1, 0.25, 0.5, 1, 2, 4, 8),
+)
+LLM_REQUESTS = Counter(
+    "yt2a_llm_requests_total", "ChatCompletion requests by result", ["result"]
+)
+LLM_TOKENS = Counter("yt2a_llm_tokens_total", "ChatCompletion tokens", ["kind"])
+LLM_RETRIES = Counter("yt2a_llm_retries_total", "ChatCompletion retries", ["error"])
+LLM_RETRY_SLEEP_SECONDS = Counter(
+    "yt2a_llm_retry_sleep_seconds_total", "Seconds slept before ChatCompletion retries"
+)
+VIDEO_INFO_LOOKUPS = Counter(
+    "yt2a_video_info_lookups_total",
+    "Video metadata lookups by result (memory, cache, extract)",
+    ["result"],
+)
+DOWNLOAD_BYTES = Counter("yt2a_download_bytes_total", "Bytes of media downloaded")
+DOWNLOAD_RETRIES = Counter(
+    "yt2a_download_retries_total", "Media download retries", ["error"]
+)
+FRAMES_EXTRACTED = Counter("yt2a_frames_extracted_total", "Video frames extracted")
+JOBS = Counter("yt2a_jobs_total", "Jobs of the job pool by status", ["status"])
+JOB_SECONDS = Histogram(
+    "yt2a_job_seconds", "Duration of jobs including time in the queue"
+)
+
+
+class Span:
+    """
+    Выполняющийся этап: имя, атрибуты и длительность после завершения
+    """
+
+    def __init__(self, name: str, attributes: dict):
+        self.name = name
+        self.attributes = attributes
+        self.parent = span_var.get()
+        self.duration = None
+
+
+@contextlib.contextmanager
+def span(name: str, **attributes):
+    """
+    Этап конвейера: длительность попадает в yt2a_stage_seconds{stage=name}
+    и в лог вместе с job_id, video_id, родительским этапом и attributes.
+    Атрибуты можно дополнить внутри блока через span.attributes.
+    """
+    current = Span(name, attributes)
+    token = span_var.set(current)
+    start = time.perf_counter()
+    status = "ok"
+    try:
+        yield current
+    except BaseException:
+        status = "error"
+        STAGE_ERRORS.inc(stage=name)
+        raise
+    finally:
+        current.duration = time.perf_counter() - start
+        span_var.reset(token)
+        STAGE_SECONDS.observe(current.duration, stage=name)
+        details = " ".join(
+            f"{key}={value}"
+            for key, value in {
+                "job_id": job_id_var.get(),
+                "video_id": video_id_var.get(),
+                "parent": current.parent.name if current.parent else None,
+                **current.attributes,
+            }.items()
+            if value is not None
+        )
+        logger.info(f"span {name} {status} {current.duration:.3f} s {details}")
+
+
+@contextlib.contextmanager
+def job_context(job_id: str, video_id: str = None):
+    """
+    Атрибуты job_id и video_id для всех этапов внутри блока
+    """
+    job_token = job_id_var.set(job_id)
+    video_token = video_id_var.set(video_id)
+    try:
+        yield
+    finally:
+        video_id_var.reset(video_token)
+        job_id_var.reset(job_token)
+
+
+def start_metrics_server(port: int, host: str = "127.0.0.1", registry=REGISTRY):
+    """
+    HTTP сервер метрик в фоновом потоке, GET /metrics
+    """
+
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def log_message(self, format, *args):
+            pass
+
+        def do_GET(self):
+            if self.path.split("?")[0] not in ("/", "/metrics"):
+                self.send_error(404)
+                return
+            data = registry.exposition().encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+    server = ThreadingHTTPServer((host, port), MetricsHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    logger.info(f"Metrics at http://{host}:{server.server_address[1]}/metrics")
+    return server
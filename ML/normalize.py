@@ -0,0 +1,73 @@
+import re
+
+SENTENCE_END = ".?!"
+# Символы, после которых конец предложения не засчитывается ("..", "?.", ",.")
+NOT_SENTENCE_END = ".?!,"
+SENTENCE_PUNCTUATION = re.compile(r"[.?!]")
+LETTER_OR_DIGIT = re.compile("[a-zA-Zа-яА-Я0-9]")
+
+
+def _ends_sentence(text: str) -> bool:
+    return (
+        len(text) > 1 and text[-1] in SENTENCE_END and text[-2] not in NOT_SENTENCE_END
+    )
+
+
+def _normalize_words(text: str) -> str:
+    """
+    Заглавная буква в словах после конца предложения, "?." и "!." -> "?" и "!"
+    """
+    words = text.split(" ")
+    if not SENTENCE_PUNCTUATION.search(text):
+        return " ".join([word.strip() for word in words])
+
+    result = []
+    prev_word = ""
+    for word in words:
+        word = word.strip()
+        if _ends_sentence(prev_word):
+            word = word.capitalize()
+        if word.endswith("?.") or word.endswith("!."):
+            word = word[:-1]
+        result.append(word)
+        prev_word = word
+    return " ".join(result)
+
+
+def normalize_texts(texts) -> list:
+    """
+    Расстановка заглавных букв и очистка знаков препинания в строках
+    транскрипта за один проход.
+
+    Строка начинается с заглавной буквы, если она первая или предыдущая
+    строка закончила предложение. Строка после однобуквенной строки
+    остаётся без изменений.
+    """
+    result = []
+    prev_text = None
+    for text in texts:
+        if prev_text is not None and len(prev_text) == 1:
+            result.append(text)
+            prev_text = text
+            continue
+        text = text.strip()
+        if prev_text is None or _ends_sentence(prev_text):
+            text = text.capitalize()
+        text = _normalize_words(text)
+        result.append(text)
+        prev_text = text
+    return result
+
+
+def concatenate_texts(texts) -> str:
+    """
+    Объединение строк транскрипта в один текст без ".."
+    """
+    return "".join([text.replace("..", "") for text in texts])
+
+
+def has_letters_or_digits(texts) -> list:
+    """
+    Маска строк, содержащих буквы (латиница, кириллица) или цифры
+    """
+    return [LETTER_OR_DIGIT.search(text) is not None for text in texts]
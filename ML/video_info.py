@@ -0,0 +1,259 @@
+import logging
+import os
+import threading
+import time
+
+import dotenv
+import yt_dlp as youtube_dl
+
+from .cache import get_cache
+from .frames import image_tier
+from .metrics import VIDEO_INFO_LOOKUPS, span
+
+dotenv.load_dotenv(".env")
+logger = logging.getLogger(__name__)
+
+# Время жизни метаданных видео в секундах: ссылки на потоки YouTube
+# действительны несколько часов
+VIDEO_INFO_TTL = int(os.environ.get("VIDEO_INFO_TTL", "3600"))
+# Наименьший битрейт аудиопотока (кбит/с), достаточный для распознавания речи
+AUDIO_MIN_ABR = float(os.environ.get("AUDIO_MIN_ABR", "48"))
+
+# Протоколы, поток которых читается ffmpeg по прямой ссылке
+DIRECT_PROTOCOLS = ("https", "http")
+# Видеокодеки в порядке скорости декодирования ffmpeg
+VIDEO_CODECS = ("avc1", "h264", "vp9", "vp09", "av01")
+
+# url -> (время получения, VideoInfo)
+_infos = {}
+_infos_lock = threading.Lock()
+
+
+class CaptionTrack:
+    """
+    Субтитры видео: код языка ("en", "a.en" - автоматические)
+    и ссылка на них в формате json3
+    """
+
+    __slots__ = ("code", "name", "url")
+
+    def __init__(self, code: str, name: str, url: str):
+        self.code = code
+        self.name = name
+        self.url = url
+
+    def __repr__(self):
+        return f"CaptionTrack({self.code!r})"
+
+
+class VideoInfo:
+    """
+    Метаданные видео, нужные заданию: название, субтитры и ссылки на
+    аудио- и видеопотоки. Получаются одним запросом extract_info.
+    """
+
+    __slots__ = (
+        "video_id",
+        "title",
+        "duration",
+        "language",
+        "captions",
+        "audio_url",
+        "video_url",
+    )
+
+    def __init__(
+        self,
+        video_id: str,
+        title: str,
+        duration: float = None,
+        language: str = None,
+        captions: dict = None,
+        audio_url: str = None,
+        video_url: str = None,
+    ):
+        self.video_id = video_id
+        self.title = title
+        self.duration = duration
+        # язык видео, указанный автором ("en", "ru"), None - не указан
+        self.language = language
+        # код языка -> CaptionTrack
+        self.captions = captions or {}
+        self.audio_url = audio_url
+        self.video_url = video_url
+
+    @classmethod
+    def from_info_dict(cls, info: dict) -> "VideoInfo":
+        """
+        VideoInfo из результата yt_dlp extract_info
+        """
+        formats = info.get("formats") or []
+        return cls(
+            video_id=info.get("id"),
+            title=info.get("title"),
+            duration=info.get("duration"),
+            language=info.get("language"),
+            captions=_caption_tracks(info),
+            audio_url=_audio_url(formats),
+            video_url=_video_url(formats),
+        )
+
+    def __repr__(self):
+        return f"VideoInfo({self.video_id!r}, {self.title!r})"
+
+
+def _json3_url(tracks) -> str:
+    for track in tracks or ():
+        if track.get("ext") == "json3" and track.get("url"):
+            return track["url"]
+    return None
+
+
+def _caption_tracks(info: dict) -> dict:
+    captions = {}
+    for code, tracks in (info.get("subtitles") or {}).items():
+        url = _json3_url(tracks)
+        if url is not None and code != "live_chat":
+            captions[code] = CaptionTrack(code, tracks[0].get("name"), url)
+    # автоматические субтитры перечислены вместе с машинными переводами
+    # (tlang=), остаются только исходные
+    for code, tracks in (info.get("automatic_captions") or {}).items():
+        url = _json3_url(tracks)
+        if url is not None and "tlang=" not in url:
+            captions["a." + code] = CaptionTrack(
+                "a." + code, tracks[0].get("name"), url
+            )
+    return captions
+
+
+def _is_direct(format: dict) -> bool:
+    return bool(format.get("url")) and (
+        format.get("protocol", "https") in DIRECT_PROTOCOLS
+    )
+
+
+def _audio_url(formats: list) -> str:
+    """
+    Наименьший аудиопоток без видео с битрейтом не ниже AUDIO_MIN_ABR,
+    иначе наилучший аудиопоток, иначе наименьший поток со звуком
+    """
+    audio_only = [
+        format
+        for format in formats
+        if _is_direct(format)
+        and format.get("vcodec") == "none"
+        and format.get("acodec") not in (None, "none")
+    ]
+    adequate = [
+        format for format in audio_only if (format.get("abr") or 0) >= AUDIO_MIN_ABR
+    ]
+    if adequate:
+        return min(adequate, key=lambda format: format["abr"])["url"]
+    if audio_only:
+        return max(audio_only, key=lambda format: format.get("abr") or 0)["url"]
+
+    with_audio = [
+        format
+        for format in formats
+        if _is_direct(format) and format.get("acodec") not in (None, "none")
+    ]
+    if with_audio:
+        return min(
+            with_audio, key=lambda format: format.get("filesize") or float("inf")
+        )["url"]
+    return None
+
+
+def _codec_rank(format: dict) -> int:
+    vcodec = format.get("vcodec") or ""
+    for rank, codec in enumerate(VIDEO_CODECS):
+        if vcodec.startswith(codec):
+            return rank
+    return len(VIDEO_CODECS)
+
+
+def _video_url(formats: list, min_width: int = None) -> str:
+    """
+    Наименьший видеопоток шириной не меньше min_width (ширины изображений
+    DOC_IMAGE_TIER): сцены оцениваются по каждому кадру потока, и
+    декодирование 4K кадров, уменьшаемых до ширины изображений, не нужно.
+    Из потоков одной ширины выбирается быстрее декодируемый кодек.
+    Если таких потоков нет, выбирается наиболее широкий.
+    """
+    if min_width is None:
+        min_width = image_tier()[0]
+    video_formats = [
+        format
+        for format in formats
+        if _is_direct(format) and format.get("vcodec") not in (None, "none")
+    ]
+    if not video_formats:
+        return None
+
+    adequate = [
+        format for format in video_formats if (format.get("width") or 0) >= min_width
+    ]
+    if adequate:
+        return min(
+            adequate,
+            key=lambda format: (format["width"], _codec_rank(format)),
+        )["url"]
+    return max(
+        video_formats,
+        key=lambda format: (
+            format.get("width") or 0,
+            -_codec_rank(format),
+            format.get("quality") or 0,
+        ),
+    )["url"]
+
+
+def extract_video_info(url: str) -> dict:
+    """
+    Запрос метаданных видео у YouTube
+    """
+    ydl_opts = {
+        "quiet": True,  # Отключение вывода информации от youtube_dl
+        "skip_download": True,
+    }
+    with youtube_dl.YoutubeDL(ydl_opts) as ydl:
+        return ydl.extract_info(url, download=False)
+
+
+def get_video_info(url: str, ttl: int = None) -> VideoInfo:
+    """
+    Метаданные видео: из памяти процесса, из общего кэша результатов или
+    одним запросом extract_info. Записи старше ttl секунд не используются.
+    """
+    if ttl is None:
+        ttl = VIDEO_INFO_TTL
+
+    # Блокировка на время запроса: потоки задания не запрашивают видео повторно
+    with _infos_lock:
+        resolved = _infos.get(url)
+        if resolved is not None and time.time() - resolved[0] <= ttl:
+            VIDEO_INFO_LOOKUPS.inc(result="memory")
+            return resolved[1]
+
+        cache = get_cache()
+        # записи с другим набором полей VideoInfo или другим уровнем
+        # качества изображений (выбор видеопотока) не используются
+        cache_key = cache.make_key(url, VideoInfo.__slots__, image_tier())
+        cached = cache.get("video_info", cache_key, ttl=ttl)
+        if cached is not None:
+            resolved_at, info = cached
+            VIDEO_INFO_LOOKUPS.inc(result="cache")
+        else:
+            with span("video_info"):
+                info = VideoInfo.from_info_dict(extract_video_info(url))
+            resolved_at = time.time()
+            VIDEO_INFO_LOOKUPS.inc(result="extract")
+            cache.put("video_info", cache_key, (resolved_at, info))
+            logger.info(
+                f"Video info {info.video_id}: {len(info.captions)} captions, "
+                f"audio {'found' if info.audio_url else 'missing'}, "
+                f"video {'found' if info.video_url else 'missing'}"
+            )
+
+        _infos[url] = (resolved_at, info)
+        return info
@@ -0,0 +1,188 @@
+import logging
+import os
+import re
+import shutil
+import tempfile
+
+import dotenv
+
+dotenv.load_dotenv(".env")
+logger = logging.getLogger(__name__)
+
+# Файл владельца каталога задания: pid и время запуска процесса
+OWNER_FILE = ".owner"
+UNSAFE_NAME_CHARACTERS = re.compile(r"[^\w-]")
+
+
+class Workspace:
+    """
+    Каталог временных файлов одного задания (аудио, фрагменты, кадры, docx).
+
+    Каталог создаётся с уникальным именем в tmpfs (/dev/shm), если там
+    свободно не меньше WORKSPACE_TMPFS_MIN_FREE байт, иначе в WORKSPACE_DIR,
+    и удаляется при выходе из блока with. Файлы, которые должны быть на
+    диске, а не в памяти (отображаемый в память звук длинных видео),
+    создаются в каталоге disk().
+
+    При создании каталога из корня удаляются каталоги завершившихся
+    процессов. Каталоги живых процессов не удаляются: если каталоги
+    занимают больше max_bytes, выводится предупреждение.
+    """
+
+    def __init__(self, name: str = "job", root: str = None, max_bytes: int = None):
+        if root is None:
+            root = default_root()
+        if max_bytes is None:
+            max_bytes = int(os.environ.get("WORKSPACE_MAX_BYTES", 10 * 1024**3))
+
+        self.name = name
+        self.root = root
+        self.max_bytes = max_bytes
+        self._disk = None
+
+        os.makedirs(root, exist_ok=True)
+        self.evict()
+        prefix = UNSAFE_NAME_CHARACTERS.sub("_", name)[:64]
+        self.path = tempfile.mkdtemp(prefix=f"{prefix}-", dir=root)
+        with open(os.path.join(self.path, OWNER_FILE), "w") as f:
+            f.write(_owner())
+        logger.info(f"Workspace {self.path}")
+
+    def file(self, *parts) -> str:
+        """
+        Путь к файлу внутри каталога, промежуточные каталоги создаются
+        """
+        path = os.path.join(self.path, *parts)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        return path
+
+    def dir(self, *parts) -> str:
+        """
+        Каталог внутри каталога задания
+        """
+        path = os.path.join(self.path, *parts)
+        os.makedirs(path, exist_ok=True)
+        return path
+
+    def disk(self) -> "Workspace":
+        """
+        Каталог задания на диске: сам каталог, если он не в tmpfs, иначе
+        каталог в WORKSPACE_DIR, удаляемый вместе с этим
+        """
+        disk_root = workspace_dir()
+        if os.path.abspath(self.root) == os.path.abspath(disk_root):
+            return self
+        if self._disk is None:
+            self._disk = Workspace(self.name, root=disk_root, max_bytes=self.max_bytes)
+        return self._disk
+
+    def cleanup(self):
+        shutil.rmtree(self.path, ignore_errors=True)
+        if self._disk is not None:
+            self._disk.cleanup()
+
+    def evict(self):
+        """
+        Удаление каталогов завершившихся процессов
+        """
+        total_size = 0
+        for entry in os.scandir(self.root):
+            if not entry.is_dir():
+                continue
+            try:
+                with open(os.path.join(entry.path, OWNER_FILE)) as f:
+                    owner = f.read()
+            except OSError:
+                # каталог без владельца ещё создаётся или уже удаляется
+                continue
+            if not _is_owner_alive(owner):
+                logger.info(f"Removing stale workspace {entry.path}")
+                shutil.rmtree(entry.path, ignore_errors=True)
+                continue
+            total_size += _size(entry.path)
+
+        if total_size > self.max_bytes:
+            logger.warning(
+                f"Active workspaces in {self.root} take {total_size} bytes, "
+                f"more than {self.max_bytes}"
+            )
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.cleanup()
+
+    def __repr__(self):
+        return f"Workspace({self.path!r})"
+
+
+def workspace_dir() -> str:
+    """
+    Корень каталогов заданий на диске
+    """
+    return os.environ.get("WORKSPACE_DIR", os.path.join("data", "workspaces"))
+
+
+def default_root() -> str:
+    """
+    Корень каталогов заданий: tmpfs, если там достаточно места
+    """
+    tmpfs = os.environ.get("WORKSPACE_TMPFS", "/dev/shm")
+    min_free = int(os.environ.get("WORKSPACE_TMPFS_MIN_FREE", 2 * 1024**3))
+    if tmpfs and os.path.isdir(tmpfs):
+        try:
+            if shutil.disk_usage(tmpfs).free >= min_free:
+                return os.path.join(tmpfs, "yt2a-workspaces")
+        except OSError:
+            pass
+    return workspace_dir()
+
+
+def _process_start(pid: int) -> str:
+    """
+    Время запуска процесса из /proc (отличает процесс от более позднего
+    с тем же pid), None без /proc
+    """
+    try:
+        with open(f"/proc/{pid}/stat") as f:
+            # поля после имени процесса, starttime - 22-е поле
+            return f.read().rsplit(")", 1)[1].split()[19]
+    except (OSError, IndexError):
+        return None
+
+
+def _owner() -> str:
+    pid = os.getpid()
+    return f"{pid} {_process_start(pid) or ''}".strip()
+
+
+def _is_owner_alive(owner: str) -> bool:
+    try:
+        pid, *start = owner.split()
+        pid = int(pid)
+    except ValueError:
+        return False
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    if start:
+        current = _process_start(pid)
+        if current is not None and current != start[0]:
+            # pid занят другим процессом
+            return False
+    return True
+
+
+def _size(path: str) -> int:
+    size = 0
+    for dirpath, _, filenames in os.walk(path):
+        for filename in filenames:
+            try:
+                size += os.path.getsize(os.path.join(dirpath, filename))
+            except FileNotFoundError:
+                pass
+    return size
@@ -1 +1,3 @@
 from .main import YT2T
+from .models import WHISPER_MODEL_NAME, get_whisper_model, warm_up_whisper
+from .transcript import Segment, Transcript, format_time, parse_time
@@ -0,0 +1,327 @@
+import http.client
+import json
+import logging
+import os
+import random
+import re
+import threading
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+from ..metrics import DOWNLOAD_BYTES, DOWNLOAD_RETRIES, span
+
+logger = logging.getLogger(__name__)
+
+# Размер блока чтения ответа
+BLOCK_SIZE = 1 << 16
+# "bytes 0-0/12345"
+CONTENT_RANGE = re.compile(r"bytes\s+\d+-\d+/(\d+)")
+# Коды ответа, после которых запрос имеет смысл повторить
+RETRYABLE_STATUS = (408, 425, 429, 500, 502, 503, 504)
+# Загрузка, файлы которой менялись не раньше стольких секунд назад,
+# считается выполняющейся и не удаляется
+ACTIVE_SECONDS = 10 * 60
+# Суффиксы файлов одной загрузки path
+DOWNLOAD_SUFFIXES = (".part", ".state", ".state.tmp")
+
+
+class DownloadError(Exception):
+    """
+    Загрузка не завершена за отведённое число попыток
+    """
+
+
+def download_dir() -> str:
+    """
+    Каталог загрузок (DOWNLOAD_DIR) на диске. Он не удаляется вместе с
+    каталогом задания, поэтому прерванная загрузка видео продолжается
+    следующим заданием.
+    """
+    return os.environ.get("DOWNLOAD_DIR", os.path.join("data", "downloads"))
+
+
+def evict_downloads(root: str, max_bytes: int = None, ttl: int = None):
+    """
+    Удаление загрузок root старше ttl секунд и, если загрузки занимают
+    больше max_bytes, давно не обновлявшихся (LRU по времени изменения).
+    Выполняющиеся загрузки (ACTIVE_SECONDS) не удаляются.
+    """
+    if max_bytes is None:
+        max_bytes = int(os.environ.get("DOWNLOAD_MAX_BYTES", 4 * 1024**3))
+    if ttl is None:
+        ttl = int(os.environ.get("DOWNLOAD_TTL", 24 * 60 * 60))
+
+    # путь загрузки -> [время последнего изменения, размер, файлы]
+    downloads = {}
+    for entry in os.scandir(root):
+        if not entry.is_file():
+            continue
+        path = entry.path
+        for suffix in DOWNLOAD_SUFFIXES:
+            if path.endswith(suffix):
+                path = path[: -len(suffix)]
+                break
+        try:
+            stat = entry.stat()
+        except FileNotFoundError:
+            continue
+        download = downloads.setdefault(path, [0.0, 0, []])
+        download[0] = max(download[0], stat.st_mtime)
+        download[1] += stat.st_size
+        download[2].append(entry.path)
+
+    now = time.time()
+    total_size = sum(size for _, size, _ in downloads.values())
+    for path, (modified, size, files) in sorted(
+        downloads.items(), key=lambda item: item[1][0]
+    ):
+        if now - modified < ACTIVE_SECONDS:
+            continue
+        if now - modified <= ttl and total_size <= max_bytes:
+            continue
+        logger.info(f"Removing download {path}")
+        for file in files:
+            try:
+                os.remove(file)
+            except FileNotFoundError:
+                pass
+        total_size -= size
+
+
+class RangeDownloader:
+    """
+    Download of a media stream into a file by HTTP range requests.
+
+    The stream is split into parts of segmentsize bytes that are fetched by
+    connections parallel requests into a preallocated path + ".part" file.
+    Finished parts are recorded in path + ".state", so a later call for the
+    same path downloads only the missing parts. A failed request is resumed
+    from the last received byte after a bounded exponential backoff with
+    jitter, at most maxattempts times per part. Servers without range
+    support are read with a single request.
+    """
+
+    backoff_base = 0.5
+    backoff_cap = 30.0
+
+    def __init__(
+        self, connections=None, segmentsize=None, maxattempts=None, timeout=30.0
+    ):
+        """
+        RangeDownloader constructor
+
+        Parameters:
+            connections (int, optional): Parallel requests (DOWNLOAD_CONNECTIONS)
+            segmentsize (int, optional): Part size in bytes (DOWNLOAD_SEGMENT_SIZE)
+            maxattempts (int, optional): Attempts per request (DOWNLOAD_MAX_ATTEMPTS)
+            timeout (float, optional): Socket timeout in seconds
+        """
+        if connections is None:
+            connections = int(os.environ.get("DOWNLOAD_CONNECTIONS", "4"))
+        if segmentsize is None:
+            segmentsize = int(os.environ.get("DOWNLOAD_SEGMENT_SIZE", 4 * 1024**2))
+        if maxattempts is None:
+            maxattempts = int(os.environ.get("DOWNLOAD_MAX_ATTEMPTS", "5"))
+
+        self.connections = max(connections, 1)
+        self.segmentsize = max(segmentsize, BLOCK_SIZE)
+        self.maxattempts = max(maxattempts, 1)
+        self.timeout = timeout
+
+    def download(self, url, path):
+        """
+        Download url into path
+
+        Parameters:
+            url (str): Media url
+            path (str): Output file
+
+        Returns:
+            str: path
+        """
+        if os.path.exists(path):
+            logger.info(f"{path} exists. Download skipped")
+            return path
+
+        partpath = path + ".part"
+        statepath = path + ".state"
+
+        size = self.__retry(lambda: self.__probe(url), "probe")
+        with span("download", bytes=size) as stage:
+            if size is None:
+                logger.info("Server ignores ranges, downloading with one request")
+                self.__retry(lambda: self.__fetch_whole(url, partpath), "whole")
+            else:
+                parts = [
+                    (first, min(first + self.segmentsize, size) - 1)
+                    for first in range(0, size, self.segmentsize)
+                ]
+                done = self.__load_state(statepath, partpath, size)
+                if not done:
+                    # файл нужного размера для записи частей по смещениям
+                    with open(partpath, "wb") as f:
+                        f.truncate(size)
+                stage.attributes["parts"] = len(parts)
+                stage.attributes["resumed"] = len(done)
+                self.__fetch_parts(url, partpath, statepath, parts, done, size)
+
+        os.replace(partpath, path)
+        if os.path.exists(statepath):
+            os.remove(statepath)
+        logger.info(f"Downloaded {os.path.getsize(path)} bytes to {path}")
+        return path
+
+    def __fetch_parts(self, url, partpath, statepath, parts, done, size):
+        lock = threading.Lock()
+        missing = [index for index in range(len(parts)) if index not in done]
+
+        def fetch(fd, index):
+            first, last = parts[index]
+            self.__fetch_range(url, fd, first, last)
+            with lock:
+                done.add(index)
+                self.__save_state(statepath, size, done)
+
+        fd = os.open(partpath, os.O_WRONLY)
+        try:
+            with ThreadPoolExecutor(
+                max_workers=min(self.connections, max(len(missing), 1))
+            ) as executor:
+                futures = [executor.submit(fetch, fd, index) for index in missing]
+                try:
+                    for future in futures:
+                        future.result()
+                except BaseException:
+                    # части, которые ещё не начаты, не загружаются
+                    executor.shutdown(wait=True, cancel_futures=True)
+                    raise
+        finally:
+            os.close(fd)
+
+    def __fetch_range(self, url, fd, first, last):
+        """
+        Bytes first..last of url written at the same offsets of fd
+        """
+        offset = first
+        attempt = 0
+        while offset <= last:
+            request = self.__request(url, f"bytes={offset}-{last}")
+            try:
+                with urllib.request.urlopen(request, timeout=self.timeout) as response:
+                    if response.status != 206:
+                        raise DownloadError(f"Range request answered {response.status}")
+                    while offset <= last:
+                        block = response.read(min(BLOCK_SIZE, last - offset + 1))
+                        if not block:
+                            break
+                        os.pwrite(fd, block, offset)
+                        offset += len(block)
+                        DOWNLOAD_BYTES.inc(len(block))
+                if offset <= last:
+                    raise http.client.IncompleteRead(b"", last - offset + 1)
+            except Exception as e:
+                if not self.__retryable(e):
+                    raise
+                attempt += 1
+                if attempt >= self.maxattempts:
+                    raise DownloadError(
+                        f"Bytes {offset}-{last} failed after {attempt} attempts: {e}"
+                    ) from e
+                # следующая попытка продолжает с последнего полученного байта
+                self.__sleep(attempt, e)
+
+    def __fetch_whole(self, url, partpath):
+        with urllib.request.urlopen(
+            self.__request(url), timeout=self.timeout
+        ) as response, open(partpath, "wb") as f:
+            expected = response.headers.get("Content-Length")
+            received = 0
+            while True:
+                block = response.read(BLOCK_SIZE)
+                if not block:
+                    break
+                f.write(block)
+                received += len(block)
+                DOWNLOAD_BYTES.inc(len(block))
+        if expected is not None and received < int(expected):
+            raise http.client.IncompleteRead(b"", int(expected) - received)
+
+    def __probe(self, url):
+        """
+        Size of the stream, None if the server ignores ranges
+        """
+        with urllib.request.urlopen(
+            self.__request(url, "bytes=0-0"), timeout=self.timeout
+        ) as response:
+            if response.status != 206:
+                return None
+            match = CONTENT_RANGE.match(response.headers.get("Content-Range", ""))
+            if match is None:
+                return None
+            return int(match.group(1))
+
+    def __retry(self, call, name):
+        attempt = 0
+        while True:
+            try:
+                return call()
+            except Exception as e:
+                if not self.__retryable(e):
+                    raise
+                attempt += 1
+                if attempt >= self.maxattempts:
+                    raise DownloadError(
+                        f"Download {name} failed after {attempt} attempts: {e}"
+                    ) from e
+                self.__sleep(attempt, e)
+
+    def __sleep(self, attempt, error):
+        delay = random.uniform(
+            0, min(self.backoff_cap, self.backoff_base * 2**attempt)
+        )
+        DOWNLOAD_RETRIES.inc(error=type(error).__name__)
+        logger.warning(f"Download failed: {error}. Retry {attempt} in {delay:.1f} s")
+        time.sleep(delay)
+
+    @staticmethod
+    def __retryable(error):
+        if isinstance(error, urllib.error.HTTPError):
+            return error.code in RETRYABLE_STATUS
+        # обрыв соединения, таймаут, неполный ответ
+        return isinstance(error, (OSError, http.client.HTTPException))
+
+    @staticmethod
+    def __request(url, byterange=None):
+        headers = {"User-Agent": "Mozilla/5.0"}
+        if byterange is not None:
+            headers["Range"] = byterange
+        return urllib.request.Request(url, headers=headers)
+
+    def __load_state(self, statepath, partpath, size):
+        """
+        Parts finished by an earlier call, empty if it downloaded something else
+        """
+        try:
+            with open(statepath) as f:
+                state = json.load(f)
+            if (
+                state["size"] == size
+                and state["segmentsize"] == self.segmentsize
+                and os.path.getsize(partpath) == size
+            ):
+                logger.info(f"Resuming download, {len(state['done'])} parts done")
+                return set(state["done"])
+        except (OSError, ValueError, KeyError):
+            pass
+        return set()
+
+    def __save_state(self, statepath, size, done):
+        tmppath = statepath + ".tmp"
+        with open(tmppath, "w") as f:
+            json.dump(
+                {"size": size, "segmentsize": self.segmentsize, "done": sorted(done)},
+                f,
+            )
+        os.replace(tmppath, statepath)
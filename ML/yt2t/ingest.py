@@ -0,0 +1,82 @@
+import logging
+import os
+
+import ffmpeg
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Размер блока чтения из ffmpeg
+BLOCK_SIZE = 1 << 20
+
+
+def decode_pcm(
+    source: str,
+    samplingrate: int = 16000,
+    spillpath: str = None,
+    memorylimit: int = None,
+) -> np.ndarray:
+    """
+    Decode audio of source (url or file) once into raw s16le mono PCM
+
+    Samples are read from the ffmpeg pipe block by block. Short audio is kept
+    in a single in-memory buffer; once the buffer grows beyond memorylimit
+    bytes and spillpath is given, the rest of the stream is written to
+    spillpath and the result is a read-only memory map of that file.
+
+    Parameters:
+        source (str): Url or path of media with an audio stream
+        samplingrate (int, optional): Output sampling rate
+        spillpath (str, optional): Raw PCM file for long audio
+        memorylimit (int, optional): In-memory buffer limit in bytes (INGEST_MEMORY_LIMIT)
+
+    Returns:
+        np.ndarray: int16 samples (np.memmap for spilled audio)
+    """
+    if memorylimit is None:
+        memorylimit = int(os.environ.get("INGEST_MEMORY_LIMIT", 64 * 1024**2))
+
+    process = (
+        ffmpeg.input(source)
+        .output("pipe:", format="s16le", acodec="pcm_s16le", ac=1, ar=str(samplingrate))
+        .global_args("-loglevel", "error")
+        .run_async(pipe_stdout=True)
+    )
+
+    buffer = bytearray()
+    spillfile = None
+    try:
+        while True:
+            block = process.stdout.read(BLOCK_SIZE)
+            if not block:
+                break
+            if spillfile is not None:
+                spillfile.write(block)
+                continue
+            buffer.extend(block)
+            if spillpath is not None and len(buffer) > memorylimit:
+                logger.info(
+                    f"Audio exceeds {memorylimit} bytes, spilled to {spillpath}"
+                )
+                spillfile = open(spillpath, "wb")
+                spillfile.write(buffer)
+                buffer = bytearray()
+    finally:
+        process.stdout.close()
+        returncode = process.wait()
+        if spillfile is not None:
+            spillfile.close()
+
+    if returncode != 0:
+        raise ffmpeg.Error("ffmpeg", None, None)
+
+    if spillfile is not None:
+        # нечётный хвост не образует отсчёта
+        size = os.path.getsize(spillpath) // 2
+        if size == 0:
+            return np.zeros(0, dtype=np.int16)
+        return np.memmap(spillpath, dtype=np.int16, mode="r", shape=(size,))
+
+    if len(buffer) % 2:
+        del buffer[-1]
+    return np.frombuffer(buffer, dtype=np.int16)
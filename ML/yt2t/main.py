@@ -3,23 +3,28 @@ import logging
 import os
 import re
 import sys
-import time
+import uuid
 from datetime import datetime
 
 import dotenv
 import ffmpeg
 import numpy as np
 import openai
-import pandas as pd
 import speech_recognition as sr
-import whisper
 from pydub import AudioSegment
 from pydub.silence import detect_nonsilent
-from pytube import YouTube
+
+from ..metrics import AUDIO_SECONDS, REALTIME_FACTOR, span
+from ..video_info import get_video_info
+from . import silence
+from .download import RangeDownloader, download_dir, evict_downloads
+from .ingest import decode_pcm
+from .parallel import ParallelTranscriber
+from .transcriber import segment_to_array
+from .transcript import Transcript
 
 dotenv.load_dotenv(".env")
 openai.api_key = os.environ.get("API_KEY")
-model_whisper = whisper.load_model("medium")
 
 logging.basicConfig(
     format="%(asctime)s | %(levelname)s | [%(filename)s:%(lineno)d] %(message)s",
@@ -31,46 +36,43 @@ logging.basicConfig(
 logger = logging.getLogger(__name__)
 
 
-def merge_rows(df):
-    # Функция для проверки наличия двух точек в конце строки
-    def has_two_or_more_dots(text):
-        return re.search(r"\.{2,}$", text) is not None
-
-    # Объединение строк и обновление времени
-    new_rows = []
-    current_row = None
-
-    for index, row in df.iterrows():
-        if current_row is None:
-            current_row = row
-        else:
-            if has_two_or_more_dots(current_row["text"]):
-                current_row["text"] += " " + row["text"]
-            else:
-                new_rows.append(current_row)
-                current_row = row
+# Две и более точки в конце строки - фраза продолжается в следующей строке
+TWO_OR_MORE_DOTS = re.compile(r"\.{2,}$")
 
-    # Добавление последней строки
-    new_rows.append(current_row)
-
-    # Создание нового датафрейма с обновленными данными
-    new_df = pd.DataFrame(new_rows)
-    new_df.reset_index(drop=True, inplace=True)
-
-    return new_df
 
+def merge_rows(transcript: Transcript) -> Transcript:
+    """
+    Объединение строк, оканчивающихся на "..", со следующими строками.
+    Время объединённой строки - время её первой строки.
+    """
+    # Строка начинает новую группу, если предыдущая не оканчивается на ".."
+    texts = transcript.texts
+    starts = [
+        i
+        for i in range(len(texts))
+        if i == 0 or not TWO_OR_MORE_DOTS.search(texts[i - 1])
+    ]
+    ends = starts[1:] + [len(texts)]
 
-def format_times(milliseconds_array):
-    hours = milliseconds_array // (1000 * 60 * 60)
-    minutes = (milliseconds_array // (1000 * 60)) % 60
-    seconds = (milliseconds_array // 1000) % 60
-    milliseconds = milliseconds_array % 1000
+    return Transcript(
+        [" ".join(texts[start:end]) for start, end in zip(starts, ends)],
+        [transcript.starts[i] for i in starts],
+        [transcript.ends[i] for i in starts],
+    )
 
-    formatted_times = []
-    for h, m, s, ms in zip(hours, minutes, seconds, milliseconds):
-        formatted_times.append(f"{h:02d}:{m:02d}:{s:02d}.{ms:03d}")
 
-    return np.array(formatted_times)
+def transcribe_chunks(chunks, audio_seconds):
+    """
+    Whisper transcription of chunk arrays with audio and realtime factor metrics
+    """
+    with span(
+        "whisper", chunks=len(chunks), audio_seconds=round(audio_seconds, 1)
+    ) as stage:
+        texts = ParallelTranscriber().transcribe(chunks)
+    AUDIO_SECONDS.inc(audio_seconds)
+    if audio_seconds > 0:
+        REALTIME_FACTOR.observe(stage.duration / audio_seconds)
+    return texts
 
 
 def split_on_silence(
@@ -101,8 +103,29 @@ def split_on_silence(
         default: 100ms
 
     seek_step - step size for interating over the segment in ms
+
+    16-bit audio is split with the vectorized detection of .silence,
+    other sample widths fall back to pydub.silence.detect_nonsilent
     """
 
+    if audio_segment.sample_width == 2:
+        samples = np.frombuffer(audio_segment.raw_data, dtype=np.int16).reshape(
+            -1, audio_segment.channels
+        )
+        if audio_segment.channels == 1:
+            samples = samples[:, 0]
+        return [
+            [audio_segment[start:end], start, end]
+            for _, start, end in silence.split_on_silence(
+                samples,
+                audio_segment.frame_rate,
+                min_silence_len,
+                silence_thresh,
+                keep_silence,
+                seek_step,
+            )
+        ]
+
     # from the itertools documentation
     def pairwise(iterable):
         "s -> (s0,s1), (s1,s2), (s2, s3), ..."
@@ -143,15 +166,19 @@ class YT2T:
     __audioextension = ["flac", "wav"]
     __textextension = "csv"
 
-    def __init__(self, outputpath=None):
+    def __init__(self, outputpath=None, workspace=None):
         """
         YT2T constructor
 
         Parameters:
             outputpath (str): Output directory to save audio and csv files
+            workspace (Workspace, optional): Job workspace used as output directory
         """
 
-        if outputpath is None:
+        self.workspace = workspace
+        if workspace is not None:
+            outputpath = workspace.dir("yt2t")
+        elif outputpath is None:
             outputpath = os.path.join(os.path.expanduser("~"), "YT2A")
 
         logger.info(f"YT2T content file saved at path {outputpath}")
@@ -170,22 +197,32 @@ class YT2T:
     def url2text(
         self,
         urlpath=None,
-        yt=None,
+        info=None,
         outfile=None,
         audioformat="flac",
         audiosamplingrate=16000,
         lang="en-US",
+        ingest="stream",
     ):
         """
         Convert youtube url to text
 
         Parameters:
             urlpath (str): Youtube url
+            info (VideoInfo, optional): Already resolved video
             outfile (str, optional): File path/name of output file (.csv)
             audioformat (str, optional): Audioformat supported in self.__audioextension
             audiosamplingrate (int, optional): Audio sampling rate
+            ingest (str, optional): "stream" decodes audio once into a PCM buffer,
+                "file" saves audio file first (audioformat) and reads it back
         """
 
+        if ingest == "stream":
+            pcm = self.url2pcm(
+                urlpath=urlpath, info=info, audiosamplingrate=audiosamplingrate
+            )
+            return self.pcm2text(pcm, audiosamplingrate=audiosamplingrate, lang=lang)
+
         outfilepath = None
         audiofile = None
 
@@ -230,9 +267,9 @@ class YT2T:
         audiofile = self.__configurepath(audiofile, outfilepath, self.audiopath)
         textfile = self.__configurepath(textfile, outfilepath, self.textpath)
 
-        if yt != None:
+        if info != None:
             self.url2audio(
-                audiofile=audiofile, audiosamplingrate=audiosamplingrate, yt=yt
+                audiofile=audiofile, audiosamplingrate=audiosamplingrate, info=info
             )
         elif urlpath != None:
             self.url2audio(
@@ -241,10 +278,12 @@ class YT2T:
                 audiosamplingrate=audiosamplingrate,
             )
         # Изменить на определение языка
-        df = self.audio2text(audiofile=audiofile, textfile=textfile, lang=lang)
-        return df
+        transcript = self.audio2text(audiofile=audiofile, textfile=textfile, lang=lang)
+        return transcript
 
-    def url2audio(self, urlpath=None, audiofile=None, audiosamplingrate=16000, yt=None):
+    def url2audio(
+        self, urlpath=None, audiofile=None, audiosamplingrate=16000, info=None
+    ):
         """
         Convert youtube url to audiofile
 
@@ -252,6 +291,7 @@ class YT2T:
             urlpath (str): Youtube url
             audiofile (str, optional): File path/name to save audio file
             audiosamplingrate (int, optional): Audio sampling rate
+            info (VideoInfo, optional): Already resolved video
         """
 
         audioformat = self.__audioextension[0]
@@ -277,46 +317,98 @@ class YT2T:
             logger.info(f"Audio file exist at {audiofile}. Download skipped")
 
         else:
-            audio = None
+            if urlpath != None and info == None:
+                info = get_video_info(urlpath)
 
-            done = False
-            while not done:
-                try:
-                    if urlpath != None and yt == None:
-                        yt = YouTube(urlpath)
+            sourcefile = self.__downloadaudio(info)
 
-                    stream_url = yt.streams[0].url
+            acodec = "pcm_s16le" if audioformat == "wav" else audioformat
 
-                    video = self.get_yt_video(yt)
+            logger.info(f"Audio at sample rate {audiosamplingrate}")
+            with span("url2audio", audioformat=audioformat):
+                (
+                    ffmpeg.input(sourcefile)
+                    .output(
+                        audiofile,
+                        format=audioformat,
+                        **{"ar": str(audiosamplingrate), "acodec": acodec},
+                    )
+                    .global_args("-loglevel", "error")
+                    .run(overwrite_output=True)
+                )
+            os.remove(sourcefile)
 
-                    acodec = "pcm_s16le" if audioformat == "wav" else audioformat
+            logger.info(f"Download completed at {audiofile}")
 
-                    logger.info(f"Audio at sample rate {audiosamplingrate}")
-                    audio, err = (
-                        ffmpeg.input(stream_url)
-                        .output(
-                            "pipe:",
-                            format=audioformat,
-                            **{"ar": str(audiosamplingrate), "acodec": acodec},
-                        )
-                        .run(capture_stdout=True)
-                    )
-                    done = True
-                except Exception as e:
-                    print("Ошибка при скачивании.", flush=True)
-                    done = False
-                    time.sleep(10)
+    def url2pcm(self, urlpath=None, info=None, audiosamplingrate=16000):
+        """
+        Download audio-only stream of youtube video and decode it into s16le mono PCM
 
-            with open(audiofile, "wb") as f:
-                f.write(audio)
+        Long audio is spilled to a raw file and memory-mapped. The file is
+        kept on disk (Workspace.disk) even when the workspace is on tmpfs,
+        otherwise the spill would take RAM beyond INGEST_MEMORY_LIMIT.
 
-            logger.info(f"Download completed at {audiofile}")
+        Parameters:
+            urlpath (str): Youtube url
+            info (VideoInfo, optional): Already resolved video
+            audiosamplingrate (int, optional): Audio sampling rate
+
+        Returns:
+            np.ndarray: int16 samples
+        """
+
+        spillname = self.__generatefiletitle() + ".pcm"
+        if self.workspace is not None:
+            spillpath = self.workspace.disk().file("yt2t", "audio", spillname)
+        else:
+            spillpath = os.path.join(self.audiopath, spillname)
+
+        if urlpath != None and info == None:
+            info = get_video_info(urlpath)
 
-    def get_yt_video(self, yt):
-        video = yt.streams.get_highest_resolution()
-        # get the video with the extension and
-        # resolution passed in the get() function
-        return video
+        sourcefile = self.__downloadaudio(info)
+
+        logger.info(f"Audio at sample rate {audiosamplingrate}")
+        with span("url2pcm"):
+            pcm = decode_pcm(
+                sourcefile, samplingrate=audiosamplingrate, spillpath=spillpath
+            )
+        os.remove(sourcefile)
+
+        # файл остаётся доступным через отображение в память до освобождения массива
+        if os.path.exists(spillpath):
+            os.remove(spillpath)
+
+        logger.info(f"Decoded {len(pcm) / audiosamplingrate:.1f} s of audio")
+        return pcm
+
+    def pcm2text(self, pcm, audiosamplingrate=16000, lang="en-US"):
+        """
+        Convert s16le mono PCM to text
+
+        Parameters:
+            pcm (np.ndarray): int16 samples
+            audiosamplingrate (int, optional): Audio sampling rate
+
+        Returns:
+            Transcript: timed rows of texts
+        """
+
+        # chunks are views of pcm
+        with span("split_on_silence") as stage:
+            chunks = silence.split_on_silence(
+                pcm,
+                audiosamplingrate,
+                min_silence_len=1000,
+                silence_thresh=silence.dbfs(pcm) - 14,
+                keep_silence=200,
+            )
+            stage.attributes["chunks"] = len(chunks)
+        texts = transcribe_chunks(
+            [audio_chunk[0] for audio_chunk in chunks], len(pcm) / audiosamplingrate
+        )
+
+        return self.__transcriptionframe(texts, chunks)
 
     def audio2text(self, audiofile, textfile=None, lang="en-US"):
         """
@@ -374,14 +466,14 @@ class YT2T:
                 audiochunkfolder + "." + self.__textextension, None, self.textpath
             )
 
-        df = self._get_large_audio_transcription(
+        transcript = self._get_large_audio_transcription(
             audiofile,
             audiochunkfolder=audiochunkfolder,
             audiochunkpath=audiochunkpath,
             lang=lang,
         )
 
-        return df
+        return transcript
         # df.to_csv(textfile, index=False)
         # logger.info(f"Output text file saved at {textfile}")
 
@@ -394,102 +486,80 @@ class YT2T:
 
         1Parameters:
             audiofullpath (str): Absolute/relative path to text file
-            audiochunkfolder (str): folder name of audio chunk
-            audiochunkpath (str, optional): Absolute/relative path to save snippet of audio file
+            audiochunkfolder (str): folder name of audio chunk (unused, chunks stay in memory)
+            audiochunkpath (str, optional): Absolute/relative path to save snippet of audio file (unused)
 
         Returns:
-            DataFrame: df with rows of texts
+            Transcript: timed rows of texts
         """
 
-        audiochunkpath = self.__configurepath(
-            audiochunkfolder, audiochunkpath, self.audiochunkpath
-        )
-
-        if not os.path.isdir(audiochunkpath):
-            os.mkdir(audiochunkpath)
-
         # open the audio file using pydub
         logger.info(f"Audio -> Text: {audiofullpath}")
-        # logger.info(f"Audio chunk path: {audiochunkpath}")
 
         audioformat = audiofullpath.split(".")[-1]
 
         sound = None
-        if audioformat == "wav":
-            sound = AudioSegment.from_wav(audiofullpath)
+        with span("load_audio", audioformat=audioformat):
+            if audioformat == "wav":
+                sound = AudioSegment.from_wav(audiofullpath)
 
-        elif audioformat == "flac":
-            sound = AudioSegment.from_file(audiofullpath, audioformat)
+            elif audioformat == "flac":
+                sound = AudioSegment.from_file(audiofullpath, audioformat)
 
         # split audio sound where silence is 700 miliseconds or more and get chunks
-        chunks = split_on_silence(
-            sound,
-            # experiment with this value for your target audio file
-            min_silence_len=1000,
-            # adjust this per requirement
-            silence_thresh=sound.dBFS - 14,
-            # keep the silence for 1 second, adjustable as well
-            keep_silence=200,
+        with span("split_on_silence") as stage:
+            chunks = split_on_silence(
+                sound,
+                # experiment with this value for your target audio file
+                min_silence_len=1000,
+                # adjust this per requirement
+                silence_thresh=sound.dBFS - 14,
+                # keep the silence for 1 second, adjustable as well
+                keep_silence=200,
+            )
+            stage.attributes["chunks"] = len(chunks)
+
+        # chunks are passed to whisper as PCM arrays, without export to files
+        texts = transcribe_chunks(
+            [segment_to_array(audio_chunk[0]) for audio_chunk in chunks],
+            len(sound) / 1000,
         )
 
-        whole_text = []
-        audio_file = []
-        start_time = []
-        end_time = []
-
-        # process each chunk
-        for i, audio_chunk in enumerate(chunks, start=1):
-            # export audio chunk and save it in
-            # the `folder_name` directory.
-            chunkfilename = f"chunk{i}." + audioformat
-            chunkfilepath = os.path.join(audiochunkpath, chunkfilename)
-            audio_chunk[0].export(chunkfilepath, format=audioformat)
-
-            # recognize the chunk
-            # with sr.AudioFile(chunkfilepath) as source:
-            #     audio_listened = self.recognizer.record(source)
-            #     # try converting it to text
-            #     try:
-            #         #text = self.recognizer.recognize_google(audio_listened, language=lang)
-            #     except sr.UnknownValueError as e:
-            #         whole_text.append("None")
-            #         start_time.append(audio_chunk[1])
-            #         end_time.append(audio_chunk[2])
-            #     else:
-            #         text = f"{text.capitalize()}. "
-            #         whole_text.append(text)
-            #         start_time.append(audio_chunk[1])
-            #         end_time.append(audio_chunk[2])
-
-            try:
-                result = model_whisper.transcribe(chunkfilepath)
-                text = result["text"]
-
-            except sr.UnknownValueError as e:
-                whole_text.append("None")
-                start_time.append(audio_chunk[1])
-                end_time.append(audio_chunk[2])
-            else:
-                text = f"{text.capitalize()}. "
-                whole_text.append(text)
-                start_time.append(audio_chunk[1])
-                end_time.append(audio_chunk[2])
-
-            audio_file.append(os.path.join(audiochunkfolder, chunkfilename))
-
-        # return as df
-        df = pd.DataFrame(
-            {
-                "text": whole_text,
-                "file": audio_file,
-                "start_time": start_time,
-                "end_time": end_time,
-            }
+        return self.__transcriptionframe(texts, chunks)
+
+    def __transcriptionframe(self, texts, chunks):
+        """
+        Transcript from texts of chunks and [segment, start, end] chunks
+        """
+        transcript = Transcript(
+            [f"{text.capitalize()}. " for text in texts],
+            [audio_chunk[1] for audio_chunk in chunks],
+            [audio_chunk[2] for audio_chunk in chunks],
         )
-        df["start_time"] = format_times(df["start_time"])
-        df["end_time"] = format_times(df["end_time"])
-        df = merge_rows(df)
-        return df
+        return merge_rows(transcript)
+
+    def __downloadaudio(self, info):
+        """
+        Download audio-only stream of video into the download directory
+
+        The directory (DOWNLOAD_DIR) outlives job workspaces, so an
+        interrupted download of the same video is resumed by a later job.
+        The caller removes the file once it is decoded.
+
+        Parameters:
+            info (VideoInfo): Resolved video
+
+        Returns:
+            str: Path of downloaded file
+        """
+        if info.audio_url is None:
+            raise ValueError(f"No audio stream for video {info.video_id}")
+
+        downloadpath = download_dir()
+        self.__createdir(downloadpath)
+        evict_downloads(downloadpath)
+        audiofile = os.path.join(downloadpath, f"{info.video_id}.download")
+        return RangeDownloader().download(info.audio_url, audiofile)
 
     def __removeinvalidcharacter(self, strin):
         """
@@ -513,15 +583,16 @@ class YT2T:
 
     def __generatefiletitle(self):
         """
-        Generate filename according to time stamp if did not provided
+        Generate unique filename according to time stamp if did not provided
 
         Returns:
-            str: timestamp str
+            str: timestamp str with random suffix
         """
 
         now = datetime.now()
 
-        return now.strftime("%Y%h%d_%H%M%S")
+        # задания, начатые в одну секунду, не делят файлы
+        return now.strftime("%Y%h%d_%H%M%S_%f") + "_" + uuid.uuid4().hex[:8]
 
     def __createdir(self, path):
         """
@@ -0,0 +1,52 @@
+import logging
+import os
+import threading
+
+import dotenv
+
+dotenv.load_dotenv(".env")
+WHISPER_MODEL_NAME = os.environ.get("WHISPER_MODEL", "medium")
+# 1 - процессы пула заданий загружают модель в фоне сразу после запуска,
+# 0 - при первом распознавании
+WHISPER_WARM_UP = int(os.environ.get("WHISPER_WARM_UP", "0"))
+
+logger = logging.getLogger(__name__)
+
+_models = {}
+_models_lock = threading.Lock()
+
+
+def get_whisper_model(name: str = None):
+    """
+    Модель Whisper, общая для процесса.
+    Загружается при первом обращении (вместе с импортом whisper и torch).
+
+    Parameters:
+        name (str, optional): Name of whisper checkpoint, WHISPER_MODEL by default
+    """
+    if name is None:
+        name = WHISPER_MODEL_NAME
+
+    model = _models.get(name)
+    if model is None:
+        with _models_lock:
+            model = _models.get(name)
+            if model is None:
+                import whisper
+
+                logger.info(f"Loading whisper model {name}")
+                model = whisper.load_model(name)
+                _models[name] = model
+                logger.info(f"Whisper model {name} loaded")
+    return model
+
+
+def warm_up_whisper(name: str = None) -> threading.Thread:
+    """
+    Фоновая загрузка модели Whisper, чтобы первое задание не ждало её
+    """
+    thread = threading.Thread(
+        target=get_whisper_model, args=(name,), name="whisper-warm-up", daemon=True
+    )
+    thread.start()
+    return thread
@@ -0,0 +1,173 @@
+import logging
+import os
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
+
+import numpy as np
+
+from .models import get_whisper_model
+from .transcriber import BatchTranscriber
+
+logger = logging.getLogger(__name__)
+
+# Пулы процессов распознавания, переиспользуются между заданиями процесса
+_pools = {}
+# Ядра процесса пула (заданий или распознавания), None вне пула
+_pinned_cores = None
+
+
+def available_cores() -> list:
+    if hasattr(os, "sched_getaffinity"):
+        return sorted(os.sched_getaffinity(0))
+    return list(range(os.cpu_count() or 1))
+
+
+def split_cores(cores: list, parts: int) -> list:
+    """
+    Contiguous slices of cores (neighbouring ids usually share a socket)
+    """
+    size, rest = divmod(len(cores), parts)
+    slices = []
+    first = 0
+    for i in range(parts):
+        last = first + size + (1 if i < rest else 0)
+        slices.append(cores[first:last] or cores)
+        first = last
+    return slices
+
+
+def pin_to_cores(cores: list):
+    """
+    Pin the current pool worker process to its slice of cores and match
+    torch threads to it. Transcription in a pinned process runs on these
+    cores only and does not start a nested pool.
+    """
+    global _pinned_cores
+    if hasattr(os, "sched_setaffinity"):
+        os.sched_setaffinity(0, cores)
+
+    # до импорта torch: OpenMP и MKL читают число потоков при загрузке
+    threads = str(len(cores))
+    os.environ["OMP_NUM_THREADS"] = threads
+    os.environ["MKL_NUM_THREADS"] = threads
+
+    import torch
+
+    torch.set_num_threads(len(cores))
+    torch.set_num_interop_threads(1)
+    _pinned_cores = list(cores)
+
+
+def _init_worker(core_queue, model_name):
+    cores = core_queue.get()
+    pin_to_cores(cores)
+    get_whisper_model(model_name)
+    logger.info(f"Transcription worker {os.getpid()} pinned to cores {cores}")
+
+
+def _transcribe_batch(indices, chunks, batch_size, language):
+    texts = BatchTranscriber(batch_size=batch_size, language=language).transcribe(
+        chunks
+    )
+    return indices, texts
+
+
+class ParallelTranscriber:
+    """
+    Transcription of audio chunks in a pool of worker processes.
+
+    Each worker holds its own whisper model and is pinned to a disjoint
+    slice of the available cores with torch.set_num_threads equal to the
+    slice size, so workers do not oversubscribe cores. Chunks are sent to
+    the workers in batches and the texts are reassembled in chunk order.
+
+    With one worker, or inside a pinned pool worker (a job of ML.jobs.JobPool
+    already owns its share of the cores), chunks are transcribed in the
+    current process: pools are not nested and the job pool and
+    transcription share one core budget.
+    """
+
+    def __init__(
+        self,
+        workers: int = None,
+        batch_size: int = None,
+        language: str = None,
+        model_name: str = None,
+    ):
+        """
+        ParallelTranscriber constructor
+
+        Parameters:
+            workers (int, optional): Number of worker processes (TRANSCRIBE_WORKERS, default 1)
+            batch_size (int, optional): Number of chunks per decoding batch (WHISPER_BATCH_SIZE)
+            language (str, optional): Language code ("ru", "en"), detected per chunk if None
+            model_name (str, optional): Whisper checkpoint, WHISPER_MODEL by default
+        """
+        if workers is None:
+            workers = int(os.environ.get("TRANSCRIBE_WORKERS", "1"))
+        if batch_size is None:
+            batch_size = int(os.environ.get("WHISPER_BATCH_SIZE", "8"))
+
+        cores = available_cores()
+        if _pinned_cores is not None:
+            workers = 1
+        self.workers = max(min(workers, len(cores)), 1)
+        self.batch_size = max(batch_size, 1)
+        self.language = language
+        self.model_name = model_name
+        self.cores = cores
+
+    def transcribe(self, chunks) -> list:
+        """
+        Transcribe audio chunks
+
+        Parameters:
+            chunks (list of np.ndarray): mono 16 kHz audio of each chunk, int16 or float32
+
+        Returns:
+            list: text of each chunk, in the order of chunks
+        """
+        if self.workers == 1 or len(chunks) <= self.batch_size:
+            return BatchTranscriber(
+                batch_size=self.batch_size, language=self.language
+            ).transcribe(chunks)
+
+        pool = self.__pool()
+        futures = []
+        for first in range(0, len(chunks), self.batch_size):
+            indices = list(range(first, min(first + self.batch_size, len(chunks))))
+            futures.append(
+                pool.submit(
+                    _transcribe_batch,
+                    indices,
+                    [np.ascontiguousarray(chunks[i]) for i in indices],
+                    self.batch_size,
+                    self.language,
+                )
+            )
+
+        texts = [None] * len(chunks)
+        for future in futures:
+            indices, batch_texts = future.result()
+            for i, text in zip(indices, batch_texts):
+                texts[i] = text
+
+        logger.info(f"Transcribed {len(chunks)} chunks in {self.workers} processes")
+        return texts
+
+    def __pool(self):
+        key = (self.workers, self.model_name, tuple(self.cores))
+        pool = _pools.get(key)
+        if pool is None:
+            context = get_context("spawn")
+            core_queue = context.Queue()
+            for cores in split_cores(self.cores, self.workers):
+                core_queue.put(cores)
+            pool = ProcessPoolExecutor(
+                max_workers=self.workers,
+                mp_context=context,
+                initializer=_init_worker,
+                initargs=(core_queue, self.model_name),
+            )
+            _pools[key] = pool
+        return pool
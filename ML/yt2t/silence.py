@@ -0,0 +1,213 @@
+import math
+
+import numpy as np
+
+# Число миллисекунд, обрабатываемых за один шаг при подсчёте энергии
+BLOCK_MS = 60 * 1000
+BLOCK_SAMPLES = 1 << 20
+
+
+def _ms_to_frame(ms, frame_rate):
+    # та же формула, что и при срезе pydub.AudioSegment
+    return int(ms * (frame_rate / 1000.0))
+
+
+def _ms_to_frames(ms_array, frame_rate):
+    # _ms_to_frame для массива, те же операции над float64
+    return (ms_array * (frame_rate / 1000.0)).astype(np.int64)
+
+
+def _duration_ms(samples, frame_rate):
+    # len(pydub.AudioSegment)
+    return round(1000 * (len(samples) / frame_rate))
+
+
+def _ms_energy_cumsum(samples, frame_rate, duration_ms):
+    """
+    Cumulative sum of squared samples at every millisecond boundary:
+    result[k] is the energy of samples[0 : _ms_to_frame(k)].
+    Computed blockwise, so only BLOCK_MS of int64 squares are held at once.
+    """
+    bounds = _ms_to_frames(np.arange(duration_ms + 1, dtype=np.int64), frame_rate)
+    # срез pydub за концом данных дополняется тишиной
+    bounds = np.minimum(bounds, len(samples))
+
+    energy = np.zeros(duration_ms + 1, dtype=np.int64)
+    total = 0
+    for block_start in range(0, duration_ms, BLOCK_MS):
+        block_end = min(block_start + BLOCK_MS, duration_ms)
+        first, last = bounds[block_start], bounds[block_end]
+        block = samples[first:last].astype(np.int64)
+        squares = block * block
+        if squares.ndim == 2:
+            squares = squares.sum(axis=1)
+        block_cumsum = np.concatenate(([0], np.cumsum(squares)))
+        energy[block_start + 1 : block_end + 1] = (
+            total + block_cumsum[bounds[block_start + 1 : block_end + 1] - first]
+        )
+        total = energy[block_end]
+    return energy
+
+
+def dbfs(samples, max_possible_amplitude=32768):
+    """
+    Loudness of samples in dBFS, same as pydub.AudioSegment.dBFS
+    """
+    if len(samples) == 0:
+        return -float("inf")
+    energy = 0
+    for first in range(0, len(samples), BLOCK_SAMPLES):
+        block = samples[first : first + BLOCK_SAMPLES].astype(np.int64)
+        energy += int((block * block).sum())
+    rms = int(math.sqrt(energy / samples.size))
+    if rms == 0:
+        return -float("inf")
+    return 20 * math.log10(rms / max_possible_amplitude)
+
+
+def detect_silence(
+    samples,
+    frame_rate,
+    min_silence_len=1000,
+    silence_thresh=-16,
+    seek_step=1,
+    max_possible_amplitude=32768,
+):
+    """
+    Vectorized pydub.silence.detect_silence over an int16 PCM array
+
+    samples - np.ndarray of int16 samples, shape (frames,) or (frames, channels)
+
+    frame_rate - sampling rate of samples
+
+    Returns list of [start, end] silent ranges in ms
+    """
+    duration_ms = _duration_ms(samples, frame_rate)
+    if duration_ms < min_silence_len:
+        return []
+
+    threshold = 10 ** (silence_thresh / 20) * max_possible_amplitude
+    channels = 1 if samples.ndim == 1 else samples.shape[1]
+
+    last_slice_start = duration_ms - min_silence_len
+    slice_starts = np.arange(0, last_slice_start + 1, seek_step, dtype=np.int64)
+    if last_slice_start % seek_step:
+        slice_starts = np.append(slice_starts, last_slice_start)
+    slice_ends = slice_starts + min_silence_len
+
+    energy = _ms_energy_cumsum(samples, frame_rate, duration_ms)
+    window_energy = energy[slice_ends] - energy[slice_starts]
+    window_size = (
+        _ms_to_frames(slice_ends, frame_rate) - _ms_to_frames(slice_starts, frame_rate)
+    ) * channels
+
+    # audioop.rms: целая часть корня из среднего квадрата
+    with np.errstate(divide="ignore", invalid="ignore"):
+        rms = np.floor(np.sqrt(window_energy / window_size))
+    rms[window_size == 0] = 0
+
+    silence_starts = slice_starts[rms <= threshold]
+    if len(silence_starts) == 0:
+        return []
+
+    # группировка подряд идущих тихих окон
+    steps = np.diff(silence_starts)
+    breaks = np.flatnonzero((steps != seek_step) & (steps > min_silence_len))
+    range_starts = silence_starts[np.concatenate(([0], breaks + 1))]
+    range_ends = silence_starts[np.concatenate((breaks, [len(silence_starts) - 1]))]
+    range_ends = range_ends + min_silence_len
+
+    return [[int(start), int(end)] for start, end in zip(range_starts, range_ends)]
+
+
+def detect_nonsilent(
+    samples,
+    frame_rate,
+    min_silence_len=1000,
+    silence_thresh=-16,
+    seek_step=1,
+    max_possible_amplitude=32768,
+):
+    """
+    Vectorized pydub.silence.detect_nonsilent over an int16 PCM array
+
+    Returns list of [start, end] non-silent ranges in ms
+    """
+    silent_ranges = detect_silence(
+        samples,
+        frame_rate,
+        min_silence_len,
+        silence_thresh,
+        seek_step,
+        max_possible_amplitude,
+    )
+    duration_ms = _duration_ms(samples, frame_rate)
+
+    if not silent_ranges:
+        return [[0, duration_ms]]
+
+    if silent_ranges[0][0] == 0 and silent_ranges[0][1] == duration_ms:
+        return []
+
+    prev_end = 0
+    nonsilent_ranges = []
+    for start, end in silent_ranges:
+        nonsilent_ranges.append([prev_end, start])
+        prev_end = end
+
+    if end != duration_ms:
+        nonsilent_ranges.append([prev_end, duration_ms])
+
+    if nonsilent_ranges[0] == [0, 0]:
+        nonsilent_ranges.pop(0)
+
+    return nonsilent_ranges
+
+
+def split_on_silence(
+    samples,
+    frame_rate,
+    min_silence_len=1000,
+    silence_thresh=-16,
+    keep_silence=100,
+    seek_step=1,
+):
+    """
+    Returns list of [samples view, start, end] chunks from splitting samples
+    on silent sections, start and end in ms.
+
+    Same ranges and keep_silence handling as split_on_silence for
+    pydub.AudioSegment, but chunks are views of samples.
+    """
+    duration_ms = _duration_ms(samples, frame_rate)
+    if isinstance(keep_silence, bool):
+        keep_silence = duration_ms if keep_silence else 0
+
+    output_ranges = [
+        [start - keep_silence, end + keep_silence]
+        for start, end in detect_nonsilent(
+            samples, frame_rate, min_silence_len, silence_thresh, seek_step
+        )
+    ]
+
+    for range_i, range_ii in zip(output_ranges, output_ranges[1:]):
+        last_end = range_i[1]
+        next_start = range_ii[0]
+        if next_start < last_end:
+            range_i[1] = (last_end + next_start) // 2
+            range_ii[0] = range_i[1]
+
+    chunks = []
+    for start, end in output_ranges:
+        start = max(start, 0)
+        end = min(end, duration_ms)
+        chunks.append(
+            [
+                samples[
+                    _ms_to_frame(start, frame_rate) : _ms_to_frame(end, frame_rate)
+                ],
+                start,
+                end,
+            ]
+        )
+    return chunks
@@ -0,0 +1,132 @@
+import logging
+import os
+
+import numpy as np
+
+from .models import get_whisper_model
+
+SAMPLE_RATE = 16000
+
+logger = logging.getLogger(__name__)
+
+
+def segment_to_array(audio_segment) -> np.ndarray:
+    """
+    PCM of pydub.AudioSegment as float32 mono 16 kHz array in [-1, 1]
+    (the input format of whisper)
+    """
+    audio_segment = (
+        audio_segment.set_channels(1).set_frame_rate(SAMPLE_RATE).set_sample_width(2)
+    )
+    return to_float32(np.frombuffer(audio_segment.raw_data, dtype=np.int16))
+
+
+def to_float32(samples: np.ndarray) -> np.ndarray:
+    """
+    int16 PCM samples as float32 array in [-1, 1], float arrays are kept as is
+    """
+    if samples.dtype == np.int16:
+        return samples.astype(np.float32) / 32768.0
+    return samples
+
+
+class BatchTranscriber:
+    """
+    Batched whisper inference over in-memory audio chunks.
+
+    Chunks not longer than one 30 s whisper window are padded to the window
+    and decoded in batches (one encoder/decoder pass per batch). Longer
+    chunks and chunks whose batched decoding looks unreliable go through
+    model.transcribe with its sliding window and temperature fallback.
+    Chunks that model.transcribe would skip as silence (likely no speech
+    and low confidence) are transcribed as empty text.
+    """
+
+    # Пороги model.transcribe для повторного распознавания и тишины
+    compression_ratio_threshold = 2.4
+    logprob_threshold = -1.0
+    no_speech_threshold = 0.6
+
+    def __init__(self, model=None, batch_size: int = None, language: str = None):
+        """
+        BatchTranscriber constructor
+
+        Parameters:
+            model (whisper.Whisper, optional): Whisper model, shared process model by default
+            batch_size (int, optional): Number of chunks per decoding batch (WHISPER_BATCH_SIZE)
+            language (str, optional): Language code ("ru", "en"), detected per chunk if None
+        """
+        if batch_size is None:
+            batch_size = int(os.environ.get("WHISPER_BATCH_SIZE", "8"))
+
+        self.model = model
+        self.batch_size = max(batch_size, 1)
+        self.language = language
+
+    def transcribe(self, chunks) -> list:
+        """
+        Transcribe audio chunks
+
+        Parameters:
+            chunks (list of np.ndarray): mono 16 kHz audio of each chunk, int16 or float32.
+                int16 views are converted one batch at a time
+
+        Returns:
+            list: text of each chunk, in the order of chunks
+        """
+        import torch
+        import whisper
+
+        model = self.model if self.model is not None else get_whisper_model()
+        fp16 = model.device.type == "cuda"
+
+        texts = [None] * len(chunks)
+        short_chunks = []
+        for i, chunk in enumerate(chunks):
+            if len(chunk) <= whisper.audio.N_SAMPLES:
+                short_chunks.append(i)
+            else:
+                texts[i] = self.__transcribe_one(model, chunk, fp16)
+
+        options = whisper.DecodingOptions(
+            language=self.language, without_timestamps=True, fp16=fp16
+        )
+        for batch_start in range(0, len(short_chunks), self.batch_size):
+            batch = short_chunks[batch_start : batch_start + self.batch_size]
+            mel = torch.stack(
+                [
+                    whisper.log_mel_spectrogram(
+                        whisper.pad_or_trim(torch.from_numpy(to_float32(chunks[i]))),
+                        n_mels=model.dims.n_mels,
+                    )
+                    for i in batch
+                ]
+            ).to(model.device)
+
+            with torch.no_grad():
+                results = whisper.decode(model, mel, options)
+
+            for i, result in zip(batch, results):
+                if (
+                    result.no_speech_prob > self.no_speech_threshold
+                    and result.avg_logprob < self.logprob_threshold
+                ):
+                    # тишина или музыка: текст был бы выдуман моделью
+                    texts[i] = ""
+                elif (
+                    result.compression_ratio > self.compression_ratio_threshold
+                    or result.avg_logprob < self.logprob_threshold
+                ):
+                    texts[i] = self.__transcribe_one(model, chunks[i], fp16)
+                else:
+                    texts[i] = result.text
+
+        logger.info(
+            f"Transcribed {len(chunks)} chunks, {len(short_chunks)} in batches of {self.batch_size}"
+        )
+        return texts
+
+    def __transcribe_one(self, model, chunk, fp16):
+        return model.transcribe(to_float32(chunk), language=self.language, fp16=fp16)[
+            "text"
+        ]
@@ -0,0 +1,130 @@
+import re
+from array import array
+
+# "HH:MM:SS.mmm" или "HH:MM:SS,mmm" (srt)
+TIME_FORMAT = re.compile(r"(\d+):(\d{2}):(\d{2})[.,](\d{3})")
+
+
+def format_time(milliseconds: int) -> str:
+    """
+    Milliseconds to "HH:MM:SS.mmm"
+    """
+    seconds, milliseconds = divmod(milliseconds, 1000)
+    minutes, seconds = divmod(seconds, 60)
+    hours, minutes = divmod(minutes, 60)
+    return f"{hours:02d}:{minutes:02d}:{seconds:02d}.{milliseconds:03d}"
+
+
+def parse_time(time_str: str) -> int:
+    """
+    "HH:MM:SS.mmm" or "HH:MM:SS,mmm" to milliseconds
+    """
+    hours, minutes, seconds, milliseconds = map(
+        int, TIME_FORMAT.fullmatch(time_str.strip()).groups()
+    )
+    return ((hours * 60 + minutes) * 60 + seconds) * 1000 + milliseconds
+
+
+class Segment:
+    """
+    One row of a transcript: text and its start and end in milliseconds
+    """
+
+    __slots__ = ("text", "start", "end")
+
+    def __init__(self, text: str, start: int, end: int):
+        self.text = text
+        self.start = start
+        self.end = end
+
+    @property
+    def start_time(self) -> str:
+        return format_time(self.start)
+
+    @property
+    def end_time(self) -> str:
+        return format_time(self.end)
+
+    def __eq__(self, other):
+        if not isinstance(other, Segment):
+            return NotImplemented
+        return (self.text, self.start, self.end) == (other.text, other.start, other.end)
+
+    def __repr__(self):
+        return f"Segment({self.text!r}, {self.start_time}, {self.end_time})"
+
+
+class Transcript:
+    """
+    Timed transcript of a video stored column-wise: a list of texts and
+    parallel array("i") of start and end offsets in milliseconds.
+
+    Iteration yields Segment objects, integer indexing returns a Segment and
+    slicing returns a Transcript. Transformations return a new Transcript and
+    keep the original unchanged.
+    """
+
+    __slots__ = ("texts", "starts", "ends")
+
+    def __init__(self, texts=(), starts=(), ends=()):
+        """
+        Transcript constructor
+
+        Parameters:
+            texts (iterable of str): Text of each segment
+            starts (iterable of int): Start of each segment in ms
+            ends (iterable of int): End of each segment in ms
+        """
+        self.texts = list(texts)
+        self.starts = array("i", starts)
+        self.ends = array("i", ends)
+        if not len(self.texts) == len(self.starts) == len(self.ends):
+            raise ValueError(
+                f"Transcript columns differ in length: {len(self.texts)} texts, "
+                f"{len(self.starts)} starts, {len(self.ends)} ends"
+            )
+
+    def append(self, text: str, start: int, end: int):
+        self.texts.append(text)
+        self.starts.append(start)
+        self.ends.append(end)
+
+    def with_texts(self, texts) -> "Transcript":
+        """
+        Transcript with the same times and new texts
+        """
+        return Transcript(texts, self.starts, self.ends)
+
+    def select(self, mask) -> "Transcript":
+        """
+        Transcript of segments where mask is true
+        """
+        transcript = Transcript()
+        for keep, text, start, end in zip(mask, self.texts, self.starts, self.ends):
+            if keep:
+                transcript.append(text, start, end)
+        return transcript
+
+    def __len__(self):
+        return len(self.texts)
+
+    def __iter__(self):
+        for text, start, end in zip(self.texts, self.starts, self.ends):
+            yield Segment(text, start, end)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return Transcript(self.texts[index], self.starts[index], self.ends[index])
+        return Segment(self.texts[index], self.starts[index], self.ends[index])
+
+    def __eq__(self, other):
+        if not isinstance(other, Transcript):
+            return NotImplemented
+        return (
+            self.texts == other.texts
+            and self.starts == other.starts
+            and self.ends == other.ends
+        )
+
+    def __repr__(self):
+        return f"Transcript({len(self)} segments)"
@@ -0,0 +1,123 @@
+"""
+Benchmark of adding frames to a document: the former create_doc round trip
+(full-size PNG from ffmpeg, PIL open, thumbnail with EMU sizes, temporary
+JPEG on disk, add_picture from the file) against JPEG bytes already scaled
+for the tier and passed to add_picture in memory.
+
+ffmpeg is replaced with PIL here: the tier JPEGs are encoded by PIL at the
+tier width, and their concatenation checks the mjpeg splitter of ML.frames.
+
+    python -m benchmarks.bench_doc_images --images 40
+"""
+import argparse
+import io
+import os
+import random
+import tempfile
+import time
+
+from docx import Document
+from docx.shared import Inches
+from PIL import Image, ImageDraw
+
+from ML.frames import IMAGE_TIERS, _read_jpegs
+
+WIDTH, HEIGHT = 1280, 720
+# качество PIL, близкое к -q:v ffmpeg уровня
+PIL_QUALITY = {"small": 60, "medium": 75, "large": 85}
+
+
+def frame(seed: int) -> Image.Image:
+    """
+    Slide-like frame: flat background, text-like bars and a photo-like area
+    """
+    rng = random.Random(seed)
+    img = Image.new("RGB", (WIDTH, HEIGHT), (245, 245, 240))
+    draw = ImageDraw.Draw(img)
+    for line in range(12):
+        y = 60 + line * 40
+        draw.rectangle((80, y, 80 + rng.randint(300, 700), y + 18), fill=(30, 30, 30))
+    for x in range(820, 1220, 8):
+        for y in range(100, 600, 8):
+            draw.rectangle(
+                (x, y, x + 8, y + 8), fill=tuple(rng.randrange(256) for _ in "rgb")
+            )
+    return img
+
+
+def encode(img: Image.Image, fmt: str, **kwargs) -> bytes:
+    out = io.BytesIO()
+    img.save(out, fmt, **kwargs)
+    return out.getvalue()
+
+
+def legacy_doc(pngs: list, tmpdir: str) -> Document:
+    doc = Document()
+    temp_image_path = os.path.join(tmpdir, "temp_image.png")
+    for png in pngs:
+        doc.add_paragraph("row")
+        img = Image.open(io.BytesIO(png))
+        img_width, img_height = img.size
+        aspect_ratio = img_width / img_height
+        desired_width = Inches(6)
+        desired_height = desired_width / aspect_ratio
+        img.thumbnail((desired_width, desired_height))
+        img.save(temp_image_path, "JPEG")
+        doc.add_picture(temp_image_path, width=desired_width, height=desired_height)
+    os.remove(temp_image_path)
+    return doc
+
+
+def tier_doc(jpegs: list) -> Document:
+    doc = Document()
+    for jpeg in jpegs:
+        doc.add_paragraph("row")
+        doc.add_picture(io.BytesIO(jpeg), width=Inches(6))
+    return doc
+
+
+def saved_size(doc: Document) -> int:
+    out = io.BytesIO()
+    doc.save(out)
+    return len(out.getvalue())
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--images", type=int, default=40)
+    args = parser.parse_args()
+
+    frames = [frame(seed) for seed in range(args.images)]
+    pngs = [encode(img, "PNG") for img in frames]
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        start = time.perf_counter()
+        doc = legacy_doc(pngs, tmpdir)
+        legacy_time = time.perf_counter() - start
+        legacy_size = saved_size(doc)
+    print(
+        f"former: {args.images} images, {legacy_size / 2**20:.2f} MiB, "
+        f"built in {legacy_time:.2f} s, 1 temporary file per image"
+    )
+
+    for tier, (max_width, _) in IMAGE_TIERS.items():
+        height = round(HEIGHT * max_width / WIDTH)
+        jpegs = [
+            encode(img.resize((max_width, height)), "JPEG", quality=PIL_QUALITY[tier])
+            for img in frames
+        ]
+        stream = io.BytesIO(b"".join(jpegs))
+        assert list(_read_jpegs(stream)) == jpegs, "jpeg stream split"
+
+        start = time.perf_counter()
+        doc = tier_doc(jpegs)
+        tier_time = time.perf_counter() - start
+        tier_size = saved_size(doc)
+        print(
+            f"{tier} ({max_width} px): {tier_size / 2**20:.2f} MiB, "
+            f"built in {tier_time:.3f} s, no temporary files"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+"""
+Benchmark of ML.yt2t.download.RangeDownloader against the local media
+server of benchmarks.pipeline serving a random fixture file: with
+per-connection bandwidth limited, as YouTube throttles a single stream,
+parallel parts are compared with one sequential request.
+
+Exact, retried and resumed downloads are checked by tests/test_download.py.
+
+    python -m benchmarks.bench_download --size 32 --rate 4
+"""
+import argparse
+import os
+import tempfile
+import time
+import urllib.request
+
+from benchmarks.pipeline import Counters, media_handler, start_server
+from ML.yt2t.download import RangeDownloader
+
+MiB = 1024**2
+
+
+def downloader(**kwargs) -> RangeDownloader:
+    downloader = RangeDownloader(**kwargs)
+    # паузы между повторами не нужны локальному серверу
+    downloader.backoff_base = 0.01
+    return downloader
+
+
+def serve(root: str, **kwargs):
+    counters = Counters()
+    server = start_server(media_handler(root, counters, **kwargs))
+    return server, counters, f"http://127.0.0.1:{server.server_address[1]}"
+
+
+def read(path: str) -> bytes:
+    with open(path, "rb") as f:
+        return f.read()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--size", type=int, default=32, help="fixture size, MiB")
+    parser.add_argument("--rate", type=float, default=4, help="MiB/s per connection")
+    parser.add_argument("--connections", type=int, default=4)
+    parser.add_argument("--segment-size", type=float, default=2, help="MiB")
+    args = parser.parse_args()
+
+    segmentsize = int(args.segment_size * MiB)
+    with tempfile.TemporaryDirectory() as root:
+        fixture = os.urandom(args.size * MiB)
+        with open(os.path.join(root, "fixture.bin"), "wb") as f:
+            f.write(fixture)
+
+        server, counters, base = serve(root, rate=args.rate * MiB)
+        start = time.perf_counter()
+        with urllib.request.urlopen(f"{base}/fixture.bin") as response:
+            assert response.read() == fixture
+        single = time.perf_counter() - start
+
+        out = os.path.join(root, "out")
+        start = time.perf_counter()
+        downloader(connections=args.connections, segmentsize=segmentsize).download(
+            f"{base}/fixture.bin", out
+        )
+        parallel = time.perf_counter() - start
+        server.shutdown()
+        assert read(out) == fixture
+
+        print(
+            f"{args.size} MiB at {args.rate} MiB/s per connection: "
+            f"one request {single:.2f} s, {args.connections} connections "
+            f"{parallel:.2f} s, speedup {single / parallel:.1f}x"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,143 @@
+"""
+Check and benchmark of keyframe selection (ML.frames.select_keyframes) on a
+synthetic slide video: every slide is shown for many sampled frames with
+sensor noise and a moving pointer, and some of those frames pass the scene
+threshold as false scene changes.
+
+The selection must keep exactly one frame per slide and respect the image
+cap. The report compares .docx size and build time of one image per
+transcript row (the former layout) with the selected keyframes.
+
+    python -m benchmarks.bench_keyframes --slides 12 --rows 300
+"""
+import argparse
+import io
+import random
+import time
+
+from docx import Document
+from docx.shared import Inches
+from PIL import Image, ImageDraw
+
+from ML.frames import select_keyframes
+
+WIDTH, HEIGHT = 640, 360
+
+
+def slide(seed: int) -> Image.Image:
+    """
+    Slide with a title bar and random text-like blocks
+    """
+    rng = random.Random(seed)
+    img = Image.new("RGB", (WIDTH, HEIGHT), (250, 250, 245))
+    draw = ImageDraw.Draw(img)
+    draw.rectangle((0, 0, WIDTH, 50), fill=tuple(rng.randrange(256) for _ in "rgb"))
+    for line in range(rng.randint(4, 9)):
+        y = 70 + line * 30
+        x = 30 + rng.randint(0, 60)
+        draw.rectangle((x, y, x + rng.randint(150, 560), y + 14), fill=(40, 40, 40))
+    x, y = rng.randint(40, WIDTH - 200), rng.randint(80, HEIGHT - 120)
+    draw.ellipse((x, y, x + 150, y + 100), outline=(200, 30, 30), width=5)
+    return img
+
+
+def shown(base: Image.Image, rng: random.Random) -> bytes:
+    """
+    JPEG of the slide as an extracted video frame: pointer and noise
+    """
+    img = base.copy()
+    draw = ImageDraw.Draw(img)
+    x, y = rng.randint(0, WIDTH - 10), rng.randint(0, HEIGHT - 10)
+    draw.polygon([(x, y), (x + 10, y + 4), (x + 4, y + 10)], fill=(0, 0, 0))
+    pixels = img.load()
+    for _ in range(300):
+        px, py = rng.randrange(WIDTH), rng.randrange(HEIGHT)
+        r, g, b = pixels[px, py]
+        pixels[px, py] = (r ^ 8, g ^ 8, b ^ 8)
+    out = io.BytesIO()
+    img.save(out, "JPEG", quality=85)
+    return out.getvalue()
+
+
+def synthetic_frames(slides: int, frames_per_slide: int, seed: int = 0) -> list:
+    """
+    iter_keyframes-like output: (time, scene score, jpeg) with a real
+    change at every slide and false changes within slides
+    """
+    rng = random.Random(seed)
+    frames = []
+    t = 0.0
+    for index in range(slides):
+        base = slide(seed * 1000 + index)
+        for repeat in range(frames_per_slide):
+            if repeat == 0:
+                score = rng.uniform(0.6, 1.0)
+            elif rng.random() < 0.3:
+                score = rng.uniform(0.3, 0.45)
+            else:
+                t += 0.5
+                continue
+            frames.append((t, score, shown(base, rng)))
+            t += 0.5
+    return frames
+
+
+def build_doc(images: list) -> tuple:
+    start = time.perf_counter()
+    doc = Document()
+    for image in images:
+        doc.add_paragraph("row")
+        doc.add_picture(io.BytesIO(image), width=Inches(6))
+    out = io.BytesIO()
+    doc.save(out)
+    return len(out.getvalue()), time.perf_counter() - start
+
+
+def check(slides: int, frames_per_slide: int):
+    frames = synthetic_frames(slides, frames_per_slide)
+    kept = select_keyframes(frames, max_images=100, distance=20)
+    assert len(kept) == slides, f"kept {len(kept)} frames for {slides} slides"
+    times = [t for t, _ in kept]
+    assert times == sorted(times)
+
+    capped = select_keyframes(frames, max_images=slides // 2, distance=20)
+    assert len(capped) == slides // 2, f"cap ignored: {len(capped)} frames"
+    assert capped[0][0] == frames[0][0], "first frame dropped by the cap"
+    return frames, kept
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--slides", type=int, default=12)
+    parser.add_argument("--frames-per-slide", type=int, default=40)
+    parser.add_argument("--rows", type=int, default=300)
+    args = parser.parse_args()
+
+    frames, kept = check(args.slides, args.frames_per_slide)
+    print(
+        f"checks: {len(frames)} candidate frames, kept one per slide "
+        f"({len(kept)}), cap respected"
+    )
+
+    start = time.perf_counter()
+    select_keyframes(frames, max_images=100)
+    selection = time.perf_counter() - start
+
+    # прежняя вёрстка: кадр после каждой строки транскрипта
+    rng = random.Random(1)
+    bases = [slide(index) for index in range(args.slides)]
+    row_images = [
+        shown(bases[row * args.slides // args.rows], rng) for row in range(args.rows)
+    ]
+    rows_size, rows_time = build_doc(row_images)
+    kept_size, kept_time = build_doc([image for _, image in kept])
+    print(
+        f"selection of {len(frames)} frames: {selection:.3f} s\n"
+        f"docx: {args.rows} row images {rows_size / 2**20:.1f} MiB "
+        f"in {rows_time:.2f} s, {len(kept)} keyframes {kept_size / 2**20:.2f} MiB "
+        f"in {kept_time:.2f} s"
+    )
+
+
+if __name__ == "__main__":
+    main()
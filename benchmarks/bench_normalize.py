@@ -0,0 +1,154 @@
+"""
+Benchmark of transcript normalization: the former iterrows implementations of
+set_capital_and_remove_punctuation_marks, concatenate_text and
+remove_rows_without_letters_and_numbers against ML.normalize on a synthetic
+transcript.
+
+    python -m benchmarks.bench_normalize --segments 10000
+"""
+import argparse
+import random
+import re
+import time
+
+import pandas as pd
+
+from ML.normalize import concatenate_texts, has_letters_or_digits, normalize_texts
+
+WORDS = ["привет", "мир", "это", "video", "about", "python", "a", "и", "42", "Whisper"]
+ENDINGS = ["", "", "", "", ".", "..", ",.", "?.", "!", "!.", ","]
+
+
+def synthetic_transcript(segments: int, seed: int = 0) -> pd.DataFrame:
+    """
+    Whisper-like rows: 1-12 words with sentence punctuation, some rows
+    without letters and some one-character rows
+    """
+    rng = random.Random(seed)
+    texts = []
+    for _ in range(segments):
+        kind = rng.random()
+        if kind < 0.03:
+            texts.append(rng.choice(["...", " - ", "?!"]))
+        elif kind < 0.05:
+            texts.append(rng.choice(["a", "Я", "5"]))
+        else:
+            words = [
+                rng.choice(WORDS) + rng.choice(ENDINGS)
+                for _ in range(rng.randint(1, 12))
+            ]
+            texts.append(" " + " ".join(words))
+    return pd.DataFrame(
+        {
+            "text": texts,
+            "start_time": ["00:00:00.000"] * segments,
+            "end_time": ["00:00:01.000"] * segments,
+        }
+    )
+
+
+def legacy_set_capital_and_remove_punctuation_marks(df: pd.DataFrame):
+    prev_text = "##"
+    for index, row in df.iterrows():
+        text: str = row["text"]
+        if len(prev_text) == 1:
+            prev_text = text
+            prev_text = text
+            continue
+        text = text.strip()
+        if (
+            prev_text == "##"
+            or prev_text[-1] in [".", "?", "!"]
+            and prev_text[-2] not in [".", "?", "!", ","]
+        ):
+            text = text.capitalize()
+
+        prev_word = "##"
+        df.at[index, "text"] = ""
+        for word in text.split(" "):
+            word = word.strip()
+            word = word.strip()
+            if len(prev_word) == 1:
+                if prev_word != "##":
+                    df.at[index, "text"] += " "
+                if word[-1] == "." and word[-2] in ["?", "!"]:
+                    word = word[:-1]
+                df.at[index, "text"] += word
+                prev_word = word
+                continue
+            if prev_word[-1] in [".", "?", "!"] and prev_word[-2] not in [
+                ".",
+                "?",
+                "!",
+                ",",
+            ]:
+                word = word.capitalize()
+
+            if prev_word != "##":
+                df.at[index, "text"] += " "
+
+            if word[-1] == "." and word[-2] in ["?", "!"]:
+                word = word[:-1]
+            df.at[index, "text"] += word
+
+            prev_word = word
+        prev_text = df.at[index, "text"]
+    return df
+
+
+def legacy_concatenate_text(df):
+    concatenated_text = ""
+    for index, row in df.iterrows():
+        text = row["text"]
+        cleaned_text = text.replace("..", "")
+        concatenated_text += cleaned_text
+    return concatenated_text
+
+
+def legacy_remove_rows_without_letters_and_numbers(df):
+    rows_to_remove = []
+    for index, row in df.iterrows():
+        text = row["text"]
+        if not re.search("[a-zA-Zа-яА-Я0-9]", text):
+            rows_to_remove.append(index)
+    df = df.drop(rows_to_remove)
+    return df
+
+
+def legacy(df: pd.DataFrame):
+    df = legacy_remove_rows_without_letters_and_numbers(df)
+    df = legacy_set_capital_and_remove_punctuation_marks(df)
+    return df["text"].tolist(), legacy_concatenate_text(df)
+
+
+def linear(df: pd.DataFrame):
+    df = df[has_letters_or_digits(df["text"].tolist())].copy()
+    df["text"] = normalize_texts(df["text"].tolist())
+    return df["text"].tolist(), concatenate_texts(df["text"].tolist())
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--segments", type=int, default=10000)
+    args = parser.parse_args()
+
+    df = synthetic_transcript(args.segments)
+
+    start = time.perf_counter()
+    reference = legacy(df.copy())
+    reference_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    result = linear(df.copy())
+    linear_time = time.perf_counter() - start
+
+    assert reference == result, "Normalized transcript differs from iterrows version"
+
+    print(f"transcript: {args.segments} segments, {len(reference[1])} characters")
+    print(f"iterrows: {reference_time:.3f} s")
+    print(f"linear:   {linear_time:.3f} s")
+    print(f"speedup:  {reference_time / linear_time:.0f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,204 @@
+"""
+Benchmark of the transcript merge stages: the former DataFrame merge_rows
+and pd.concat based form_paragraph_for_gen against the Transcript builders
+in ML.yt2t.main and ML.main on seeded Whisper-like transcripts.
+
+    python -m benchmarks.bench_paragraphs --segments 20000
+"""
+import argparse
+import random
+import re
+import time
+import tracemalloc
+
+import pandas as pd
+
+from ML.llm import count_tokens
+from ML.main import PARAGRAPH_TOKEN_BUDGET, form_paragraph_for_gen
+from ML.yt2t import Transcript
+from ML.yt2t.main import merge_rows
+
+WORDS = ["привет", "мир", "это", "video", "about", "python", "и", "42", "Whisper"]
+ENDINGS = ["", "", ".", ".", "..", "...", ",.", "?", "!"]
+
+
+def synthetic_transcript(segments: int, seed: int = 0) -> Transcript:
+    """
+    Rows of 1-15 words with Whisper punctuation and increasing times
+    """
+    rng = random.Random(seed)
+    texts, starts, ends = [], [], []
+    position = 0
+    for _ in range(segments):
+        words = [rng.choice(WORDS) for _ in range(rng.randint(1, 15))]
+        texts.append(" ".join(words) + rng.choice(ENDINGS))
+        duration = rng.randint(300, 8000)
+        starts.append(position)
+        ends.append(position + duration)
+        position += duration + rng.randint(0, 1500)
+    return Transcript(texts, starts, ends)
+
+
+def to_frame(transcript: Transcript) -> pd.DataFrame:
+    """
+    Former DataFrame representation with "HH:MM:SS.mmm" times
+    """
+    return pd.DataFrame(
+        {
+            "text": transcript.texts,
+            "start_time": [segment.start_time for segment in transcript],
+            "end_time": [segment.end_time for segment in transcript],
+        }
+    )
+
+
+def legacy_merge_rows(df):
+    def has_two_or_more_dots(text):
+        return re.search(r"\.{2,}$", text) is not None
+
+    new_rows = []
+    current_row = None
+
+    for index, row in df.iterrows():
+        if current_row is None:
+            current_row = row
+        else:
+            if has_two_or_more_dots(current_row["text"]):
+                current_row["text"] += " " + row["text"]
+            else:
+                new_rows.append(current_row)
+                current_row = row
+
+    new_rows.append(current_row)
+
+    new_df = pd.DataFrame(new_rows)
+    new_df.reset_index(drop=True, inplace=True)
+
+    return new_df
+
+
+def legacy_form_paragraph_for_gen(df: pd.DataFrame, token_budget: int = None):
+    if token_budget is None:
+        token_budget = PARAGRAPH_TOKEN_BUDGET
+
+    # было df["text"].iloc[-1] = ..., что не изменяет df при Copy-on-Write
+    df.loc[df.index[-1], "text"] = (
+        df["text"].iloc[-1].replace("..", "").replace(",.", "")
+    )
+    paragraph_df = pd.DataFrame({"text": [], "start_time": [], "end_time": []})
+    union_row = ""
+    union_start_time = None
+    union_by_len_row = ""
+    union_by_len_tokens = 0
+
+    def add_paragraph(paragraph_df, text, start_time, end_time):
+        new_row = pd.DataFrame(
+            {"text": [text], "start_time": [start_time], "end_time": [end_time]}
+        )
+        return pd.concat([paragraph_df, new_row], ignore_index=True)
+
+    for index, row in df.iterrows():
+        if union_row == "":
+            union_row = row["text"]
+            union_start_time = row["start_time"]
+        else:
+            union_row += " " + row["text"]
+        union_end_time = row["end_time"]
+
+        if ".." in row["text"] or ",." in row["text"]:
+            continue
+
+        sentence_tokens = count_tokens(union_row)
+        if (
+            union_by_len_row != ""
+            and union_by_len_tokens + sentence_tokens > token_budget
+        ):
+            paragraph_df = add_paragraph(
+                paragraph_df,
+                union_by_len_row,
+                union_by_len_start_time,
+                union_by_len_end_time,
+            )
+            union_by_len_row = ""
+            union_by_len_tokens = 0
+
+        if union_by_len_row == "":
+            union_by_len_row = union_row
+            union_by_len_start_time = union_start_time
+        else:
+            union_by_len_row += " " + union_row
+        union_by_len_end_time = union_end_time
+        union_by_len_tokens += sentence_tokens
+        union_row = ""
+
+        if union_by_len_tokens >= token_budget:
+            paragraph_df = add_paragraph(
+                paragraph_df,
+                union_by_len_row,
+                union_by_len_start_time,
+                union_by_len_end_time,
+            )
+            union_by_len_row = ""
+            union_by_len_tokens = 0
+
+    if union_by_len_row != "":
+        paragraph_df = add_paragraph(
+            paragraph_df,
+            union_by_len_row,
+            union_by_len_start_time,
+            union_by_len_end_time,
+        )
+
+    return paragraph_df
+
+
+def allocated(build) -> int:
+    """
+    Bytes held by the object returned by build
+    """
+    tracemalloc.start()
+    result = build()
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del result
+    return size
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--segments", type=int, default=20000)
+    parser.add_argument("--token-budget", type=int, default=100)
+    args = parser.parse_args()
+
+    transcript = synthetic_transcript(args.segments)
+    df = to_frame(transcript)
+    print(
+        f"memory: {args.segments} rows, "
+        f"DataFrame {allocated(lambda: to_frame(transcript)) / 2**20:.1f} MiB, "
+        f"Transcript {allocated(lambda: transcript[:]) / 2**20:.1f} MiB"
+    )
+    for name, legacy, builder in [
+        ("merge_rows", legacy_merge_rows, merge_rows),
+        (
+            "form_paragraph_for_gen",
+            lambda df: legacy_form_paragraph_for_gen(df, args.token_budget),
+            lambda transcript: form_paragraph_for_gen(transcript, args.token_budget),
+        ),
+    ]:
+        start = time.perf_counter()
+        legacy(df.copy())
+        legacy_time = time.perf_counter() - start
+
+        start = time.perf_counter()
+        builder(transcript)
+        builder_time = time.perf_counter() - start
+
+        print(
+            f"{name}: {args.segments} rows, DataFrame {legacy_time:.3f} s, "
+            f"Transcript {builder_time:.3f} s, "
+            f"speedup {legacy_time / builder_time:.0f}x"
+        )
+
+
+if __name__ == "__main__":
+    main()
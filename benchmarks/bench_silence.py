@@ -0,0 +1,69 @@
+"""
+Benchmark of silence detection: pydub.silence.detect_nonsilent (seek_step=1)
+against the vectorized ML.yt2t.silence on synthetic speech-like audio.
+
+    python -m benchmarks.bench_silence --minutes 3
+"""
+import argparse
+import time
+
+import numpy as np
+from pydub import AudioSegment
+from pydub.silence import detect_nonsilent as pydub_detect_nonsilent
+
+from ML.yt2t import silence
+
+SAMPLE_RATE = 16000
+
+
+def synthetic_speech(minutes: float, seed: int = 0) -> np.ndarray:
+    """
+    Noise bursts of 0.2-6 s separated by 0.1-2 s pauses, int16 mono 16 kHz
+    """
+    rng = np.random.default_rng(seed)
+    samples = np.zeros(int(minutes * 60 * SAMPLE_RATE), dtype=np.int16)
+    pos = 0
+    while pos < len(samples):
+        speech = int(rng.uniform(0.2, 6) * SAMPLE_RATE)
+        pause = int(rng.uniform(0.1, 2) * SAMPLE_RATE)
+        burst = rng.normal(0, 4000, size=min(speech, len(samples) - pos))
+        samples[pos : pos + len(burst)] = burst.clip(-32768, 32767)
+        samples[pos + len(burst) : pos + len(burst) + pause] = rng.normal(
+            0, 30, size=len(samples[pos + len(burst) : pos + len(burst) + pause])
+        )
+        pos += speech + pause
+    return samples
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--minutes", type=float, default=3)
+    parser.add_argument("--min-silence-len", type=int, default=1000)
+    args = parser.parse_args()
+
+    samples = synthetic_speech(args.minutes)
+    sound = AudioSegment(
+        data=samples.tobytes(), sample_width=2, frame_rate=SAMPLE_RATE, channels=1
+    )
+    silence_thresh = sound.dBFS - 14
+
+    start = time.perf_counter()
+    reference = pydub_detect_nonsilent(sound, args.min_silence_len, silence_thresh, 1)
+    reference_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    vectorized = silence.detect_nonsilent(
+        samples, SAMPLE_RATE, args.min_silence_len, silence_thresh, 1
+    )
+    vectorized_time = time.perf_counter() - start
+
+    assert reference == vectorized, "Vectorized ranges differ from pydub"
+
+    print(f"audio: {args.minutes} min, {len(reference)} non-silent ranges")
+    print(f"pydub detect_nonsilent: {reference_time:.3f} s")
+    print(f"vectorized:             {vectorized_time:.3f} s")
+    print(f"speedup:                {reference_time / vectorized_time:.0f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,582 @@
+"""
+Offline benchmark of the whole get_all_articles pipeline.
+
+Nothing leaves the machine:
+
+- fixture videos (test pattern and gated tone or looped speech sample) are
+  generated with ffmpeg lavfi and served by a local HTTP server with Range
+  support; the YouTube metadata request in ML.video_info is replaced with a
+  fake that points the audio (url2pcm / url2audio) and frame extraction
+  streams to that server;
+- a local fake ChatCompletion server answers openai requests with
+  configurable latency and injected 429 rate limit errors.
+
+Each input runs in a fresh process with an empty result cache, so peak RSS
+and caches are per input. The report lists per-stage calls, wall time,
+CPU time (including ffmpeg children), peak RSS and request counts.
+
+    python -m benchmarks.pipeline --inputs short,medium --llm-latency 0.5 \\
+        --llm-rate-limit 0.1 --json bench.json
+
+Whisper is real: pick a small checkpoint with --whisper-model, and pass a
+speech recording with --speech to get meaningful transcripts (tones give
+near-empty ones).
+"""
+import argparse
+import functools
+import inspect
+import json
+import os
+import random
+import re
+import resource
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Длительность входов в секундах
+INPUTS = {"short": 60, "medium": 10 * 60, "long": 2 * 60 * 60}
+VIDEO_SIZE = "640x360"
+VIDEO_RATE = 25
+
+# Этапы конвейера: (этап, модуль, класс или None, функция)
+STAGES = [
+    ("total", "ML.main", None, "get_all_articles"),
+    ("transcript", "ML.main", None, "get_subtitles_for_yt"),
+    ("video_info", "ML.video_info", None, "extract_video_info"),
+    ("audio_decode", "ML.yt2t.main", "YT2T", "url2pcm"),
+    ("audio_download", "ML.yt2t.main", "YT2T", "url2audio"),
+    ("silence_split", "ML.yt2t.silence", None, "split_on_silence"),
+    ("whisper", "ML.yt2t.parallel", "ParallelTranscriber", "transcribe"),
+    ("normalize", "ML.main", None, "set_capital_and_remove_punctuation_marks"),
+    ("create_doc", "ML.main", None, "create_doc"),
+    ("annotation", "ML.main", None, "summarize_map_reduce"),
+    ("frames", "ML.media", "MediaContext", "get_keyframes"),
+    ("paragraphs", "ML.main", None, "form_paragraph_for_gen"),
+    ("rewrite", "ML.main", None, "rewrite_paragraphs"),
+]
+
+RANGE_HEADER = re.compile(r"bytes=(\d*)-(\d*)")
+
+
+class Counters:
+    """
+    Thread-safe request counters of a fake server
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.values = {}
+
+    def add(self, name: str, value: int = 1):
+        with self._lock:
+            self.values[name] = self.values.get(name, 0) + value
+
+    def reset(self) -> dict:
+        with self._lock:
+            values, self.values = self.values, {}
+        return values
+
+
+def make_fixture(path: str, seconds: int, speech: str = None):
+    """
+    mp4 with a test pattern video track and an audio track of speech-like
+    bursts separated by pauses (or a looped speech recording)
+    """
+    if os.path.exists(path):
+        return
+    video = f"testsrc2=size={VIDEO_SIZE}:rate={VIDEO_RATE}"
+    if speech is not None:
+        audio_input = ["-stream_loop", "-1", "-i", speech]
+    else:
+        # тон 2-6 с, пауза ~1.5 с: есть что делить по тишине
+        tone = "0.3*sin(2*PI*220*t)*sin(2*PI*3*t)*gt(sin(2*PI*t/7.3)+0.4,0)"
+        audio_input = ["-f", "lavfi", "-i", f"aevalsrc='{tone}':s=44100"]
+    command = [
+        "ffmpeg",
+        "-hide_banner",
+        "-loglevel",
+        "error",
+        "-f",
+        "lavfi",
+        "-i",
+        video,
+        *audio_input,
+        "-t",
+        str(seconds),
+        "-map",
+        "0:v",
+        "-map",
+        "1:a",
+        "-c:v",
+        "libx264",
+        "-preset",
+        "ultrafast",
+        "-g",
+        str(VIDEO_RATE * 2),
+        "-pix_fmt",
+        "yuv420p",
+        "-c:a",
+        "aac",
+        "-movflags",
+        "+faststart",
+        "-f",
+        "mp4",
+        path + ".part",
+    ]
+    subprocess.run(command, check=True)
+    os.replace(path + ".part", path)
+
+
+def media_handler(
+    root: str,
+    counters: Counters,
+    faults: float = 0.0,
+    rate: float = None,
+    seed: int = 0,
+):
+    """
+    Handler class serving root; faults - share of requests answered with 503
+    or cut in the middle of the body, rate - bytes per second per connection
+    """
+    rng = random.Random(seed)
+    rng_lock = threading.Lock()
+
+    class MediaHandler(BaseHTTPRequestHandler):
+        """
+        Static files of root with single Range requests, as a CDN serves
+        media to ffmpeg
+        """
+
+        def log_message(self, format, *args):
+            pass
+
+        def do_HEAD(self):
+            self.__serve(send_body=False)
+
+        def do_GET(self):
+            self.__serve(send_body=True)
+
+        def __serve(self, send_body):
+            path = os.path.join(root, os.path.basename(self.path.split("?")[0]))
+            if not os.path.isfile(path):
+                self.send_error(404)
+                return
+            with rng_lock:
+                fault = rng.choice(["503", "cut"]) if rng.random() < faults else None
+            if fault == "503":
+                counters.add("media_faults")
+                self.send_error(503)
+                return
+            size = os.path.getsize(path)
+            first, last = 0, size - 1
+
+            match = RANGE_HEADER.fullmatch(self.headers.get("Range", ""))
+            if match is not None and (match.group(1) or match.group(2)):
+                if match.group(1):
+                    first = int(match.group(1))
+                    if match.group(2):
+                        last = min(int(match.group(2)), size - 1)
+                else:
+                    first = max(size - int(match.group(2)), 0)
+                if first >= size:
+                    self.send_response(416)
+                    self.send_header("Content-Range", f"bytes */{size}")
+                    self.end_headers()
+                    return
+                self.send_response(206)
+                self.send_header("Content-Range", f"bytes {first}-{last}/{size}")
+            else:
+                self.send_response(200)
+            self.send_header("Accept-Ranges", "bytes")
+            self.send_header("Content-Type", "video/mp4")
+            self.send_header("Content-Length", str(last - first + 1))
+            self.end_headers()
+            counters.add("media_requests")
+            if not send_body:
+                return
+
+            remaining = last - first + 1
+            if fault == "cut":
+                counters.add("media_faults")
+                remaining //= 2
+            block_size = 1 << 20 if rate is None else max(int(rate) // 10, 1)
+            with open(path, "rb") as file:
+                file.seek(first)
+                try:
+                    while remaining > 0:
+                        block = file.read(min(remaining, block_size))
+                        if not block:
+                            break
+                        self.wfile.write(block)
+                        remaining -= len(block)
+                        counters.add("media_bytes", len(block))
+                        if rate is not None:
+                            time.sleep(len(block) / rate)
+                except (BrokenPipeError, ConnectionResetError):
+                    # ffmpeg закрывает соединение, прочитав нужное
+                    pass
+            if fault == "cut":
+                self.close_connection = True
+
+    return MediaHandler
+
+
+def llm_handler(latency: float, rate_limit: float, counters: Counters, seed: int):
+    rng = random.Random(seed)
+    lock = threading.Lock()
+
+    class ChatCompletionHandler(BaseHTTPRequestHandler):
+        """
+        /v1/chat/completions: answers with the first max_tokens / 2 words of
+        the prompt after latency seconds, or 429 with probability rate_limit
+        """
+
+        def log_message(self, format, *args):
+            pass
+
+        def do_POST(self):
+            body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+            counters.add("llm_requests")
+            with lock:
+                limited = rng.random() < rate_limit
+                delay = latency * rng.uniform(0.5, 1.5)
+            time.sleep(delay)
+
+            if limited:
+                counters.add("llm_rate_limited")
+                self.__reply(
+                    429,
+                    {
+                        "error": {
+                            "message": "Rate limit reached for requests",
+                            "type": "requests",
+                            "param": None,
+                            "code": "rate_limit_exceeded",
+                        }
+                    },
+                )
+                return
+
+            prompt = body["messages"][-1]["content"]
+            words = prompt.split()
+            content = " ".join(words[: max(body.get("max_tokens", 16) // 2, 1)])
+            usage = {
+                "prompt_tokens": len(words),
+                "completion_tokens": len(content.split()),
+                "total_tokens": len(words) + len(content.split()),
+            }
+            counters.add("llm_prompt_tokens", usage["prompt_tokens"])
+            counters.add("llm_completion_tokens", usage["completion_tokens"])
+            self.__reply(
+                200,
+                {
+                    "id": "chatcmpl-bench",
+                    "object": "chat.completion",
+                    "created": int(time.time()),
+                    "model": body.get("model"),
+                    "choices": [
+                        {
+                            "index": 0,
+                            "message": {"role": "assistant", "content": content},
+                            "finish_reason": "stop",
+                        }
+                    ],
+                    "usage": usage,
+                },
+            )
+
+        def __reply(self, status, payload):
+            data = json.dumps(payload).encode()
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+    return ChatCompletionHandler
+
+
+def start_server(handler) -> ThreadingHTTPServer:
+    server = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def usage_snapshot() -> dict:
+    own = resource.getrusage(resource.RUSAGE_SELF)
+    children = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return {
+        "cpu": own.ru_utime + own.ru_stime + children.ru_utime + children.ru_stime,
+        # ru_maxrss в КиБ (Linux)
+        "rss": own.ru_maxrss / 1024,
+        "children_rss": children.ru_maxrss / 1024,
+    }
+
+
+class StageTimer:
+    """
+    Wraps pipeline functions and accumulates inclusive wall and CPU time
+    per stage
+    """
+
+    def __init__(self):
+        self.stages = {}
+
+    def record(self, name, wall, before, after):
+        stage = self.stages.setdefault(
+            name, {"calls": 0, "wall": 0.0, "cpu": 0.0, "peak_rss": 0.0}
+        )
+        stage["calls"] += 1
+        stage["wall"] += wall
+        stage["cpu"] += after["cpu"] - before["cpu"]
+        stage["peak_rss"] = max(stage["peak_rss"], after["rss"], after["children_rss"])
+
+    def wrap(self, name, function):
+        timer = self
+
+        if inspect.iscoroutinefunction(function):
+
+            @functools.wraps(function)
+            async def wrapper(*args, **kwargs):
+                before, start = usage_snapshot(), time.perf_counter()
+                try:
+                    return await function(*args, **kwargs)
+                finally:
+                    wall = time.perf_counter() - start
+                    timer.record(name, wall, before, usage_snapshot())
+
+        else:
+
+            @functools.wraps(function)
+            def wrapper(*args, **kwargs):
+                before, start = usage_snapshot(), time.perf_counter()
+                try:
+                    return function(*args, **kwargs)
+                finally:
+                    wall = time.perf_counter() - start
+                    timer.record(name, wall, before, usage_snapshot())
+
+        return wrapper
+
+    def install(self):
+        import importlib
+
+        for name, module_name, class_name, attribute in STAGES:
+            owner = importlib.import_module(module_name)
+            if class_name is not None:
+                owner = getattr(owner, class_name)
+            setattr(owner, attribute, self.wrap(name, getattr(owner, attribute)))
+
+
+def fake_video_info(media_base: str, url: str) -> dict:
+    """
+    yt_dlp extract_info result for https://www.youtube.com/watch?v=bench-<input>
+    without captions, both streams point to the local media server
+    """
+    video_id = url.rsplit("bench-", 1)[-1]
+    stream_url = f"{media_base}/{video_id}.mp4"
+    return {
+        "id": f"bench-{video_id}",
+        "title": f"Benchmark {video_id}",
+        "subtitles": {},
+        "automatic_captions": {},
+        "formats": [
+            {
+                "url": stream_url,
+                "ext": "m4a",
+                "protocol": "https",
+                "vcodec": "none",
+                "acodec": "mp4a.40.2",
+                "abr": 64,
+            },
+            {
+                "url": stream_url,
+                "ext": "mp4",
+                "protocol": "https",
+                "vcodec": "avc1",
+                "acodec": "mp4a.40.2",
+                "quality": 1,
+            },
+        ],
+    }
+
+
+def install_fake_youtube(media_base: str):
+    import ML.video_info
+
+    ML.video_info.extract_video_info = functools.partial(fake_video_info, media_base)
+
+
+def run_one(args):
+    """
+    One input in this process; prints the JSON result as the last line
+    """
+    os.makedirs("data/docx_file", exist_ok=True)
+
+    import openai
+
+    import ML.main
+
+    openai.api_base = args.llm_base
+    openai.api_key = "bench"
+    install_fake_youtube(args.media_base)
+    timer = StageTimer()
+    timer.install()
+
+    error = None
+    try:
+        ML.main.get_all_articles(
+            f"https://www.youtube.com/watch?v=bench-{args.run_one}",
+            word_limit_annotation=args.annotation_words,
+            limit_article_length=args.article_words,
+        )
+    except Exception as e:
+        error = repr(e)
+
+    result = {"input": args.run_one, "stages": timer.stages, "error": error}
+    result.update(usage_snapshot())
+    print(json.dumps(result))
+
+
+def run_input(name, args, workdir, media_base, llm_base) -> dict:
+    env = dict(os.environ)
+    env["PYTHONPATH"] = os.pathsep.join(
+        filter(None, [REPO_ROOT, env.get("PYTHONPATH")])
+    )
+    env["CACHE_DIR"] = os.path.join(workdir, "cache")
+    env["API_KEY"] = "bench"
+    env["OPENAI_API_BASE"] = llm_base
+    env["WHISPER_MODEL"] = args.whisper_model
+
+    command = [
+        sys.executable,
+        "-m",
+        "benchmarks.pipeline",
+        "--run-one",
+        name,
+        "--media-base",
+        media_base,
+        "--llm-base",
+        llm_base,
+        "--annotation-words",
+        str(args.annotation_words),
+        "--article-words",
+        str(args.article_words),
+    ]
+    start = time.perf_counter()
+    process = subprocess.run(
+        command, cwd=workdir, env=env, stdout=subprocess.PIPE, text=True
+    )
+    wall = time.perf_counter() - start
+    lines = process.stdout.strip().splitlines()
+    if process.returncode != 0 or not lines:
+        return {"input": name, "error": f"exit code {process.returncode}"}
+    result = json.loads(lines[-1])
+    result["process_wall"] = wall
+    return result
+
+
+def print_report(result: dict, counters: dict):
+    print(f"\n== {result['input']} ({INPUTS[result['input']]} s of media)")
+    if result.get("error"):
+        print(f"error: {result['error']}")
+    stages = result.get("stages", {})
+    print(f"{'stage':16}{'calls':>7}{'wall s':>10}{'cpu s':>10}{'peak RSS MiB':>14}")
+    for name, *_ in STAGES:
+        if name not in stages:
+            continue
+        stage = stages[name]
+        print(
+            f"{name:16}{stage['calls']:>7}{stage['wall']:>10.2f}"
+            f"{stage['cpu']:>10.2f}{stage['peak_rss']:>14.0f}"
+        )
+    if "rss" in result:
+        print(
+            f"process peak RSS {result['rss']:.0f} MiB, "
+            f"children {result['children_rss']:.0f} MiB"
+        )
+    print(", ".join(f"{name}={value}" for name, value in sorted(counters.items())))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--inputs", default="short,medium", help="short,medium,long")
+    parser.add_argument("--fixtures", default=None, help="directory of fixture mp4")
+    parser.add_argument("--speech", default=None, help="speech recording to loop")
+    parser.add_argument("--whisper-model", default="tiny")
+    parser.add_argument("--llm-latency", type=float, default=0.2)
+    parser.add_argument("--llm-rate-limit", type=float, default=0.0)
+    parser.add_argument("--annotation-words", type=int, default=200)
+    parser.add_argument("--article-words", type=int, default=2000)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", default=None, help="save results to this file")
+    # запуск одного входа в дочернем процессе
+    parser.add_argument("--run-one", default=None, help=argparse.SUPPRESS)
+    parser.add_argument("--media-base", default=None, help=argparse.SUPPRESS)
+    parser.add_argument("--llm-base", default=None, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run_one is not None:
+        run_one(args)
+        return
+
+    names = [name for name in args.inputs.split(",") if name]
+    unknown = set(names) - set(INPUTS)
+    if unknown:
+        parser.error(f"unknown inputs: {', '.join(sorted(unknown))}")
+
+    fixtures = os.path.join(
+        args.fixtures or os.path.join(tempfile.gettempdir(), "yt2a-bench"),
+        "tone" if args.speech is None else "speech",
+    )
+    os.makedirs(fixtures, exist_ok=True)
+    for name in names:
+        path = os.path.join(fixtures, f"{name}.mp4")
+        print(f"fixture {path}", flush=True)
+        make_fixture(path, INPUTS[name], args.speech)
+
+    media_counters = Counters()
+    llm_counters = Counters()
+    media_server = start_server(media_handler(fixtures, media_counters))
+    llm_server = start_server(
+        llm_handler(args.llm_latency, args.llm_rate_limit, llm_counters, args.seed)
+    )
+    media_base = f"http://127.0.0.1:{media_server.server_address[1]}"
+    llm_base = f"http://127.0.0.1:{llm_server.server_address[1]}/v1"
+
+    results = []
+    try:
+        for name in names:
+            with tempfile.TemporaryDirectory(prefix=f"yt2a-bench-{name}-") as workdir:
+                result = run_input(name, args, workdir, media_base, llm_base)
+            counters = {**media_counters.reset(), **llm_counters.reset()}
+            result["requests"] = counters
+            print_report(result, counters)
+            results.append(result)
+    finally:
+        media_server.shutdown()
+        llm_server.shutdown()
+
+    if args.json is not None:
+        with open(args.json, "w") as file:
+            json.dump(
+                {
+                    "whisper_model": args.whisper_model,
+                    "llm_latency": args.llm_latency,
+                    "llm_rate_limit": args.llm_rate_limit,
+                    "results": results,
+                },
+                file,
+                indent=2,
+            )
+
+
+if __name__ == "__main__":
+    main()
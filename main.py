@@ -1,3 +1,4 @@
+import asyncio
 import os
 import re
 from enum import Enum
@@ -5,8 +6,13 @@ from urllib.parse import parse_qs, urlparse
 
 import dotenv
 from telegram import InputMediaDocument, Message, Update
-from telegram.ext import (Application, CommandHandler, ContextTypes,
-                          MessageHandler, filters)
+from telegram.ext import (
+    Application,
+    CommandHandler,
+    ContextTypes,
+    MessageHandler,
+    filters,
+)
 
 
 class State(Enum):
@@ -15,7 +21,16 @@ class State(Enum):
     wait_for_annotation_length = 2  # Пользователь не отправил
 
 
-from ML import get_all_articles
+from ML import (
+    JobPool,
+    JobQueueFullError,
+    default_num_workers,
+    find_cached_articles,
+    get_all_articles,
+    init_job_worker,
+    job_worker_initargs,
+    start_metrics_server,
+)
 
 
 async def start_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -117,24 +132,73 @@ async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
                 "Ваш запрос был принят. Ожидайте."
             )
 
-            video_url = f'https://www.youtube.com/watch?v={context.user_data.get("video_id", "")}'
-            name_of_doc, name_of_gen_doc, annotation = get_all_articles(
-                video_url,
-                word_limit_annotation=context.user_data.get(
-                    "annotation_length", 150000
+            context.user_data["state"] = State.wait_for_youtube_link
+
+            # Статьи готовятся в пуле процессов, обработчик сразу освобождает бота
+            context.application.create_task(
+                send_articles(
+                    update,
+                    context,
+                    msg,
+                    context.user_data.get("video_id", ""),
+                    word_limit_annotation=context.user_data.get(
+                        "annotation_length", 150000
+                    ),
+                    limit_article_length=context.user_data.get(
+                        "article_length", 150000
+                    ),
                 ),
-                limit_article_length=context.user_data.get("article_length", 150000),
+                update=update,
             )
-            await msg.delete()
-            media_group = []
-            media_group.append(
-                InputMediaDocument(
-                    open(name_of_doc, "rb"), caption="Краткий пересказ:\n" + annotation
-                )
+
+
+async def send_articles(
+    update: Update,
+    context: ContextTypes.DEFAULT_TYPE,
+    msg: Message,
+    video_id: str,
+    word_limit_annotation: int,
+    limit_article_length: int,
+):
+    job_pool: JobPool = context.application.bot_data["job_pool"]
+    video_url = f"https://www.youtube.com/watch?v={video_id}"
+    try:
+        # Готовые статьи отправляются из кэша без очереди заданий
+        articles = await asyncio.to_thread(
+            find_cached_articles,
+            video_url,
+            word_limit_annotation=word_limit_annotation,
+            limit_article_length=limit_article_length,
+        )
+        if articles is None:
+            # Одновременные запросы одного видео выполняются одним заданием
+            articles = await job_pool.run_coalesced(
+                video_id,
+                get_all_articles,
+                video_url,
+                word_limit_annotation=word_limit_annotation,
+                limit_article_length=limit_article_length,
             )
-            media_group.append(InputMediaDocument(open(name_of_gen_doc, "rb")))
+    except JobQueueFullError:
+        await msg.delete()
+        await update.message.reply_text(
+            "Сервис перегружен запросами. Пожалуйста, повторите запрос через некоторое время."
+        )
+        return
+    name_of_doc, name_of_gen_doc, annotation = articles
+    await msg.delete()
+    try:
+        with open(name_of_doc, "rb") as doc, open(name_of_gen_doc, "rb") as gen_doc:
+            media_group = [
+                InputMediaDocument(doc, caption="Краткий пересказ:\n" + annotation),
+                InputMediaDocument(gen_doc),
+            ]
             await update.message.reply_media_group(media_group)
-            context.user_data["state"] = State.wait_for_youtube_link
+    except OSError as e:
+        print(f"Не удалось открыть статьи {video_id}: {e}")
+        await update.message.reply_text(
+            "Не удалось отправить статьи. Пожалуйста, повторите запрос."
+        )
 
 
 async def error(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -144,11 +208,37 @@ async def error(update: Update, context: ContextTypes.DEFAULT_TYPE):
     print(f"При обновлении {update} произошла ошибка: {context.error}")
 
 
+async def start_job_pool(application: Application):
+    # Ядра делятся между процессами пула, ограничитель запросов OpenAI
+    # общий, модель Whisper загружается в процессе при первом распознавании.
+    # Пул, перезапущенный после падения процесса, получает новую очередь
+    # срезов ядер и прежний ограничитель
+    num_workers = default_num_workers()
+    _, rate_limit_state = job_worker_initargs(num_workers)
+    job_pool = JobPool(
+        num_workers,
+        initializer=init_job_worker,
+        initargs=lambda: job_worker_initargs(num_workers, rate_limit_state),
+    )
+    job_pool.start()
+    application.bot_data["job_pool"] = job_pool
+
+
+async def stop_job_pool(application: Application):
+    application.bot_data["job_pool"].shutdown(wait=False)
+
+
 if __name__ == "__main__":
     dotenv.load_dotenv(".env")
     BOT_TOKEN = os.environ.get("BOT_TOKEN")
     BOT_USERNAME = os.environ.get("BOT_USERNAME")
-    app = Application.builder().token(BOT_TOKEN).build()
+    app = (
+        Application.builder()
+        .token(BOT_TOKEN)
+        .post_init(start_job_pool)
+        .post_shutdown(stop_job_pool)
+        .build()
+    )
 
     # Commands
     app.add_handler(CommandHandler("start", start_command))
@@ -160,5 +250,10 @@ if __name__ == "__main__":
     # Errors
     app.add_error_handler(error)
 
+    # Метрики Prometheus рядом с ботом, METRICS_PORT=0 отключает
+    metrics_port = int(os.environ.get("METRICS_PORT", "9108"))
+    if metrics_port > 0:
+        start_metrics_server(metrics_port, os.environ.get("METRICS_HOST", "127.0.0.1"))
+
     print("Загрузка...")
     app.run_polling(poll_interval=3)
@@ -0,0 +1,21 @@
+"""
+Tests of the result cache (ML.cache.ResultCache)
+"""
+from ML.cache import ResultCache
+
+
+def test_file_copy_outlives_evicted_entry(tmp_path):
+    cache = ResultCache(root=str(tmp_path / "cache"), max_bytes=10**6)
+    (tmp_path / "article.docx").write_bytes(b"docx")
+    cache.put_file("docx", "key", str(tmp_path / "article.docx"))
+    output = tmp_path / "output"
+    output.mkdir()
+
+    path = cache.get_file("docx", "key", str(output))
+    assert path == str(output / "article.docx")
+    # запись удалена другим процессом до отправки документа
+    cache.max_bytes = 0
+    cache.evict()
+    assert cache.get_file("docx", "key", str(output)) is None
+    with open(path, "rb") as f:
+        assert f.read() == b"docx"
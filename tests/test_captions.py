@@ -0,0 +1,43 @@
+"""
+Tests of caption track selection (ML.captions.select_caption)
+"""
+from ML.captions import select_caption
+from ML.video_info import CaptionTrack
+
+
+def tracks(*codes) -> dict:
+    return {
+        code: CaptionTrack(code, code, f"https://captions/{code}") for code in codes
+    }
+
+
+def code(caption):
+    return None if caption is None else caption.code
+
+
+def test_manual_track_in_video_language():
+    captions = tracks("de", "en", "en-GB", "a.en")
+    assert code(select_caption(captions, "en-US", "manual")) == "en"
+    assert code(select_caption(captions, "ru-RU", "manual")) is None
+
+
+def test_declared_language_wins_over_detected():
+    captions = tracks("de", "en")
+    assert code(select_caption(captions, "ru-RU", "manual", original_lang="de")) == "de"
+
+
+def test_unknown_language_falls_back_to_auto_caption_language():
+    # язык не определён по названию: язык речи - язык автоматических субтитров
+    captions = tracks("de", "en", "a.en")
+    assert code(select_caption(captions, None, "manual")) == "en"
+    assert code(select_caption(tracks("de", "a.en"), None, "auto")) == "a.en"
+
+
+def test_unknown_language_uses_no_track_in_another_language():
+    assert select_caption(tracks("de"), None, "manual") is None
+    assert select_caption(tracks("de", "fr"), None, "auto") is None
+    assert select_caption(tracks("de", "a.en"), None, "manual") is None
+
+
+def test_whisper_policy_never_selects():
+    assert select_caption(tracks("en"), "en-US", "whisper") is None
@@ -0,0 +1,204 @@
+"""
+Tests of ML.yt2t.download.RangeDownloader against a local HTTP server
+serving a random fixture file with Range requests and injected faults
+"""
+import os
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from ML.yt2t.download import DownloadError, RangeDownloader, evict_downloads
+
+SEGMENT_SIZE = 256 * 1024
+
+
+@pytest.fixture
+def fixture_file(tmp_path):
+    data = os.urandom(8 * SEGMENT_SIZE + 12345)
+    (tmp_path / "fixture.bin").write_bytes(data)
+    return data
+
+
+RANGE_HEADER = re.compile(r"bytes=(\d*)-(\d*)")
+
+
+class Counters:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.values = {}
+
+    def add(self, name: str, value: int = 1):
+        with self._lock:
+            self.values[name] = self.values.get(name, 0) + value
+
+    def reset(self) -> dict:
+        with self._lock:
+            values, self.values = self.values, {}
+        return values
+
+
+def range_handler(root: str, counters: Counters, faults: float, seed: int):
+    """
+    Handler class serving files of root with single Range requests; faults -
+    share of requests answered with 503 or cut in the middle of the body
+    """
+    rng = random.Random(seed)
+    rng_lock = threading.Lock()
+
+    class RangeHandler(BaseHTTPRequestHandler):
+        def log_message(self, format, *args):
+            pass
+
+        def do_HEAD(self):
+            self.__serve(send_body=False)
+
+        def do_GET(self):
+            self.__serve(send_body=True)
+
+        def __serve(self, send_body):
+            path = os.path.join(root, os.path.basename(self.path))
+            with rng_lock:
+                fault = rng.choice(["503", "cut"]) if rng.random() < faults else None
+            if fault == "503":
+                counters.add("media_faults")
+                self.send_error(503)
+                return
+            size = os.path.getsize(path)
+            first, last = 0, size - 1
+            match = RANGE_HEADER.fullmatch(self.headers.get("Range", ""))
+            if match is not None and match.group(1):
+                first = int(match.group(1))
+                if match.group(2):
+                    last = min(int(match.group(2)), size - 1)
+                self.send_response(206)
+                self.send_header("Content-Range", f"bytes {first}-{last}/{size}")
+            else:
+                self.send_response(200)
+            self.send_header("Accept-Ranges", "bytes")
+            self.send_header("Content-Length", str(last - first + 1))
+            self.end_headers()
+            counters.add("media_requests")
+            if not send_body:
+                return
+
+            length = last - first + 1
+            if fault == "cut":
+                counters.add("media_faults")
+                length //= 2
+                self.close_connection = True
+            with open(path, "rb") as f:
+                f.seek(first)
+                block = f.read(length)
+            try:
+                self.wfile.write(block)
+                counters.add("media_bytes", len(block))
+            except (BrokenPipeError, ConnectionResetError):
+                pass
+
+    return RangeHandler
+
+
+@pytest.fixture
+def serve(tmp_path):
+    """
+    serve(faults=0.0, seed=0) -> (url of the fixture, counters)
+    """
+    servers = []
+
+    def serve(faults: float = 0.0, seed: int = 0):
+        counters = Counters()
+        server = ThreadingHTTPServer(
+            ("127.0.0.1", 0), range_handler(str(tmp_path), counters, faults, seed)
+        )
+        server.daemon_threads = True
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        servers.append(server)
+        return f"http://127.0.0.1:{server.server_address[1]}/fixture.bin", counters
+
+    yield serve
+    for server in servers:
+        server.shutdown()
+        server.server_close()
+
+
+def downloader(**kwargs) -> RangeDownloader:
+    downloader = RangeDownloader(segmentsize=SEGMENT_SIZE, **kwargs)
+    # паузы между повторами не нужны локальному серверу
+    downloader.backoff_base = 0.01
+    return downloader
+
+
+def test_parallel_download_is_exact(tmp_path, fixture_file, serve):
+    url, counters = serve()
+    out = str(tmp_path / "out")
+
+    assert downloader(connections=4).download(url, out) == out
+    assert (tmp_path / "out").read_bytes() == fixture_file
+    assert not os.path.exists(out + ".part")
+    assert not os.path.exists(out + ".state")
+    # проба размера и по запросу на часть
+    assert counters.reset()["media_requests"] == 1 + 9
+
+
+def test_existing_file_is_not_downloaded(tmp_path, fixture_file, serve):
+    url, counters = serve()
+    (tmp_path / "out").write_bytes(b"done")
+
+    downloader().download(url, str(tmp_path / "out"))
+    assert (tmp_path / "out").read_bytes() == b"done"
+    assert counters.reset() == {}
+
+
+def test_faults_are_retried(tmp_path, fixture_file, serve):
+    # 503 и соединения, оборванные посреди ответа
+    url, counters = serve(faults=0.3, seed=1)
+    out = str(tmp_path / "out")
+
+    downloader(maxattempts=20).download(url, out)
+    assert (tmp_path / "out").read_bytes() == fixture_file
+    assert counters.reset()["media_faults"] > 0
+
+
+def test_failed_download_is_resumed(tmp_path, fixture_file, serve):
+    url, _ = serve(faults=0.5, seed=2)
+    out = str(tmp_path / "out")
+    with pytest.raises(DownloadError):
+        downloader(maxattempts=1).download(url, out)
+    assert os.path.exists(out + ".state"), "failed download left no state"
+    assert not os.path.exists(out)
+
+    url, counters = serve()
+    downloader().download(url, out)
+    assert (tmp_path / "out").read_bytes() == fixture_file
+    assert not os.path.exists(out + ".state")
+    assert counters.reset()["media_bytes"] < len(
+        fixture_file
+    ), "resume downloaded everything"
+
+
+def test_evict_downloads(tmp_path):
+    now = time.time()
+
+    def download(name, size, age):
+        for suffix in (".part", ".state"):
+            path = tmp_path / (name + suffix)
+            path.write_bytes(b"x" * (size if suffix == ".part" else 10))
+            os.utime(path, (now - age, now - age))
+
+    download("stale", 100, age=2 * 24 * 3600)
+    download("old", 400, age=3 * 3600)
+    download("recent", 400, age=2 * 3600)
+    download("active", 400, age=10)
+
+    evict_downloads(str(tmp_path), max_bytes=900, ttl=24 * 3600)
+    # устаревшая и наиболее давняя загрузки удалены, выполняющаяся не тронута
+    assert sorted(os.listdir(tmp_path)) == [
+        "active.part",
+        "active.state",
+        "recent.part",
+        "recent.state",
+    ]
@@ -0,0 +1,98 @@
+"""
+Tests of keyframe extraction (ML.frames) with a fake ffmpeg on PATH that
+prints showinfo / metadata lines and writes slide-like jpeg frames
+"""
+import os
+import signal
+import stat
+import subprocess
+import sys
+
+import pytest
+
+from ML.frames import extract_keyframes, iter_keyframes
+
+FAKE_FFMPEG = """\
+#!{python}
+import io, random, sys, time
+from PIL import Image, ImageDraw
+
+# кадры: номер слайда каждого выбранного кадра
+SLIDES = [0, 0, 1, 1, 1, 2, 3, 3]
+for n, index in enumerate(SLIDES):
+    rng = random.Random(index)
+    img = Image.new("RGB", (640, 360), (250, 250, 245))
+    draw = ImageDraw.Draw(img)
+    draw.rectangle((0, 0, 640, 50), fill=tuple(rng.randrange(256) for _ in "rgb"))
+    for line in range(rng.randint(4, 9)):
+        y, x = 70 + line * 30, 30 + rng.randint(0, 60)
+        draw.rectangle((x, y, x + rng.randint(150, 560), y + 14), fill=(40, 40, 40))
+    x, y = rng.randint(40, 440), rng.randint(80, 240)
+    draw.ellipse((x, y, x + 150, y + 100), outline=(200, 30, 30), width=5)
+    out = io.BytesIO()
+    img.save(out, "JPEG", quality=80)
+    score = 0.9 if n == 0 or SLIDES[n - 1] != index else 0.35
+    sys.stderr.write(f"[Parsed_metadata_2 @ 0x1] frame:{{n}} pts:{{n}} pts_time:{{n * 2.5}}\\n")
+    sys.stderr.write(f"[Parsed_metadata_2 @ 0x1] lavfi.scene_score={{score}}\\n")
+    sys.stderr.write(f"[Parsed_showinfo_4 @ 0x2] n:{{n}} pts:{{n}} pts_time:{{n * 2.5}} duration:1\\n")
+    sys.stderr.flush()
+    sys.stdout.buffer.write(out.getvalue())
+    sys.stdout.flush()
+if "{mode}" == "fail":
+    sys.stderr.write("Error opening input: Server returned 403 Forbidden\\n")
+    sys.exit(1)
+if "{mode}" == "hang":
+    # длинное видео: ffmpeg продолжает работу после отданных кадров
+    time.sleep(60)
+"""
+
+
+@pytest.fixture
+def fake_ffmpeg(tmp_path, monkeypatch):
+    def install(mode: str = "ok"):
+        path = tmp_path / "ffmpeg"
+        path.write_text(FAKE_FFMPEG.format(python=sys.executable, mode=mode))
+        path.chmod(path.stat().st_mode | stat.S_IEXEC)
+        monkeypatch.setenv("PATH", f"{tmp_path}{os.pathsep}{os.environ['PATH']}")
+
+    return install
+
+
+def test_frames_are_streamed_with_times_and_scores(fake_ffmpeg):
+    fake_ffmpeg()
+    frames = list(iter_keyframes("https://video"))
+    assert [t for t, _, _ in frames] == [n * 2.5 for n in range(8)]
+    assert [score for _, score, _ in frames][:3] == [0.9, 0.35, 0.9]
+    assert all(image.startswith(b"\xff\xd8") for _, _, image in frames)
+
+
+def test_extract_keeps_one_frame_per_slide(fake_ffmpeg):
+    fake_ffmpeg()
+    kept = extract_keyframes("https://video", max_images=10, distance=20)
+    assert [t for t, _ in kept] == [0.0, 5.0, 12.5, 15.0]
+
+
+def test_failed_ffmpeg_raises_with_log(fake_ffmpeg, caplog):
+    fake_ffmpeg("fail")
+    with pytest.raises(subprocess.CalledProcessError) as error:
+        list(iter_keyframes("https://video"))
+    assert error.value.returncode == 1
+    assert "403 Forbidden" in error.value.stderr
+    assert "403 Forbidden" in caplog.text
+
+
+def test_stopped_consumer_stops_ffmpeg(fake_ffmpeg, monkeypatch):
+    fake_ffmpeg("hang")
+    processes = []
+    popen = subprocess.Popen
+
+    def record_popen(*args, **kwargs):
+        processes.append(popen(*args, **kwargs))
+        return processes[-1]
+
+    monkeypatch.setattr(subprocess, "Popen", record_popen)
+    frames = iter_keyframes("https://video")
+    next(frames)
+    assert processes[0].poll() is None
+    frames.close()
+    assert processes[0].poll() == -signal.SIGKILL
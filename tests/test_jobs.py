@@ -0,0 +1,42 @@
+"""
+Tests of the job process pool (ML.jobs.JobPool)
+"""
+import asyncio
+import os
+from concurrent.futures.process import BrokenProcessPool
+
+import pytest
+
+from ML.jobs import JobPool, init_job_worker, job_worker_initargs
+
+
+def worker_pid() -> int:
+    return os.getpid()
+
+
+def die():
+    # как процесс, убитый при нехватке памяти
+    os._exit(137)
+
+
+def test_pool_is_restarted_after_worker_death():
+    num_workers = 2
+    pool = JobPool(
+        num_workers,
+        initializer=init_job_worker,
+        initargs=lambda: job_worker_initargs(num_workers),
+    )
+
+    async def run():
+        first = await pool.run(worker_pid)
+        with pytest.raises(BrokenProcessPool):
+            await pool.run(die)
+        # новые процессы инициализируются новой очередью срезов ядер
+        second = await asyncio.wait_for(pool.run(worker_pid), timeout=60)
+        assert second != first
+        assert await asyncio.wait_for(pool.run(worker_pid), timeout=60) > 0
+
+    try:
+        asyncio.run(run())
+    finally:
+        pool.shutdown()
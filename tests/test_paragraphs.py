@@ -0,0 +1,103 @@
+"""
+Regression tests of the transcript merge stages: merge_rows and the
+token-budget form_paragraph_for_gen against golden outputs of the former
+DataFrame implementations on recorded transcripts.
+
+fixtures/merge_golden.json was produced by merge_rows of the baseline
+(9683a4b) and by form_paragraph_for_gen as of ee9b6d5 (token budget, before
+the column-list rewrite), with the cl100k_base tokenizer.
+"""
+import json
+import os
+
+import pytest
+
+from ML.captions import parse_subtitles
+from ML.llm import count_tokens
+from ML.main import form_paragraph_for_gen
+from ML.yt2t import Transcript
+from ML.yt2t.main import merge_rows
+
+FIXTURES = os.path.join(os.path.dirname(__file__), "fixtures")
+RECORDED = ["lecture_ru.srt", "talk_en.srt", "synthetic_0"]
+
+with open(os.path.join(FIXTURES, "merge_golden.json"), encoding="utf-8") as f:
+    GOLDEN = json.load(f)
+
+
+def recorded(name: str) -> Transcript:
+    if name == "synthetic_0":
+        # строки длиной 1-15 слов с пунктуацией Whisper
+        path = os.path.join(FIXTURES, "synthetic_transcript.json")
+        with open(path, encoding="utf-8") as f:
+            return Transcript(*zip(*json.load(f)))
+    with open(os.path.join(FIXTURES, name), encoding="utf-8") as f:
+        return parse_subtitles(f.read())
+
+
+def rows(transcript: Transcript) -> list:
+    return [
+        [segment.text, segment.start_time, segment.end_time] for segment in transcript
+    ]
+
+
+def paragraphs_of(transcript: Transcript, token_budget: int) -> Transcript:
+    original = transcript[:]
+    paragraphs = form_paragraph_for_gen(transcript, token_budget)
+    assert transcript == original, "form_paragraph_for_gen changed its input"
+    return paragraphs
+
+
+@pytest.mark.parametrize("name", RECORDED)
+def test_merge_rows_matches_former(name):
+    assert rows(merge_rows(recorded(name))) == GOLDEN["merged"][name]
+
+
+@pytest.mark.parametrize(
+    "name, token_budget",
+    [
+        (name, int(token_budget))
+        for name, budgets in GOLDEN["paragraphs"].items()
+        for token_budget in budgets
+    ],
+)
+def test_paragraphs_match_former(name, token_budget):
+    paragraphs = paragraphs_of(merge_rows(recorded(name)), token_budget)
+    assert rows(paragraphs) == GOLDEN["paragraphs"][name][str(token_budget)]
+
+
+def test_empty_transcript():
+    # прежние реализации падали на пустом транскрипте
+    assert merge_rows(Transcript()) == Transcript()
+    assert form_paragraph_for_gen(Transcript(), 100) == Transcript()
+
+
+def test_single_row_over_budget():
+    text = recorded("lecture_ru.srt").texts[0].replace("..", ".") * 5
+    transcript = Transcript([text], [1000], [9000])
+    assert count_tokens(text) > 10
+
+    paragraphs = paragraphs_of(transcript, 10)
+    assert paragraphs == transcript
+
+
+def test_budget_boundary():
+    first = "Первое предложение параграфа."
+    second = "Second sentence of the paragraph."
+    transcript = Transcript([first, second], [0, 2000], [1500, 4000])
+    first_tokens = count_tokens(first)
+    both_tokens = first_tokens + count_tokens(second)
+
+    # параграф, набравший ровно бюджет, закрывается
+    paragraphs = paragraphs_of(transcript, first_tokens)
+    assert paragraphs.texts == [first, second]
+
+    # оба предложения ровно укладываются в бюджет
+    paragraphs = paragraphs_of(transcript, both_tokens)
+    assert paragraphs.texts == [f"{first} {second}"]
+    assert (paragraphs.starts[0], paragraphs.ends[0]) == (0, 4000)
+
+    # на токен меньше - второе предложение начинает новый параграф
+    paragraphs = paragraphs_of(transcript, both_tokens - 1)
+    assert paragraphs.texts == [first, second]
+    assert list(paragraphs.starts) == [0, 2000]
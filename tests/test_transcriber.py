@@ -0,0 +1,64 @@
+"""
+Tests of batched whisper decoding (ML.yt2t.transcriber.BatchTranscriber)
+with a fake whisper module
+"""
+import sys
+import types
+
+import numpy as np
+import pytest
+
+from ML.yt2t.transcriber import SAMPLE_RATE, BatchTranscriber
+
+torch = pytest.importorskip("torch")
+
+
+class FakeModel:
+    device = torch.device("cpu")
+    dims = types.SimpleNamespace(n_mels=80)
+
+    def transcribe(self, audio, **options):
+        return {"text": "transcribed one by one"}
+
+
+def decoding_result(text, avg_logprob=-0.2, no_speech_prob=0.01, compression=1.5):
+    return types.SimpleNamespace(
+        text=text,
+        avg_logprob=avg_logprob,
+        no_speech_prob=no_speech_prob,
+        compression_ratio=compression,
+    )
+
+
+@pytest.fixture
+def fake_whisper(monkeypatch):
+    """
+    fake_whisper(results) - whisper.decode returns results for a batch
+    """
+
+    def install(results):
+        whisper = types.ModuleType("whisper")
+        whisper.audio = types.SimpleNamespace(N_SAMPLES=30 * SAMPLE_RATE)
+        whisper.DecodingOptions = lambda **options: options
+        whisper.pad_or_trim = lambda audio: audio
+        whisper.log_mel_spectrogram = lambda audio, n_mels: torch.zeros(n_mels, 10)
+        whisper.decode = lambda model, mel, options: results[: len(mel)]
+        monkeypatch.setitem(sys.modules, "whisper", whisper)
+
+    return install
+
+
+def test_silent_chunk_is_empty(fake_whisper):
+    fake_whisper(
+        [
+            decoding_result("Hello."),
+            # тишина: модель уверена, что речи нет, и выдумывает текст
+            decoding_result("Thanks for watching!", -1.3, no_speech_prob=0.9),
+            # неуверенное распознавание речи
+            decoding_result("mumble", -1.3, no_speech_prob=0.2),
+        ]
+    )
+    chunks = [np.zeros(SAMPLE_RATE, dtype=np.int16) for _ in range(3)]
+
+    texts = BatchTranscriber(FakeModel(), batch_size=3).transcribe(chunks)
+    assert texts == ["Hello.", "", "transcribed one by one"]
@@ -0,0 +1,39 @@
+"""
+Tests of stream selection from yt_dlp formats (ML.video_info)
+"""
+from ML.video_info import _video_url
+
+
+def video(width: int, vcodec: str = "avc1.4d401f", protocol: str = "https") -> dict:
+    return {
+        "url": f"https://video/{width}/{vcodec.split('.')[0]}",
+        "protocol": protocol,
+        "width": width,
+        "vcodec": vcodec,
+        "acodec": "none",
+    }
+
+
+FORMATS = [
+    {"url": "https://audio", "vcodec": "none", "acodec": "opus", "abr": 50},
+    video(640),
+    video(1280, "av01.0.05M.08"),
+    video(1280),
+    video(1920),
+    video(3840, "av01.0.12M.08"),
+    video(960, protocol="m3u8_native"),
+]
+
+
+def test_smallest_stream_covering_image_width():
+    assert _video_url(FORMATS, min_width=960) == "https://video/1280/avc1"
+    assert _video_url(FORMATS, min_width=640) == "https://video/640/avc1"
+
+
+def test_widest_stream_when_none_covers_image_width():
+    assert _video_url(FORMATS[:3], min_width=1920) == "https://video/1280/av01"
+    assert _video_url(FORMATS, min_width=7680) == "https://video/3840/av01"
+
+
+def test_no_video_stream():
+    assert _video_url(FORMATS[:1], min_width=640) is None
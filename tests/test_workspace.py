@@ -0,0 +1,60 @@
+"""
+Tests of job workspaces (ML.workspace.Workspace)
+"""
+import os
+import subprocess
+import sys
+
+from ML.workspace import OWNER_FILE, Workspace
+
+
+def owned_dir(root, name: str, owner: str, size: int = 0) -> str:
+    path = os.path.join(root, name)
+    os.makedirs(path)
+    with open(os.path.join(path, OWNER_FILE), "w") as f:
+        f.write(owner)
+    with open(os.path.join(path, "data"), "wb") as f:
+        f.write(b"x" * size)
+    return path
+
+
+def dead_pid() -> int:
+    process = subprocess.Popen([sys.executable, "-c", "pass"])
+    process.wait()
+    return process.pid
+
+
+def test_dead_owner_is_removed_live_owner_is_kept(tmp_path):
+    root = str(tmp_path)
+    dead = owned_dir(root, "dead", str(dead_pid()))
+    # pid живого процесса, но другое время запуска: pid занят другим процессом
+    reused = owned_dir(root, "reused", f"{os.getpid()} 1")
+    # живое задание больше лимита не удаляется
+    live = Workspace("live", root=root, max_bytes=10)
+    with open(live.file("data"), "wb") as f:
+        f.write(b"x" * 100)
+
+    with Workspace("next", root=root, max_bytes=10) as workspace:
+        assert not os.path.exists(dead)
+        assert os.path.exists(live.path)
+        if os.path.exists(f"/proc/{os.getpid()}/stat"):
+            assert not os.path.exists(reused)
+    assert not os.path.exists(workspace.path)
+    live.cleanup()
+
+
+def test_disk_workspace_is_separate_and_cleaned(tmp_path, monkeypatch):
+    disk_root = str(tmp_path / "disk")
+    monkeypatch.setenv("WORKSPACE_DIR", disk_root)
+
+    with Workspace("job", root=str(tmp_path / "tmpfs")) as workspace:
+        disk = workspace.disk()
+        assert disk is workspace.disk()
+        assert os.path.dirname(disk.path) == disk_root
+        spill = disk.file("yt2t", "audio", "a.pcm")
+        assert os.path.isdir(os.path.dirname(spill))
+    assert not os.path.exists(workspace.path)
+    assert not os.path.exists(disk.path)
+
+    with Workspace("job", root=disk_root) as workspace:
+        assert workspace.disk() is workspace